@@ -0,0 +1,183 @@
+'''
+Local snapshot cache of the ISE Session/ActiveList
+A snapshot holds a prebuilt user_name -> calling_station_id index so
+finding the MACs of a user is a dictionary lookup. Snapshots are written to
+disk as zlib compressed JSON and shared by every run in the working
+directory. Once a snapshot is older than the TTL it is still served while
+a single refresh runs in the background, and a lock file makes sure
+concurrent runs never download the ActiveList at the same time
+'''
+
+import os
+import sys
+import time
+import fcntl
+import asyncio
+import macaddress
+from atomic_file import pack_json, unpack_json, write_atomic
+
+SNAPSHOT_VERSION = 2
+
+
+def normalise_mac(value: str) -> str:
+    """Function to put MACs in one format so lookups match however they were written"""
+
+    try:
+        return str(macaddress.MAC(value)).replace("-", ":")
+
+    except ValueError:
+        return value
+
+
+class ActiveListSnapshot:
+    """Indexed view of a single ActiveList download"""
+
+    def __init__(self, fetched: float, users: dict):
+        self.fetched = fetched
+        self.users = users
+
+    @classmethod
+    def from_sessions(cls, sessions: list, fetched: float = None):
+        """Function to index a list of ActiveSession records"""
+
+        users = {}
+
+        for active_session in sessions:
+            station_id = active_session.calling_station_id
+
+            if active_session.user_name is None or station_id is None:
+                continue
+
+            users.setdefault(active_session.user_name, []).append(station_id)
+
+        return cls(time.time() if fetched is None else fetched, users)
+
+    def age(self) -> float:
+        """Function to return how many seconds old the snapshot is"""
+
+        return time.time() - self.fetched
+
+    def macs_for_user(self, sso: str) -> list:
+        """Function to return every calling_station_id seen for a user"""
+
+        return list(self.users.get(sso, []))
+
+    def dump(self) -> bytes:
+        """Function to serialise the snapshot for the on-disk cache"""
+
+        return pack_json(SNAPSHOT_VERSION, {"fetched": self.fetched, "users": self.users})
+
+    @classmethod
+    def load(cls, raw: bytes):
+        """Function to rebuild a snapshot from the on-disk cache, None if unusable"""
+
+        data = unpack_json(raw, SNAPSHOT_VERSION)
+
+        if data is None:
+            return None
+
+        return cls(data["fetched"], data["users"])
+
+
+class ActiveListCache:
+    """
+    TTL cache of ActiveList snapshots. fetch is a coroutine function that
+    downloads the ActiveList and returns its ActiveSession records.
+    """
+
+    def __init__(self, path: str, ttl: float, fetch):
+        self.path = path
+        self.ttl = ttl
+        self.fetch = fetch
+        self.lock_path = f"{path}.lock"
+        self._snapshot = None
+        self._refreshing = None
+
+    async def get(self) -> ActiveListSnapshot:
+        """
+        Function to return the current snapshot. A missing snapshot is
+        fetched before returning, an expired one is returned as is while
+        a refresh is started in the background
+        """
+
+        if self._snapshot is None:
+            self._snapshot = self._read()
+
+        if self._snapshot is None:
+            return await self.refresh()
+
+        if self._snapshot.age() > self.ttl and (self._refreshing is None or self._refreshing.done()):
+            # A failed background refresh is reported and the stale snapshot kept
+            self.refresh().add_done_callback(self._report)
+
+        return self._snapshot
+
+    def peek(self):
+        """
+        Function to return the snapshot on disk if it is within the TTL,
+        None otherwise. Never downloads the ActiveList
+        """
+
+        snapshot = self._read()
+
+        if snapshot is None or snapshot.age() > self.ttl:
+            return None
+
+        self._snapshot = snapshot
+
+        return snapshot
+
+    def refresh(self) -> asyncio.Task:
+        """Function to start a refresh, or return the one already running"""
+
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._refresh())
+
+        return self._refreshing
+
+    async def wait(self) -> None:
+        """Function to let a background refresh finish before the run exits, without raising its error"""
+
+        if self._refreshing is not None:
+            await asyncio.gather(self._refreshing, return_exceptions=True)
+
+    def _report(self, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is None:
+            return
+
+        print(f"Could not refresh the active sessions, using the snapshot from "
+              f"{self._snapshot.age():.0f} s ago: {task.exception()}", file=sys.stderr)
+
+    async def _refresh(self) -> ActiveListSnapshot:
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        try:
+            # Blocks while another run holds the lock, done off the loop
+            await asyncio.to_thread(fcntl.flock, lock_fd, fcntl.LOCK_EX)
+
+            # Whoever held the lock may have just written a fresh snapshot
+            snapshot = self._read()
+
+            if snapshot is None or snapshot.age() > self.ttl:
+                sessions = await self.fetch()
+                snapshot = ActiveListSnapshot.from_sessions(sessions)
+                self._write(snapshot)
+
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+        self._snapshot = snapshot
+
+        return snapshot
+
+    def _read(self):
+        try:
+            with open(self.path, "rb") as cache_file:
+                return ActiveListSnapshot.load(cache_file.read())
+
+        except FileNotFoundError:
+            return None
+
+    def _write(self, snapshot: ActiveListSnapshot) -> None:
+        write_atomic(self.path, snapshot.dump())
@@ -0,0 +1,219 @@
+'''
+Columnar analytics over ISE auth records
+Auth records are loaded into one typed array per column rather than an
+object per record: timestamps as doubles, the failed flag as bytes, and
+identity group, authorisation policy, failure id, user and MAC as small
+integer codes into a table of their distinct values (interned
+categoricals). Group-by counts, time bucketed histograms and percentiles
+then run over whole columns at once, with NumPy when it is installed and
+with the C implemented Counter, compress and sort otherwise, so millions
+of records summarise in seconds
+'''
+
+import math
+from array import array
+from collections import Counter
+from itertools import compress, islice
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+## Categorical columns, each held as codes into a table of distinct values
+CATEGORICAL = ("identity_group", "authorisation_policy", "failure_id", "user_name", "mac")
+
+# Rows transposed into the columns at a time by append_rows()
+LOAD_BATCH = 65536
+
+# Bucket size of histogram() in seconds
+HOUR = 3600
+
+# Percentiles reported by summary()
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+class Interner:
+    """Table of the distinct values of a column, handing out an integer code per value"""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value) -> int:
+        """Function to return the code of a value, adding it if it is new"""
+
+        code = self.codes.get(value)
+
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+
+        return code
+
+
+class AuthColumns:
+    """Class holding auth records column by column"""
+
+    def __init__(self):
+        self.ts = array("d")
+        self.failed = array("b")
+        self.codes = {column: array("i") for column in CATEGORICAL}
+        self.tables = {column: Interner() for column in CATEGORICAL}
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def append_rows(self, rows) -> int:
+        """
+        Function to append (ts, failed, identity group, authorisation policy,
+        failure id, user, MAC) rows, returns how many were added
+        """
+
+        rows = iter(rows)
+        added = 0
+
+        while True:
+            batch = list(islice(rows, LOAD_BATCH))
+
+            if not batch:
+                return added
+
+            ts, failed, *categories = zip(*batch)
+
+            self.ts.extend(ts)
+            self.failed.extend(map(bool, failed))
+
+            for column, values in zip(CATEGORICAL, categories):
+                table = self.tables[column]
+
+                # Intern each distinct value once, in order of appearance, then
+                # look every row's code up in C
+                for value in dict.fromkeys(values):
+                    table.code(value)
+
+                self.codes[column].extend(map(table.codes.__getitem__, values))
+
+            added += len(batch)
+
+    def load_store(self, store, since: float = None, until: float = None) -> int:
+        """Function to append the auth records in an AuthStore between since and until"""
+
+        return self.append_rows(store.scan_auth(since, until))
+
+    def group_counts(self, column: str, failures_only: bool = True, top: int = None) -> list:
+        """
+        Function to count records (or failed records) per value of a
+        categorical column, most first and ties in order of appearance
+        """
+
+        codes = self.codes[column]
+        values = self.tables[column].values
+
+        if numpy is not None:
+            code_view = numpy.frombuffer(codes, dtype=numpy.int32)
+
+            if failures_only:
+                code_view = code_view[numpy.frombuffer(self.failed, dtype=numpy.int8) == 1]
+
+            counts = numpy.bincount(code_view, minlength=len(values))
+            order = numpy.argsort(-counts, kind="stable")
+
+            ranked = [(values[code], int(counts[code])) for code in order if counts[code]]
+
+        else:
+            selected = compress(codes, self.failed) if failures_only else codes
+            counts = sorted(Counter(selected).items(), key=lambda item: (-item[1], item[0]))
+
+            ranked = [(values[code], count) for code, count in counts]
+
+        return ranked[:top] if top else ranked
+
+    def histogram(self, bucket: float = HOUR) -> list:
+        """Function to count records and failed records per time bucket, as (bucket start, records, failures)"""
+
+        if not self.ts:
+            return []
+
+        if numpy is not None:
+            ts_view = numpy.frombuffer(self.ts, dtype=numpy.float64)
+            slots = (ts_view // bucket).astype(numpy.int64)
+            first = int(slots.min())
+            slots -= first
+
+            totals = numpy.bincount(slots)
+            failures = numpy.bincount(slots, weights=numpy.frombuffer(self.failed, dtype=numpy.int8),
+                                      minlength=len(totals))
+
+            return [((first + slot) * bucket, int(totals[slot]), int(failures[slot]))
+                    for slot in numpy.flatnonzero(totals)]
+
+        divide = float(bucket).__rfloordiv__
+        slots = array("q", map(int, map(divide, self.ts)))
+        totals = Counter(slots)
+        failures = Counter(compress(slots, self.failed))
+
+        return [(slot * bucket, totals[slot], failures[slot]) for slot in sorted(totals)]
+
+    def failures_per(self, column: str) -> array:
+        """Function to return the failed record count of every value of a column that has failures"""
+
+        if numpy is not None:
+            code_view = numpy.frombuffer(self.codes[column], dtype=numpy.int32)
+            counts = numpy.bincount(code_view[numpy.frombuffer(self.failed, dtype=numpy.int8) == 1])
+
+            return array("q", counts[counts > 0].tolist())
+
+        return array("q", Counter(compress(self.codes[column], self.failed)).values())
+
+    def summary(self, top: int = 10, bucket: float = HOUR) -> dict:
+        """Function to summarise the records as a JSON shaped dict"""
+
+        failed = sum(self.failed)
+
+        summary = {
+            "records": len(self),
+            "failures": failed,
+            "engine": "numpy" if numpy is not None else "array",
+            "hours": [
+                {"start": start, "records": records, "failures": failures,
+                 "failure_rate": failures / records if records else 0.0}
+                for start, records, failures in self.histogram(bucket)
+            ]
+        }
+
+        for column in CATEGORICAL:
+            summary[column] = [{"name": name, "failures": count}
+                               for name, count in self.group_counts(column, top=top)]
+
+        for column in ("user_name", "mac"):
+            summary[f"failures_per_{column}"] = dict(zip(
+                (f"p{round(fraction * 100)}" for fraction in PERCENTILES),
+                percentiles(self.failures_per(column), PERCENTILES)
+            ))
+
+        return summary
+
+
+def nearest_rank(fraction: float, count: int) -> int:
+    """Function to return the index of the nearest rank percentile in count sorted values"""
+
+    # Rounded first so float noise (0.07 * 100 is 7.000000000000001) can't push it up a rank
+    return max(0, math.ceil(round(fraction * count, 9)) - 1)
+
+
+def percentiles(values, fractions: tuple) -> list:
+    """Function to return the nearest rank percentiles of values, 0 for each if there are none"""
+
+    if len(values) == 0:
+        return [0 for _ in fractions]
+
+    if numpy is not None:
+        ordered = numpy.sort(numpy.asarray(values))
+        return [ordered[nearest_rank(fraction, len(ordered))].item() for fraction in fractions]
+
+    ordered = sorted(values)
+
+    return [ordered[nearest_rank(fraction, len(ordered))] for fraction in fractions]
@@ -0,0 +1,51 @@
+'''
+Files shared between runs, written so readers never see half of one
+write_atomic writes to a temporary file next to the target and renames
+it over the target, which is atomic on POSIX file systems. The caches
+kept as zlib compressed JSON (ActiveList snapshot, AuthStatus history)
+are packed and unpacked with a version number here as well, so a file
+written by an older layout is ignored rather than misread
+'''
+
+import os
+import json
+import zlib
+
+
+def write_atomic(path: str, data: bytes, mode: int = 0o600) -> None:
+    """Function to replace the file at path with data in one step, created with the given permissions"""
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(data)
+
+    except OSError:
+        os.unlink(temp_path)
+        raise
+
+    os.replace(temp_path, path)
+
+
+def pack_json(version: int, data: dict) -> bytes:
+    """Function to serialise data as zlib compressed JSON tagged with version"""
+
+    return zlib.compress(json.dumps({"version": version, **data}, separators=(",", ":")).encode(), 1)
+
+
+def unpack_json(raw: bytes, version: int):
+    """Function to read data written by pack_json, None if it is unreadable or another version"""
+
+    try:
+        data = json.loads(zlib.decompress(raw))
+
+    except (zlib.error, ValueError):
+        return None
+
+    if not isinstance(data, dict) or data.get("version") != version:
+        return None
+
+    return data
@@ -0,0 +1,142 @@
+'''
+Local per-MAC history of ISE AuthStatus records
+Remembers the records already downloaded for each MAC and the newest
+acs_timestamp among them, so the next lookup only has to ask
+AuthStatus/MACAddress for the time elapsed since then instead of the
+whole window. New records are merged into the history, records that have
+fallen out of the window are dropped. Kept on disk as zlib compressed
+JSON so repeat runs (and watch mode) share it
+'''
+
+import time
+from dataclasses import astuple
+from datetime import datetime
+from records import AuthStatusElement
+from active_cache import normalise_mac
+from atomic_file import pack_json, unpack_json, write_atomic
+
+HISTORY_VERSION = 1
+
+# Extra seconds asked for on top of the elapsed time, covers clock skew
+# between ISE and this host and records MnT writes a little late
+WINDOW_OVERLAP = 120
+
+## Position of acs_timestamp in a stored row
+ACS_TIMESTAMP = AuthStatusElement.__slots__.index("acs_timestamp")
+
+
+def timestamp_seconds(acs_timestamp: str):
+    """Function to turn an acs_timestamp into epoch seconds, None if it can't be read"""
+
+    if not acs_timestamp:
+        return None
+
+    try:
+        return datetime.fromisoformat(acs_timestamp).timestamp()
+
+    except ValueError:
+        return None
+
+
+class AuthHistory:
+    """
+    Class holding the AuthStatus records seen for each MAC. window is how
+    many seconds of records are kept, max_records caps the records kept
+    per MAC (0 for no cap).
+    """
+
+    def __init__(self, path: str, window: int, max_records: int = 0):
+        self.path = path
+        self.window = window
+        self.max_records = max_records
+        self.macs = {}
+
+    def load(self) -> int:
+        """Function to read the history from disk, returns the MACs it holds"""
+
+        try:
+            with open(self.path, "rb") as history_file:
+                data = unpack_json(history_file.read(), HISTORY_VERSION)
+
+        except FileNotFoundError:
+            return 0
+
+        # Records are stored as rows, only reuse them if the fields still line up
+        if data is None or data.get("fields") != list(AuthStatusElement.__slots__):
+            return 0
+
+        self.macs = data["macs"]
+
+        return len(self.macs)
+
+    def save(self) -> None:
+        """Function to write the history to disk"""
+
+        write_atomic(self.path, pack_json(HISTORY_VERSION, {
+            "fields": list(AuthStatusElement.__slots__),
+            "macs": self.macs
+        }))
+
+    def window_for(self, mac: str) -> int:
+        """Function to return how many seconds of records to ask ISE for"""
+
+        held = self.macs.get(normalise_mac(mac))
+
+        if held is None:
+            return self.window
+
+        # Without any record yet, nothing happened before the last download
+        since = held["newest"] or held["fetched"]
+
+        elapsed = int(time.time() - since) + WINDOW_OVERLAP
+
+        return max(1, min(self.window, elapsed))
+
+    def merge(self, mac: str, found: list) -> list:
+        """
+        Function to add newly downloaded records for a MAC, returns every
+        record held for it within the window, newest first
+        """
+
+        key = normalise_mac(mac)
+        held = self.macs.get(key, {"newest": None, "fetched": None, "records": []})
+
+        now = time.time()
+        oldest = now - self.window
+
+        # The overlap downloads some records again, keep one copy of each
+        seen = set()
+        rows = []
+
+        for row in [list(astuple(element)) for element in found] + held["records"]:
+            row_key = tuple(row)
+
+            if row_key in seen:
+                continue
+
+            seen.add(row_key)
+
+            stamp = timestamp_seconds(row[ACS_TIMESTAMP])
+
+            if stamp is not None and stamp < oldest:
+                continue
+
+            rows.append((stamp or 0, row))
+
+        rows.sort(key=lambda pair: pair[0], reverse=True)
+
+        if self.max_records > 0:
+            rows = rows[:self.max_records]
+
+        stamps = [stamp for stamp, _ in rows if stamp]
+
+        newest = max(stamps, default=None)
+
+        # A MAC that went quiet keeps its newest timestamp, the next window
+        # still only has to cover the time since then
+        if newest is None:
+            newest = held["newest"]
+
+        self.macs[key] = {"newest": newest, "fetched": now, "records": [row for _, row in rows]}
+
+        return [AuthStatusElement(*row) for _, row in rows]
@@ -0,0 +1,384 @@
+'''
+Local store of every ISE auth record and DNAC issue looked up
+MnT only answers for the last day or so, and asking it again for every
+historical question is slow and loads the appliance. Each auth record
+and DNAC issue a lookup decodes is appended to a SQLite database instead,
+indexed by MAC, username, time and failure id, so questions such as
+"every failure for user X in the last 7 days" are answered locally. MACs
+are kept in one format (active_cache.normalise_mac) whichever of ISE or
+DNAC reported them, and queries are matched the same way.
+Lookups only queue their rows, which are written in batches by the
+store's own writer thread, so the event loop never waits on SQLite's lock
+while another process writes. Records seen again by later lookups are
+ignored, and compact() deletes whatever is older than the retention period
+'''
+
+import time
+import asyncio
+import sqlite3
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from auth_history import timestamp_seconds
+from failure_catalog import failure_id
+from ise_parser import matched_policies
+from active_cache import normalise_mac
+
+STORE_VERSION = 2
+
+# Days of records kept by compact()
+RETENTION_DAYS = 90
+
+# Seconds between the compactions a lookup runs on its way out
+COMPACT_EVERY = 86400
+
+# Seconds a write waits for another process holding the database
+BUSY_TIMEOUT = 5
+
+# Rows queued by lookups before write() writes them in one transaction
+WRITE_BATCH = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS auth_events(
+    digest INTEGER NOT NULL, mac TEXT NOT NULL, user_name TEXT, ts REAL NOT NULL, acs_timestamp TEXT,
+    authentication_method TEXT, posture_status TEXT, identity_group TEXT, nac_compliance TEXT,
+    authorisation_policy TEXT, authentication_policy TEXT, failed INTEGER NOT NULL,
+    failure_id INTEGER, failure_reason TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS auth_events_digest ON auth_events(digest);
+CREATE INDEX IF NOT EXISTS auth_events_mac ON auth_events(mac, ts);
+CREATE INDEX IF NOT EXISTS auth_events_user ON auth_events(user_name, ts);
+CREATE INDEX IF NOT EXISTS auth_events_ts ON auth_events(ts);
+CREATE INDEX IF NOT EXISTS auth_events_failure ON auth_events(failure_id, ts) WHERE failure_id IS NOT NULL;
+CREATE TABLE IF NOT EXISTS dnac_issues(
+    digest INTEGER NOT NULL, mac TEXT NOT NULL, ts REAL NOT NULL, issue_id TEXT, name TEXT,
+    priority TEXT, category TEXT, status TEXT, occurrence_count INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS dnac_issues_digest ON dnac_issues(digest);
+CREATE INDEX IF NOT EXISTS dnac_issues_mac ON dnac_issues(mac, ts);
+CREATE INDEX IF NOT EXISTS dnac_issues_ts ON dnac_issues(ts);
+"""
+
+## Columns returned by query_auth, in order
+AUTH_COLUMNS = ("ts", "acs_timestamp", "mac", "user_name", "authentication_method", "posture_status",
+                "identity_group", "nac_compliance", "authorisation_policy", "authentication_policy",
+                "failed", "failure_id", "failure_reason")
+
+## Columns returned by query_issues, in order
+ISSUE_COLUMNS = ("ts", "mac", "issue_id", "name", "priority", "category", "status", "occurrence_count")
+
+
+def digest(*values) -> int:
+    """Function to return a stable signed 64 bit identity for a record"""
+
+    content = "\x1f".join("" if value is None else str(value) for value in values)
+
+    return int.from_bytes(hashlib.blake2b(content.encode(), digest_size=8).digest(), "little", signed=True)
+
+
+class AuthStore:
+    """Class appending lookups to the store at path and answering queries from it"""
+
+    def __init__(self, path: str, retention_days: float = RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        self._conn = None
+        self._queued = []
+        self._queued_rows = 0
+        self._writer = None
+        self._writing = None
+
+    def open(self) -> None:
+        """Function to open the database, creating the tables on first use"""
+
+        if self._conn is not None:
+            return
+
+        # Opened by whichever thread uses it first, async callers only use it from the writer
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+
+        version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+
+        if version is None:
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('version', ?)", (str(STORE_VERSION),))
+
+        elif int(version[0]) == 1:
+            self._normalise_macs(conn)
+
+        elif int(version[0]) != STORE_VERSION:
+            conn.close()
+            raise sqlite3.DatabaseError(f"{self.path} is a version {version[0]} store, expected {STORE_VERSION}")
+
+        self._conn = conn
+
+    def _normalise_macs(self, conn: sqlite3.Connection) -> None:
+        # Version 1 stored MACs as ISE or DNAC wrote them. Digests stay as
+        # they are, they are taken over the MAC as reported
+        conn.create_function("normalise_mac", 1, normalise_mac, deterministic=True)
+
+        conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            conn.execute("UPDATE auth_events SET mac = normalise_mac(mac)")
+            conn.execute("UPDATE dnac_issues SET mac = normalise_mac(mac)")
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (str(STORE_VERSION),))
+
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            conn.close()
+            raise
+
+        conn.execute("COMMIT")
+
+    def close(self) -> None:
+        """Function to write whatever is still queued and close the database"""
+
+        if self._queued:
+            self.flush()
+
+        if self._writer is not None:
+            self._writer.shutdown()
+            self._writer = None
+
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def run(self, function, *args):
+        """Function to call a store method in the writer thread, so the event loop keeps going while it waits"""
+
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(1, thread_name_prefix="auth_store")
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self._writer, function, *args)
+
+    async def write(self, force: bool = False) -> int:
+        """
+        Function to write the queued rows in the writer thread, returns how
+        many were new. Unless forced, nothing is written until WRITE_BATCH
+        rows are queued, or while an earlier batch is still being written
+        """
+
+        if not self._queued:
+            return 0
+
+        busy = self._writing is not None and not self._writing.done()
+
+        if not force and (busy or self._queued_rows < WRITE_BATCH):
+            return 0
+
+        batch = self._take()
+
+        self._writing = asyncio.ensure_future(self.run(self._write, batch))
+
+        return await self._writing
+
+    def flush(self) -> int:
+        """Function to write the queued rows from the calling thread, returns how many were new"""
+
+        return self._write(self._take())
+
+    def add_auth(self, mac: str, elements: list) -> None:
+        """Function to queue the AuthStatusElements of a MAC to be appended"""
+
+        seen = time.time()
+        stored_mac = normalise_mac(mac)
+        rows = []
+
+        for element in elements:
+            found_id = failure_id(element.failure_reason) if element.failure_reason else None
+            risation_policy, tication_policy = matched_policies(element.other_attr_string)
+
+            rows.append((
+                digest(mac, element.acs_timestamp, element.user_name, element.authentication_method,
+                       element.posture_status, element.failed, element.failure_reason, element.other_attr_string),
+                stored_mac, element.user_name, timestamp_seconds(element.acs_timestamp) or seen, element.acs_timestamp,
+                element.authentication_method, element.posture_status, element.identity_group,
+                element.nac_policy_compliance, risation_policy, tication_policy,
+                int(bool(element.failed)), found_id, element.failure_reason
+            ))
+
+        self._queue("INSERT OR IGNORE INTO auth_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def add_issues(self, mac: str, issues) -> None:
+        """Function to queue the ClientIssues of a MAC to be appended"""
+
+        seen = time.time()
+        stored_mac = normalise_mac(mac)
+        rows = []
+
+        for issue in issues.issues or ():
+            ts = issue.last_occurrence_time / 1000 if issue.last_occurrence_time else seen
+
+            rows.append((
+                digest(mac, issue.issue_id, issue.last_occurrence_time), stored_mac, ts, issue.issue_id, issue.name,
+                issue.priority, issue.category, issue.status, issue.occurrence_count
+            ))
+
+        self._queue("INSERT OR IGNORE INTO dnac_issues VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def query_auth(self, user_name: str = None, mac: str = None, found_id: int = None, since: float = None,
+                   failures_only: bool = False, limit: int = None) -> list:
+        """Function to return auth records as dicts keyed by AUTH_COLUMNS, newest first"""
+
+        conditions = []
+        params = []
+
+        if user_name is not None:
+            conditions.append("user_name = ?")
+            params.append(user_name)
+
+        if mac is not None:
+            conditions.append("mac = ?")
+            params.append(normalise_mac(mac))
+
+        if found_id is not None:
+            conditions.append("failure_id = ?")
+            params.append(found_id)
+
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(since)
+
+        if failures_only:
+            conditions.append("failed = 1")
+
+        return self._select("auth_events", AUTH_COLUMNS, conditions, params, limit)
+
+    def scan_auth(self, since: float = None, until: float = None):
+        """
+        Function to iterate over (ts, failed, identity group, authorisation
+        policy, failure id, user, MAC) of the auth records between since and
+        until, in storage order, for bulk loading
+        """
+
+        self.open()
+
+        conditions = []
+        params = []
+
+        # A bulk load reads most of the table, which a plain scan does in
+        # storage order twice as fast as hopping through the ts index
+        if since is not None:
+            conditions.append("+ts >= ?")
+            params.append(since)
+
+        if until is not None:
+            conditions.append("+ts < ?")
+            params.append(until)
+
+        statement = ("SELECT ts, failed, identity_group, authorisation_policy, failure_id, user_name, mac "
+                     "FROM auth_events")
+
+        if conditions:
+            statement += " WHERE " + " AND ".join(conditions)
+
+        return self._conn.execute(statement, params)
+
+    def query_issues(self, mac: str = None, since: float = None, limit: int = None) -> list:
+        """Function to return DNAC issues as dicts keyed by ISSUE_COLUMNS, newest first"""
+
+        conditions = []
+        params = []
+
+        if mac is not None:
+            conditions.append("mac = ?")
+            params.append(normalise_mac(mac))
+
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(since)
+
+        return self._select("dnac_issues", ISSUE_COLUMNS, conditions, params, limit)
+
+    def compact(self, force: bool = False) -> int:
+        """
+        Function to delete records older than the retention period, at most
+        once every COMPACT_EVERY seconds unless forced. Returns the rows deleted
+        """
+
+        self.open()
+
+        now = time.time()
+
+        last = self._conn.execute("SELECT value FROM meta WHERE key = 'compacted'").fetchone()
+
+        if not force and last is not None and now - float(last[0]) < COMPACT_EVERY:
+            return 0
+
+        cutoff = now - self.retention_days * 86400
+
+        self._conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            deleted = self._conn.execute("DELETE FROM auth_events WHERE ts < ?", (cutoff,)).rowcount
+            deleted += self._conn.execute("DELETE FROM dnac_issues WHERE ts < ?", (cutoff,)).rowcount
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('compacted', ?)", (str(now),))
+
+        except sqlite3.Error:
+            self._conn.execute("ROLLBACK")
+            raise
+
+        self._conn.execute("COMMIT")
+
+        # Hand the freed pages back to the file system once it is worth it
+        if force and deleted:
+            self._conn.execute("VACUUM")
+
+        return deleted
+
+    def _queue(self, statement: str, rows: list) -> None:
+        if rows:
+            self._queued.append((statement, rows))
+            self._queued_rows += len(rows)
+
+    def _take(self) -> list:
+        # Taken on the caller's thread, rows queued meanwhile wait for the next batch
+        batch = self._queued
+        self._queued = []
+        self._queued_rows = 0
+
+        return batch
+
+    def _write(self, batch: list) -> int:
+        if not batch:
+            return 0
+
+        self.open()
+
+        before = self._conn.total_changes
+
+        self._conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            for statement, rows in batch:
+                self._conn.executemany(statement, rows)
+
+        except sqlite3.Error:
+            self._conn.execute("ROLLBACK")
+            raise
+
+        self._conn.execute("COMMIT")
+
+        return self._conn.total_changes - before
+
+    def _select(self, table: str, columns: tuple, conditions: list, params: list, limit: int) -> list:
+        self.open()
+
+        statement = f"SELECT {', '.join(columns)} FROM {table}"
+
+        if conditions:
+            statement += " WHERE " + " AND ".join(conditions)
+
+        statement += " ORDER BY ts DESC"
+
+        if limit:
+            statement += " LIMIT ?"
+            params = params + [limit]
+
+        return [dict(zip(columns, row)) for row in self._conn.execute(statement, params)]
@@ -0,0 +1,271 @@
+'''
+End to end benchmark of main.py against benchmarks/mock_server.py
+For every scale a mock deployment with that many active sessions is
+started in its own process, a scratch working directory is given an
+env_config.txt pointing at it and a failure_db built by construct_db.py,
+then main() looks a batch of users up in a child process (--no-cache,
+NDJSON output). Reports wall time, peak RSS of the child, requests per
+second served by the mock and the latency of each phase of the lookup
+Run from the repository root:
+python3 -m benchmarks.end_to_end [--scales 1000,10000,100000,500000] [--users 50] [--latency 20]
+'''
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import urllib.request
+from dataclasses import replace
+from cryptography.fernet import Fernet
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SCALES = "1000,10000,100000,500000"
+
+# Seconds to wait for a mock deployment to build its payloads and listen
+STARTUP_TIMEOUT = 300
+
+# Methods timed in the child, as (phase, module attribute, method)
+PHASES = [
+    ("active list", "IseApiController", "get_active_sessions"),
+    ("ise sessions", "IseApiController", "find_user_sessions"),
+    ("ise auth", "IseApiController", "get_session_info"),
+    ("dnac token", "DnaApiController", "get_token"),
+    ("dnac user", "DnaApiController", "client_details"),
+    ("dnac health", "DnaApiController", "client_health"),
+    ("dnac issues", "DnaApiController", "client_issues"),
+    ("user", None, "gather_user")
+]
+
+
+def free_port() -> int:
+    """Function to return a TCP port nothing is listening on"""
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def percentile(timings: list, fraction: float) -> float:
+    """Function to return a percentile of a sorted list of timings"""
+
+    if not timings:
+        return 0.0
+
+    return timings[min(len(timings) - 1, int(fraction * len(timings)))]
+
+
+def mock_stats(port: int):
+    """Function to read the counters of a mock deployment, None if it isn't up"""
+
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/_mock/stats", timeout=5) as response:
+            return json.loads(response.read())
+
+    except OSError:
+        return None
+
+
+def write_environment(workdir: str, ise_port: int, dnac_port: int) -> None:
+    """Function to write the mykey.key and env_config.txt builder.py would"""
+
+    key = Fernet.generate_key()
+
+    with open(os.path.join(workdir, "mykey.key"), "wb") as key_file:
+        key_file.write(key)
+
+    config = [f"http://127.0.0.1:{ise_port}", "bench", "bench", f"http://127.0.0.1:{dnac_port}", "bench", "bench"]
+
+    with open(os.path.join(workdir, "env_config.txt"), "wb") as config_file:
+        config_file.write(Fernet(key).encrypt(str(config).encode()))
+
+
+def run_scale(sessions: int, args: argparse.Namespace) -> dict:
+    """Function to benchmark main() against a mock deployment with the given sessions"""
+
+    ise_port = free_port()
+    dnac_port = free_port()
+
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_server", "--port", str(ise_port), "--dnac-port", str(dnac_port),
+         "--sessions", str(sessions), "--users", str(max(args.users, sessions // 4)),
+         "--auth-records", str(args.auth_records), "--latency", str(args.latency),
+         "--error-rate", str(args.error_rate)],
+        cwd=REPO_ROOT
+    )
+
+    try:
+        deadline = time.time() + STARTUP_TIMEOUT
+
+        while mock_stats(ise_port) is None:
+            if mock.poll() is not None or time.time() > deadline:
+                raise RuntimeError(f"mock deployment with {sessions} sessions did not start")
+
+            time.sleep(0.2)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            write_environment(workdir, ise_port, dnac_port)
+
+            subprocess.run([sys.executable, os.path.join(REPO_ROOT, "construct_db.py")], cwd=workdir,
+                           check=True, stdout=subprocess.DEVNULL)
+
+            users_path = os.path.join(workdir, "users.txt")
+
+            with open(users_path, "w") as users_file:
+                users_file.write("\n".join(f"user{i}" for i in range(args.users)))
+
+            before = mock_stats(ise_port)
+
+            child = [sys.executable, "-m", "benchmarks.end_to_end", "--child", workdir, users_path]
+
+            if args.keep_rate_limit:
+                child.append("--keep-rate-limit")
+
+            completed = subprocess.run(child, cwd=REPO_ROOT, check=True, capture_output=True, text=True)
+
+            after = mock_stats(ise_port)
+
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    result = json.loads(completed.stdout.splitlines()[-1])
+
+    served = sum(after["requests"].values()) - sum(before["requests"].values())
+
+    result["sessions"] = sessions
+    result["requests"] = served
+    result["requests_per_second"] = served / result["wall"]
+
+    return result
+
+
+def run_child(workdir: str, users_path: str, keep_rate_limit: bool) -> None:
+    """Function to run main() in workdir with timing wrappers and print the measurements as JSON"""
+
+    real_stdout = sys.stdout
+
+    # main.py reads its configuration from the working directory on import
+    os.chdir(workdir)
+
+    import main as tool
+
+    timings = {phase: [] for phase, _, _ in PHASES}
+
+    def timed(phase: str, func):
+        async def wrapper(*call_args, **call_kwargs):
+            start = time.perf_counter()
+
+            try:
+                return await func(*call_args, **call_kwargs)
+
+            finally:
+                timings[phase].append(time.perf_counter() - start)
+
+        return wrapper
+
+    for phase, owner_name, method in PHASES:
+        owner = tool if owner_name is None else getattr(tool, owner_name)
+        setattr(owner, method, timed(phase, getattr(owner, method)))
+
+    # The mock has no rate limit, by default measure the tool rather than
+    # the DNAC rate limit policy
+    if not keep_rate_limit:
+        tool.BACKEND_POLICIES = {host: replace(policy, rate=None) for host, policy in tool.BACKEND_POLICIES.items()}
+
+    sys.argv = ["main.py", "--batch", users_path, "--no-cache", "--output", "ndjson"]
+
+    real_stderr = sys.stderr
+
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        sys.stderr = devnull
+
+        try:
+            start = time.perf_counter()
+            asyncio.run(tool.main())
+            wall = time.perf_counter() - start
+
+        finally:
+            sys.stdout = real_stdout
+            sys.stderr = real_stderr
+
+    phases = {}
+
+    for phase, found in timings.items():
+        found.sort()
+        phases[phase] = {
+            "calls": len(found),
+            "p50": percentile(found, 0.5),
+            "p95": percentile(found, 0.95),
+            "max": found[-1] if found else 0.0
+        }
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    print(json.dumps({"wall": wall, "peak_rss": peak_rss, "phases": phases}))
+
+
+def report(results: list) -> None:
+    """Function to print the measurements of every scale"""
+
+    print(f"{'sessions':>9}{'wall s':>9}{'peak RSS MB':>13}{'requests':>10}{'req/s':>9}")
+
+    for result in results:
+        print(f"{result['sessions']:>9}{result['wall']:>9.2f}{result['peak_rss'] / 1e6:>13.1f}"
+              f"{result['requests']:>10}{result['requests_per_second']:>9.1f}")
+
+    print()
+    print(f"{'sessions':>9}  {'phase':<14}{'calls':>7}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+
+    for result in results:
+        for phase, timing in result["phases"].items():
+            if timing["calls"] == 0:
+                continue
+
+            print(f"{result['sessions']:>9}  {phase:<14}{timing['calls']:>7}{timing['p50'] * 1000:>9.1f}"
+                  f"{timing['p95'] * 1000:>9.1f}{timing['max'] * 1000:>9.1f}")
+
+
+def parse_args() -> argparse.Namespace:
+    """Function to parse the command line arguments"""
+
+    parser = argparse.ArgumentParser(description="End to end benchmark of main.py against a mock ISE and DNAC")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help=f"active session counts (default {DEFAULT_SCALES})")
+    parser.add_argument("--users", type=int, default=50, help="users looked up per run")
+    parser.add_argument("--auth-records", type=int, default=20, help="AuthStatus records per MAC")
+    parser.add_argument("--latency", type=float, default=20, help="mean milliseconds per mock request")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of lookups answered 503")
+    parser.add_argument("--keep-rate-limit", action="store_true", help="keep the DNAC rate limit from main.py")
+    parser.add_argument("--child", nargs=2, metavar=("WORKDIR", "USERS"), help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+
+def main():
+    """main func"""
+
+    args = parse_args()
+
+    if args.child is not None:
+        run_child(*args.child, args.keep_rate_limit)
+        return
+
+    results = []
+
+    for sessions in (int(scale) for scale in args.scales.split(",")):
+        print(f"Running {sessions} sessions...", file=sys.stderr)
+        results.append(run_scale(sessions, args))
+
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
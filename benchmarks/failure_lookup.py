@@ -0,0 +1,114 @@
+'''
+Benchmark of the cost per failed auth record of looking up its code,
+cause and resolution. Compares the old per-record path (new SQLite
+connection, f-string query against the unindexed failures table) with
+the FailureCatalog, both read into memory from failure_db and mapped
+from a compiled snapshot
+Run from the repository root:
+python3 -m benchmarks.failure_lookup [catalog size] [records]
+'''
+
+import os
+import re
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+from failure_catalog import FailureCatalog, write_snapshot
+
+
+def build_db(db_path: str, size: int) -> list:
+    """Function to build a failures table shaped like the one construct_db.py creates"""
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE failures(id integer NOT NULL, code text DEFAULT 'empty', cause text DEFAULT 'empty', resolution text DEFAULT 'empty')")
+
+    ids = [10000 + i * 7 for i in range(size)]
+
+    conn.executemany("INSERT INTO failures(id,code,cause,resolution) VALUES (?, ?, ?, ?)",
+                     [(i, f"{i} Synthetic failure", "Synthetic cause", "Synthetic resolution") for i in ids])
+    conn.commit()
+    conn.close()
+
+    return ids
+
+
+def time_catalog(catalog: FailureCatalog, reasons: list) -> tuple:
+    """Function to time loading a catalog and looking every reason up in it"""
+
+    start = time.perf_counter()
+    catalog.load()
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for reason in reasons:
+        catalog.lookup(reason)
+    per_record = (time.perf_counter() - start) / len(reasons)
+
+    catalog.close()
+
+    return load_time, per_record
+
+
+def legacy_lookup(db_path: str, failure_reason: str) -> list:
+    """The per-record lookup get_session_info used to do"""
+
+    failure_list = []
+
+    find_id = r'^(\d{5,6})'
+
+    failure_id = str(re.findall(find_id, failure_reason)).strip("[").strip("]").strip("'")
+
+    conn = sqlite3.connect(db_path)
+
+    c = conn.cursor()
+
+    c.execute(f"SELECT code, cause, resolution from failures where id = {failure_id}")
+
+    for info in c.fetchall():
+        failure_list.append(info)
+
+    c.close()
+    conn.close()
+
+    return failure_list
+
+
+def main():
+    """main func"""
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    records = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, "failure_db")
+
+        ids = build_db(db_path, size)
+
+        rng = random.Random(0)
+        reasons = [f"{rng.choice(ids)} Synthetic failure reason" for _ in range(records)]
+
+        start = time.perf_counter()
+        for reason in reasons:
+            legacy_lookup(db_path, reason)
+        legacy = (time.perf_counter() - start) / records
+
+        in_memory_load, in_memory = time_catalog(FailureCatalog(db_path), reasons)
+
+        snapshot_path = os.path.join(temp_dir, "failure_db.snapshot")
+
+        conn = sqlite3.connect(db_path)
+        write_snapshot(snapshot_path, conn.execute("SELECT id, code, cause, resolution FROM failures"))
+        conn.close()
+
+        mapped_load, mapped = time_catalog(FailureCatalog(db_path, snapshot_path), reasons)
+
+    print(f"catalog entries: {size}, failed records looked up: {records}")
+    print(f"per-record SQLite connect + scan: {legacy * 1e6:10.1f} us/record")
+    print(f"FailureCatalog read from SQLite:  {in_memory * 1e6:10.1f} us/record (startup {in_memory_load * 1e3:.2f} ms)")
+    print(f"FailureCatalog mapped snapshot:   {mapped * 1e6:10.1f} us/record (startup {mapped_load * 1e3:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
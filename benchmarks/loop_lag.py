@@ -0,0 +1,111 @@
+'''
+Benchmark of event loop lag while AuthStatus bodies are decoded
+Many MACs are looked up at once: each lookup waits a random network
+latency, then its AuthStatus body is decoded through parse_pool.ParsePool.
+A ticker on the same loop asks to wake up every millisecond and records
+how late it actually woke, which is how long every other response in
+flight would have been kept waiting. Run once per pool kind
+Run from the repository root:
+python3 -m benchmarks.loop_lag [--macs 64] [--records 2000] [--latency 50] [--workers 2]
+'''
+
+import time
+import random
+import asyncio
+import argparse
+from ise_parser import AuthStatusStream
+from parse_pool import PARSE_INLINE_MAX, PARSE_WORKERS, POOL_KINDS, ParsePool
+from benchmarks.parsing import auth_status_payload, session_mac
+
+# Interval the ticker asks to be woken at, in seconds
+TICK = 0.001
+
+
+def percentile(timings: list, fraction: float) -> float:
+    """Function to return a percentile of a sorted list of timings"""
+
+    if not timings:
+        return 0.0
+
+    return timings[min(len(timings) - 1, int(fraction * len(timings)))]
+
+
+async def run_kind(kind: str, bodies: list, args: argparse.Namespace) -> dict:
+    """Function to look every MAC up with the given pool kind and measure the loop lag"""
+
+    pool = ParsePool(kind, args.workers, args.inline_max)
+
+    # Start the workers before measuring, a real run keeps its pool warm
+    await asyncio.gather(*(pool.parse(AuthStatusStream, bodies[0]) for _ in range(args.workers)))
+
+    lags = []
+    finished = asyncio.Event()
+    rng = random.Random(1)
+
+    async def ticker() -> None:
+        while not finished.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - start - TICK)
+
+    async def lookup(body: bytes) -> int:
+        await asyncio.sleep(args.latency / 1000 * rng.uniform(0.5, 1.5))
+        return len(await pool.parse(AuthStatusStream, body))
+
+    ticking = asyncio.create_task(ticker())
+
+    start = time.perf_counter()
+    decoded = await asyncio.gather(*(lookup(body) for body in bodies))
+    wall = time.perf_counter() - start
+
+    finished.set()
+    await ticking
+
+    pool.close()
+
+    lags.sort()
+
+    return {
+        "kind": kind,
+        "wall": wall,
+        "records": sum(decoded),
+        "p50": percentile(lags, 0.5),
+        "p99": percentile(lags, 0.99),
+        "max": lags[-1] if lags else 0.0
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    """Function to parse the command line arguments"""
+
+    parser = argparse.ArgumentParser(description="Event loop lag while AuthStatus bodies are decoded")
+    parser.add_argument("--macs", type=int, default=64, help="MACs looked up at once")
+    parser.add_argument("--records", type=int, default=2000, help="AuthStatus records per MAC")
+    parser.add_argument("--latency", type=float, default=50, help="mean milliseconds before each body arrives")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS, help="workers in the parse pool")
+    parser.add_argument("--inline-max", type=int, default=PARSE_INLINE_MAX,
+                        help="bytes up to which a body is parsed on the loop")
+
+    return parser.parse_args()
+
+
+def main():
+    """main func"""
+
+    args = parse_args()
+
+    bodies = [auth_status_payload(args.records, f"user{i}", session_mac(i)) for i in range(args.macs)]
+
+    print(f"{args.macs} MACs, {args.records} records and {len(bodies[0]) / 1e6:.2f} MB per body, "
+          f"{args.workers} workers, inline up to {args.inline_max} bytes")
+    print(f"{'pool':<9}{'wall s':>9}{'records':>10}{'lag p50 ms':>12}{'lag p99 ms':>12}{'lag max ms':>12}")
+
+    for kind in POOL_KINDS:
+        result = asyncio.run(run_kind(kind, bodies, args))
+
+        print(f"{result['kind']:<9}{result['wall']:>9.2f}{result['records']:>10}{result['p50'] * 1000:>12.2f}"
+              f"{result['p99'] * 1000:>12.2f}{result['max'] * 1000:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
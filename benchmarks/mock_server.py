@@ -0,0 +1,311 @@
+'''
+Stand-in for ISE MnT and DNAC to run main.py and construct_db.py against
+Serves every endpoint the scripts call from synthetic data: user<n> owns
+the sessions n, n + users, n + 2 x users, ... of the ActiveList, each MAC
+has the same number of AuthStatus records, and DNAC knows the first MAC
+of every user. Latency, error and throttling rates and payload sizes are
+set on the command line. Requests served are counted per endpoint and
+returned by GET /_mock/stats
+Run from the repository root:
+python3 -m benchmarks.mock_server --sessions 10000 --latency 20 [--port 8765 --dnac-port 8766]
+'''
+
+import json
+import time
+import random
+import asyncio
+import argparse
+from dataclasses import dataclass, asdict
+from aiohttp import web
+from benchmarks.parsing import active_list_payload, auth_status_payload, failure_reasons_payload, session_mac
+
+
+@dataclass
+class MockConfig:
+    """
+    Shape of the mock deployment. latency is the mean delay per request in
+    seconds, error_rate the fraction of lookups answered 503 and
+    throttle_rate the fraction answered 429 with a Retry-After of 1
+    """
+
+    sessions: int = 1000
+    users: int = 250
+    auth_records: int = 20
+    failure_reasons: int = 3000
+    issues: int = 1
+    latency: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+
+
+def client_detail_body(mac: str, user_name: str) -> bytes:
+    """Function to build a client-detail response for a MAC"""
+
+    detail = {
+        "id": mac, "connectionStatus": "CONNECTED", "hostType": "WIRELESS", "userId": user_name,
+        "identifier": user_name, "hostName": f"host-{mac[-5:]}", "hostOs": "Windows", "hostVersion": "11",
+        "subType": "Laptop", "firmwareVersion": "1.0", "deviceVendor": "Synthetic", "lastUpdated": 1709287200000,
+        "healthScore": [{"healthType": "OVERALL", "score": 8}, {"healthType": "ONBOARDED", "score": 10}],
+        "hostMac": mac, "hostIpV4": "172.16.0.1", "authType": "WPA2/WPA3+802.1x", "ssid": "corp",
+        "location": "Global/Site/Building/Floor", "clientConnection": "ap-01", "issueCount": 1,
+        "authDoneTime": 1709287200000, "onboardingTime": 1709287200000, "connectionInfo": None
+    }
+
+    return json.dumps({"detail": detail}).encode()
+
+
+def issues_body(mac: str, count: int) -> bytes:
+    """Function to build an issues response with count issues for a MAC"""
+
+    response = [
+        {"issueId": f"{mac}-{i}", "name": "Client onboarding failures", "siteId": "", "deviceId": mac,
+         "deviceRole": "", "aiDriven": "No", "clientMac": mac, "issue_occurence_count": 1, "status": "active",
+         "priority": "P3", "category": "Onboarding", "last_occurence_time": 1709287200000 + i}
+        for i in range(count)
+    ]
+
+    return json.dumps({"version": "1.0", "totalCount": count, "response": response}).encode()
+
+
+class MockDeployment:
+    """Class holding the synthetic data and counters behind the mock endpoints"""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.requests = {}
+        self.errors = 0
+        self.bytes_sent = 0
+        self.started = time.time()
+
+        # The big bodies are built once, like a real appliance they are then
+        # only served
+        self.active_list = active_list_payload(config.sessions, config.users)
+        self.failure_list = failure_reasons_payload(config.failure_reasons)
+
+    async def serve(self, endpoint: str, body: bytes, content_type: str, fail: bool = True) -> web.Response:
+        """Function to answer a request after the configured latency and failure rates"""
+
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+        config = self.config
+
+        if config.latency > 0:
+            await asyncio.sleep(config.latency * random.uniform(0.5, 1.5))
+
+        if fail and random.random() < config.throttle_rate:
+            self.errors += 1
+            return web.Response(status=429, headers={"Retry-After": "1"})
+
+        if fail and random.random() < config.error_rate:
+            self.errors += 1
+            return web.Response(status=503)
+
+        self.bytes_sent += len(body)
+
+        return web.Response(body=body, content_type=content_type)
+
+    def owner(self, mac: str) -> str:
+        """Function to return the synthetic user a MAC belongs to"""
+
+        try:
+            index = int(mac.replace(":", "")[-6:], 16)
+
+        except ValueError:
+            return "unknown"
+
+        if index >= self.config.sessions:
+            return "unknown"
+
+        return f"user{index % self.config.users}"
+
+    def user_macs(self, user_name: str) -> list:
+        """Function to return the MACs of a synthetic user"""
+
+        try:
+            index = int(user_name.removeprefix("user"))
+
+        except ValueError:
+            return []
+
+        if not 0 <= index < self.config.users:
+            return []
+
+        return [session_mac(i) for i in range(index, self.config.sessions, self.config.users)]
+
+    async def active_list_handler(self, request: web.Request) -> web.Response:
+        """GET Session/ActiveList"""
+
+        return await self.serve("ActiveList", self.active_list, "application/xml")
+
+    async def active_count_handler(self, request: web.Request) -> web.Response:
+        """GET Session/ActiveCount"""
+
+        body = f"<sessionCount><count>{self.config.sessions}</count></sessionCount>".encode()
+
+        return await self.serve("ActiveCount", body, "application/xml")
+
+    async def user_name_handler(self, request: web.Request) -> web.Response:
+        """GET Session/UserName/<user>"""
+
+        user_name = request.match_info["user"]
+        macs = self.user_macs(user_name)
+
+        if not macs:
+            self.requests["UserName"] = self.requests.get("UserName", 0) + 1
+            return web.Response(status=404)
+
+        sessions = "".join(
+            f"<sessionParameters><user_name>{user_name}</user_name>"
+            f"<calling_station_id>{mac}</calling_station_id></sessionParameters>"
+            for mac in macs
+        )
+
+        return await self.serve("UserName", f"<sessionList>{sessions}</sessionList>".encode(), "application/xml")
+
+    async def auth_status_handler(self, request: web.Request) -> web.Response:
+        """GET AuthStatus/MACAddress/<mac>/<window>/<records>/All"""
+
+        mac = request.match_info["mac"]
+        cap = int(request.match_info["records"])
+
+        count = self.config.auth_records if cap == 0 else min(cap, self.config.auth_records)
+        body = auth_status_payload(count, self.owner(mac), mac)
+
+        return await self.serve("AuthStatus", body, "application/xml")
+
+    async def failure_reasons_handler(self, request: web.Request) -> web.Response:
+        """GET FailureReasons"""
+
+        return await self.serve("FailureReasons", self.failure_list, "application/xml", fail=False)
+
+    async def token_handler(self, request: web.Request) -> web.Response:
+        """POST auth/token"""
+
+        body = json.dumps({"Token": f"mock.{int(time.time())}.token"}).encode()
+
+        return await self.serve("auth/token", body, "application/json", fail=False)
+
+    async def user_details_handler(self, request: web.Request) -> web.Response:
+        """GET user-enrichment-details"""
+
+        macs = self.user_macs(request.headers.get("entity_value", ""))
+        details = [{"userDetails": {"hostMac": macs[0]}}] if macs else []
+
+        return await self.serve("user-enrichment-details", json.dumps(details).encode(), "application/json")
+
+    async def client_detail_handler(self, request: web.Request) -> web.Response:
+        """GET client-detail"""
+
+        mac = request.query.get("macAddress", "")
+        body = client_detail_body(mac, self.owner(mac))
+
+        return await self.serve("client-detail", body, "application/json")
+
+    async def issues_handler(self, request: web.Request) -> web.Response:
+        """GET issues"""
+
+        body = issues_body(request.query.get("macAddress", ""), self.config.issues)
+
+        return await self.serve("issues", body, "application/json")
+
+    async def stats_handler(self, request: web.Request) -> web.Response:
+        """GET /_mock/stats"""
+
+        return web.json_response({
+            "config": asdict(self.config),
+            "requests": self.requests,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "uptime": time.time() - self.started
+        })
+
+
+def create_app(config: MockConfig) -> web.Application:
+    """Function to build the mock ISE and DNAC application"""
+
+    deployment = MockDeployment(config)
+
+    mnt = "/admin/API/mnt"
+
+    app = web.Application()
+    app.add_routes([
+        web.get(f"{mnt}/Session/ActiveList", deployment.active_list_handler),
+        web.get(f"{mnt}/Session/ActiveCount", deployment.active_count_handler),
+        web.get(f"{mnt}/Session/UserName/{{user}}", deployment.user_name_handler),
+        web.get(f"{mnt}/AuthStatus/MACAddress/{{mac}}/{{window}}/{{records}}/{{attributes}}",
+                deployment.auth_status_handler),
+        web.get(f"{mnt}/FailureReasons", deployment.failure_reasons_handler),
+        web.post("/dna/system/api/v1/auth/token", deployment.token_handler),
+        web.get("/dna/intent/api/v1/user-enrichment-details", deployment.user_details_handler),
+        web.get("/dna/intent/api/v1/client-detail", deployment.client_detail_handler),
+        web.get("/dna/intent/api/v1/issues", deployment.issues_handler),
+        web.get("/_mock/stats", deployment.stats_handler)
+    ])
+
+    return app
+
+
+async def serve(app: web.Application, host: str, ports: list) -> None:
+    """Function to serve the application on every port given until interrupted"""
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    for port in ports:
+        if port is not None:
+            await web.TCPSite(runner, host, port).start()
+
+    try:
+        await asyncio.Event().wait()
+
+    finally:
+        await runner.cleanup()
+
+
+def parse_args() -> argparse.Namespace:
+    """Function to parse the command line arguments"""
+
+    defaults = MockConfig()
+
+    parser = argparse.ArgumentParser(description="Mock ISE MnT and DNAC server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dnac-port", type=int,
+                        help="second port to serve on, so ISE and DNAC can be configured as separate hosts")
+    parser.add_argument("--sessions", type=int, default=defaults.sessions, help="active sessions on ISE")
+    parser.add_argument("--users", type=int, default=defaults.users, help="users the sessions belong to")
+    parser.add_argument("--auth-records", type=int, default=defaults.auth_records, help="AuthStatus records per MAC")
+    parser.add_argument("--failure-reasons", type=int, default=defaults.failure_reasons)
+    parser.add_argument("--issues", type=int, default=defaults.issues, help="DNAC issues per MAC")
+    parser.add_argument("--latency", type=float, default=0, help="mean milliseconds per request")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of lookups answered 503")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fraction of lookups answered 429")
+
+    return parser.parse_args()
+
+
+def main():
+    """main func"""
+
+    args = parse_args()
+
+    config = MockConfig(
+        sessions=args.sessions,
+        users=args.users,
+        auth_records=args.auth_records,
+        failure_reasons=args.failure_reasons,
+        issues=args.issues,
+        latency=args.latency / 1000,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate
+    )
+
+    try:
+        asyncio.run(serve(create_app(config), args.host, [args.port, args.dnac_port]))
+
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
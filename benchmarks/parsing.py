@@ -0,0 +1,140 @@
+'''
+Micro-benchmark comparing the old xmltodict -> json.dumps -> json.loads
+decoding path with the record decoders in ise_parser.py on large synthetic
+ActiveList, AuthStatus and FailureReasons payloads
+Run from the repository root:
+python3 -m benchmarks.parsing [record count | fixture directory]
+A fixture directory written by benchmarks/synthetic.py is decoded instead
+of the built in payloads
+'''
+
+import os
+import sys
+import json
+import time
+import xmltodict
+from ise_parser import parse_active_sessions, parse_auth_status, parse_failure_reasons
+
+
+def session_mac(i: int) -> str:
+    """Function to return the MAC of synthetic session i"""
+
+    return f"AA:BB:CC:{i >> 16 & 255:02X}:{i >> 8 & 255:02X}:{i & 255:02X}"
+
+
+def active_list_payload(count: int, users: int = 5000) -> bytes:
+    """Function to build an ActiveList body with count sessions spread over users users"""
+
+    sessions = "".join(
+        "<activeSession>"
+        f"<user_name>user{i % users}</user_name>"
+        f"<calling_station_id>{session_mac(i)}</calling_station_id>"
+        f"<nas_ip_address>10.0.{i >> 8 & 255}.{i & 255}</nas_ip_address>"
+        f"<acct_session_id>{i:08x}</acct_session_id>"
+        f"<audit_session_id>0A0000{i:010X}</audit_session_id>"
+        "<server>ise-psn-01</server>"
+        f"<framed_ip_address>172.16.{i >> 8 & 255}.{i & 255}</framed_ip_address>"
+        "</activeSession>"
+        for i in range(count)
+    )
+
+    return f'<?xml version="1.0"?><activeList noOfActiveSession="{count}">{sessions}</activeList>'.encode()
+
+
+def auth_status_payload(count: int, user_name: str = "user1", mac: str = "AA:BB:CC:00:00:01") -> bytes:
+    """Function to build an AuthStatus body with count elements"""
+
+    elements = "".join(
+        "<authStatusElements>"
+        f"<user_name>{user_name}</user_name>"
+        f"<calling_station_id>{mac}</calling_station_id>"
+        f"<acs_timestamp>2024-03-01T10:{i // 60 % 60:02d}:{i % 60:02d}.{i % 1000:03d}+00:00</acs_timestamp>"
+        "<authentication_method>dot1x</authentication_method>"
+        "<posture_status>Compliant</posture_status>"
+        "<identity_group>Workstation</identity_group>"
+        "<nac_policy_compliance>Compliant</nac_policy_compliance>"
+        "<other_attr_string>:!:AuthorizationPolicyMatchedRule=Corp Access:!:ISEPolicySetName=Wired:!:"
+        "SelectedAccessService=Default Network Access</other_attr_string>"
+        f'<failed __is_null="false">{"true" if i % 4 == 0 else "false"}</failed>'
+        "<failure_reason>12321 PEAP failed SSL/TLS handshake</failure_reason>"
+        "</authStatusElements>"
+        for i in range(count)
+    )
+
+    return (f'<?xml version="1.0"?><authStatusOutputList><authStatusList key="{mac}">'
+            f'{elements}</authStatusList></authStatusOutputList>').encode()
+
+
+def failure_reasons_payload(count: int) -> bytes:
+    """Function to build a FailureReasons body with count reasons"""
+
+    reasons = "".join(
+        f'<failureReason id="{10000 + i}">'
+        f"<code>{10000 + i} Synthetic failure</code>"
+        "<cause>The request could not be completed because of a synthetic cause.</cause>"
+        "<resolution>Check the synthetic configuration and try again.</resolution>"
+        "</failureReason>"
+        for i in range(count)
+    )
+
+    return f'<?xml version="1.0"?><failureReasonList>{reasons}</failureReasonList>'.encode()
+
+
+def legacy_decode(content: bytes) -> dict:
+    """The decoding path used before ise_parser.py existed"""
+
+    dict_data = xmltodict.parse(content)
+
+    json_format = json.dumps(dict_data)
+
+    return json.loads(json_format)
+
+
+def best_of(func, content: bytes, rounds: int = 3) -> float:
+    """Function to time func(content) and keep the fastest run"""
+
+    timings = []
+
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(content)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main():
+    """main func"""
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "50000"
+
+    if os.path.isdir(source):
+        payloads = []
+
+        for name, file_name, decoder in [("ActiveList", "active_list.xml", parse_active_sessions),
+                                         ("AuthStatus", "auth_status.xml", parse_auth_status),
+                                         ("FailureReasons", "failure_reasons.xml", parse_failure_reasons)]:
+            with open(os.path.join(source, file_name), "rb") as fixture:
+                payloads.append((name, fixture.read(), decoder))
+
+    else:
+        count = int(source)
+
+        payloads = [
+            ("ActiveList", active_list_payload(count), parse_active_sessions),
+            ("AuthStatus", auth_status_payload(count), parse_auth_status),
+            ("FailureReasons", failure_reasons_payload(count), parse_failure_reasons),
+        ]
+
+    print(f"{'payload':<16}{'records':>9}{'size MB':>10}{'legacy s':>11}{'records s':>11}{'speedup':>9}")
+
+    for name, content, decoder in payloads:
+        legacy = best_of(legacy_decode, content)
+        decoded = best_of(decoder, content)
+        records = len(decoder(content))
+
+        print(f"{name:<16}{records:>9}{len(content) / 1e6:>10.1f}{legacy:>11.3f}{decoded:>11.3f}{legacy / decoded:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
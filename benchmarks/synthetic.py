@@ -0,0 +1,389 @@
+'''
+Seeded generator of ISE and DNAC shaped fixtures
+Writes an ActiveList, AuthStatus records for every session and a
+FailureReasons catalog as ISE MnT XML, and user-enrichment-details,
+client-detail and issues responses as DNAC JSON (one response per line,
+next to the request that produced it). Users, sessions per user, the
+share of failed auths, calling_station_ids that aren't MACs and wireless
+clients are all configurable, failure ids follow a skewed distribution
+like a real deployment where a handful of failures dominate. The same
+seed always produces the same files, and records are written as they
+are generated so fixtures of several gigabytes never sit in memory
+Run from the repository root:
+python3 -m benchmarks.synthetic OUTPUT_DIR [--users 10000] [--seed 1]
+'''
+
+import os
+import json
+import random
+import argparse
+from itertools import accumulate
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+# Common ISE failures, most frequent first
+COMMON_FAILURES = [
+    (22056, "Subject not found in the applicable identity store(s)"),
+    (12321, "PEAP failed SSL/TLS handshake because the client rejected the ISE local-certificate"),
+    (24408, "User authentication against Active Directory failed since user has entered the wrong password"),
+    (15039, "Rejected per authorization profile"),
+    (12514, "EAP-TLS failed SSL/TLS handshake because of an unknown CA in the client certificates chain"),
+    (22040, "Wrong password or invalid shared secret"),
+    (24206, "User disabled"),
+    (11036, "The Message-Authenticator RADIUS attribute is invalid"),
+    (12935, "Supplicant stopped responding to ISE during EAP-TLS certificate exchange"),
+    (22045, "Identity policy result is configured for password based authentication methods but received certificate based authentication request")
+]
+
+POLICY_SETS = ["Wired", "Wireless", "VPN", "Guest"]
+AUTHZ_RULES = ["Corp Access", "Contractor Access", "Quarantine", "Guest Internet", "BYOD Onboarding", "Printers"]
+IDENTITY_GROUPS = ["Workstation", "Profiled", "Unknown", "RegisteredDevices", "GuestEndpoints"]
+AUTH_METHODS = ["dot1x", "mab", "PAP_ASCII", "MSCHAPV2", "x509_PKI"]
+POSTURE = ["Compliant", "NonCompliant", "Pending", "NotApplicable", "Unknown"]
+SSIDS = ["corp", "corp-byod", "guest", "iot"]
+
+# Window the AuthStatus records are spread over, ending at the --end time
+WINDOW = 86400
+
+DEFAULT_END = "2024-03-01T12:00:00+00:00"
+
+
+@dataclass
+class SyntheticConfig:
+    """
+    Shape of the generated deployment. sessions_per_user is the mean, each
+    user gets between 1 and twice that many. Ratios are fractions of auth
+    records (failed_ratio) and sessions (non_mac_ratio, wireless_ratio).
+    failure_skew is the exponent of the Zipf-like weights over failure ids.
+    """
+
+    users: int = 10000
+    sessions_per_user: float = 2.0
+    auth_records: int = 20
+    failed_ratio: float = 0.2
+    non_mac_ratio: float = 0.02
+    wireless_ratio: float = 0.6
+    failure_reasons: int = 3000
+    failure_skew: float = 1.2
+    seed: int = 1
+    end: str = DEFAULT_END
+
+
+def failure_catalog(count: int) -> list:
+    """Function to return (id, text) for the common failures followed by filler ids up to count"""
+
+    catalog = list(COMMON_FAILURES)
+    known = {failure_id for failure_id, _ in catalog}
+
+    filler = 50000
+
+    while len(catalog) < count:
+        if filler not in known:
+            catalog.append((filler, f"Synthetic failure {filler}"))
+
+        filler += 1
+
+    return catalog
+
+
+def xml_element(tag: str, children: dict) -> str:
+    """Function to render one record element with a child per field"""
+
+    inner = "".join(f"<{name}>{escape(str(value))}</{name}>" for name, value in children.items())
+
+    return f"<{tag}>{inner}</{tag}>"
+
+
+class Generator:
+    """Class to produce the synthetic records for a config, in a fixed order"""
+
+    def __init__(self, config: SyntheticConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.end = datetime.fromisoformat(config.end).timestamp()
+        self.catalog = failure_catalog(config.failure_reasons)
+
+        weights = [1 / (rank + 1) ** config.failure_skew for rank in range(len(self.catalog))]
+        self.failure_weights = list(accumulate(weights))
+
+        self.next_mac = 0
+
+    def station_id(self) -> tuple:
+        """Function to return (calling_station_id, is_mac) for a new session"""
+
+        rng = self.rng
+
+        if rng.random() < self.config.non_mac_ratio:
+            kind = rng.randrange(3)
+
+            if kind == 0:
+                return f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}", False
+
+            if kind == 1:
+                return f"host/laptop-{rng.randrange(100000):05d}.corp.example.com", False
+
+            return f"+4420{rng.randrange(10 ** 8):08d}", False
+
+        mac_index = self.next_mac
+        self.next_mac += 1
+
+        return f"AA:BB:{mac_index >> 24 & 255:02X}:{mac_index >> 16 & 255:02X}:" \
+               f"{mac_index >> 8 & 255:02X}:{mac_index & 255:02X}", True
+
+    def session(self, user_name: str, station_id: str, wireless: bool) -> dict:
+        """Function to return the ActiveList fields of a session"""
+
+        rng = self.rng
+
+        return {
+            "user_name": user_name,
+            "calling_station_id": station_id,
+            "nas_ip_address": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            "acct_session_id": f"{rng.getrandbits(32):08x}",
+            "audit_session_id": f"0A{rng.getrandbits(56):014X}",
+            "server": f"ise-psn-{rng.randrange(1, 5):02d}",
+            "framed_ip_address": f"172.{16 + wireless}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        }
+
+    def auth_record(self, user_name: str, station_id: str, wireless: bool) -> dict:
+        """Function to return the fields of one AuthStatus record"""
+
+        rng = self.rng
+
+        stamp = datetime.fromtimestamp(self.end - rng.uniform(0, WINDOW), timezone.utc)
+        policy_set = "Wireless" if wireless else rng.choice(POLICY_SETS)
+        failed = rng.random() < self.config.failed_ratio
+
+        other_attr = ":!:".join([
+            "",
+            f"AcsSessionID=ise-psn-{rng.randrange(1, 5):02d}/{rng.getrandbits(32)}/{rng.randrange(10 ** 6)}",
+            "AuthenticationIdentityStore=" + rng.choice(["AD", "Internal Users", "Internal Endpoints"]),
+            f"AuthorizationPolicyMatchedRule={rng.choice(AUTHZ_RULES)}",
+            f"ISEPolicySetName={policy_set}",
+            "SelectedAccessService=Default Network Access",
+            f"NetworkDeviceName={'wlc' if wireless else 'sw'}-{rng.randrange(1, 40):02d}",
+            "NAS-Port-Type=" + ("Wireless - IEEE 802.11" if wireless else "Ethernet"),
+            "EndPointMatchedProfile=" + rng.choice(["Windows10-Workstation", "Apple-Device", "Android", "Cisco-IP-Phone"]),
+            ""
+        ])
+
+        record = {
+            "user_name": user_name,
+            "calling_station_id": station_id,
+            "acs_timestamp": stamp.isoformat(timespec="milliseconds"),
+            "authentication_method": rng.choice(AUTH_METHODS),
+            "posture_status": rng.choice(POSTURE),
+            "identity_group": rng.choice(IDENTITY_GROUPS),
+            "nac_policy_compliance": rng.choice(POSTURE),
+            "other_attr_string": other_attr,
+            "failed": "true" if failed else "false"
+        }
+
+        if failed:
+            failure_id, text = rng.choices(self.catalog, cum_weights=self.failure_weights)[0]
+            record["failure_reason"] = f"{failure_id} {text}"
+
+        return record
+
+    def client_detail(self, user_name: str, mac: str) -> dict:
+        """Function to return a DNAC client-detail response for a wireless MAC"""
+
+        rng = self.rng
+        overall = rng.randrange(1, 11)
+
+        detail = {
+            "id": mac, "connectionStatus": rng.choice(["CONNECTED", "CONNECTED", "DISCONNECTED"]),
+            "hostType": "WIRELESS", "userId": user_name, "identifier": user_name,
+            "hostName": f"laptop-{rng.randrange(100000):05d}", "hostOs": rng.choice(["Windows", "macOS", "iOS", "Android"]),
+            "hostVersion": str(rng.randrange(10, 15)), "subType": rng.choice(["Laptop", "Phone", "Tablet"]),
+            "firmwareVersion": f"{rng.randrange(1, 5)}.{rng.randrange(10)}", "deviceVendor": rng.choice(["Intel", "Apple", "Samsung"]),
+            "lastUpdated": int(self.end * 1000) - rng.randrange(WINDOW * 1000),
+            "healthScore": [
+                {"healthType": "OVERALL", "score": overall},
+                {"healthType": "ONBOARDED", "score": min(10, overall + rng.randrange(3))},
+                {"healthType": "CONNECTED", "score": overall}
+            ],
+            "hostMac": mac, "hostIpV4": f"172.17.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            "authType": "WPA2/WPA3+802.1x", "ssid": rng.choice(SSIDS),
+            "location": f"Global/Site-{rng.randrange(1, 9)}/Building-{rng.randrange(1, 5)}/Floor-{rng.randrange(1, 6)}",
+            "clientConnection": f"ap-{rng.randrange(1, 500):03d}", "issueCount": 0,
+            "authDoneTime": int(self.end * 1000) - rng.randrange(WINDOW * 1000),
+            "onboardingTime": int(self.end * 1000) - rng.randrange(WINDOW * 1000),
+            "connectionInfo": {"band": rng.choice(["2.4", "5", "6"]), "channel": str(rng.choice([1, 6, 11, 36, 149]))}
+        }
+
+        return {"detail": detail}
+
+    def issues(self, mac: str) -> dict:
+        """Function to return a DNAC issues response for a wireless MAC"""
+
+        rng = self.rng
+        count = rng.choices([0, 1, 2, 3], weights=[6, 2, 1, 1])[0]
+
+        response = [
+            {"issueId": f"{rng.getrandbits(64):016x}", "name": rng.choice([
+                "Wireless client failed to connect - AAA server rejected client",
+                "Wireless client took a long time to connect - Excessive time due to DHCP",
+                "Wireless client had poor RF"]),
+             "deviceId": mac, "clientMac": mac, "status": "active", "priority": rng.choice(["P1", "P2", "P3", "P4"]),
+             "category": rng.choice(["Onboarding", "Connectivity"]),
+             "last_occurence_time": int(self.end * 1000) - rng.randrange(WINDOW * 1000)}
+            for _ in range(count)
+        ]
+
+        return {"version": "1.0", "totalCount": count, "response": response}
+
+
+def write_fixtures(output_dir: str, config: SyntheticConfig) -> dict:
+    """
+    Function to write every fixture for a config into output_dir, returns
+    how many records of each kind were written
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    generator = Generator(config)
+    rng = generator.rng
+
+    counts = {"users": config.users, "sessions": 0, "macs": 0, "auth_records": 0, "failed": 0, "wireless": 0}
+
+    def path(name: str) -> str:
+        return os.path.join(output_dir, name)
+
+    with open(path("active_list.xml"), "w") as active_list, \
+            open(path("auth_status.xml"), "w") as auth_status, \
+            open(path("user_details.ndjson"), "w") as user_details, \
+            open(path("client_detail.ndjson"), "w") as client_detail, \
+            open(path("issues.ndjson"), "w") as issues:
+
+        # The session count isn't known until the end, a fixed width
+        # placeholder is overwritten once it is
+        active_list.write('<?xml version="1.0"?><activeList noOfActiveSession=')
+        count_offset = active_list.tell()
+        active_list.write('"          ">')
+
+        auth_status.write('<?xml version="1.0"?><authStatusOutputList>')
+
+        for user in range(config.users):
+            user_name = f"user{user}"
+            wireless_macs = []
+
+            sessions = rng.randint(1, max(1, round(2 * config.sessions_per_user - 1)))
+
+            for _ in range(sessions):
+                station_id, is_mac = generator.station_id()
+                wireless = is_mac and rng.random() < config.wireless_ratio
+
+                active_list.write(xml_element("activeSession", generator.session(user_name, station_id, wireless)))
+                counts["sessions"] += 1
+
+                if not is_mac:
+                    continue
+
+                counts["macs"] += 1
+
+                auth_status.write(f"<authStatusList key={quoteattr(station_id)}>")
+
+                for _ in range(config.auth_records):
+                    record = generator.auth_record(user_name, station_id, wireless)
+                    auth_status.write(xml_element("authStatusElements", record))
+
+                    counts["auth_records"] += 1
+                    counts["failed"] += record["failed"] == "true"
+
+                auth_status.write("</authStatusList>")
+
+                if wireless:
+                    wireless_macs.append(station_id)
+
+                    request = {"macAddress": station_id}
+
+                    client_detail.write(json.dumps({"request": request,
+                                                    "response": generator.client_detail(user_name, station_id)}) + "\n")
+                    issues.write(json.dumps({"request": request, "response": generator.issues(station_id)}) + "\n")
+
+                    counts["wireless"] += 1
+
+            if wireless_macs:
+                details = [{"userDetails": {"hostMac": mac}} for mac in wireless_macs]
+
+                user_details.write(json.dumps({"request": {"entity_type": "network_user_id", "entity_value": user_name},
+                                               "response": details}) + "\n")
+
+        active_list.write("</activeList>")
+        auth_status.write("</authStatusOutputList>")
+
+        active_list.seek(count_offset)
+        active_list.write(f'"{counts["sessions"]:>10}"')
+
+    with open(path("failure_reasons.xml"), "w") as failure_reasons:
+        failure_reasons.write('<?xml version="1.0"?><failureReasonList>')
+
+        for failure_id, text in generator.catalog:
+            failure_reasons.write(
+                f'<failureReason id="{failure_id}">'
+                f"<code>{failure_id} {escape(text)}</code>"
+                f"<cause>{escape(text)}.</cause>"
+                "<resolution>Check the configuration of the endpoint, network device and identity store.</resolution>"
+                "</failureReason>"
+            )
+
+        failure_reasons.write("</failureReasonList>")
+
+    return counts
+
+
+def parse_args() -> argparse.Namespace:
+    """Function to parse the command line arguments"""
+
+    defaults = SyntheticConfig()
+
+    parser = argparse.ArgumentParser(description="Seeded generator of ISE and DNAC shaped fixtures")
+    parser.add_argument("output_dir")
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--sessions-per-user", type=float, default=defaults.sessions_per_user,
+                        help="mean sessions per user")
+    parser.add_argument("--auth-records", type=int, default=defaults.auth_records, help="AuthStatus records per MAC")
+    parser.add_argument("--failed-ratio", type=float, default=defaults.failed_ratio,
+                        help="fraction of auth records that failed")
+    parser.add_argument("--non-mac-ratio", type=float, default=defaults.non_mac_ratio,
+                        help="fraction of sessions whose calling_station_id isn't a MAC")
+    parser.add_argument("--wireless-ratio", type=float, default=defaults.wireless_ratio,
+                        help="fraction of MAC sessions that are wireless and known to DNAC")
+    parser.add_argument("--failure-reasons", type=int, default=defaults.failure_reasons,
+                        help="entries in the FailureReasons catalog")
+    parser.add_argument("--failure-skew", type=float, default=defaults.failure_skew,
+                        help="how heavily failures concentrate on the most common ids")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--end", default=DEFAULT_END, help="time the newest auth records approach")
+
+    return parser.parse_args()
+
+
+def main():
+    """main func"""
+
+    args = parse_args()
+
+    config = SyntheticConfig(
+        users=args.users,
+        sessions_per_user=args.sessions_per_user,
+        auth_records=args.auth_records,
+        failed_ratio=args.failed_ratio,
+        non_mac_ratio=args.non_mac_ratio,
+        wireless_ratio=args.wireless_ratio,
+        failure_reasons=args.failure_reasons,
+        failure_skew=args.failure_skew,
+        seed=args.seed,
+        end=args.end
+    )
+
+    counts = write_fixtures(args.output_dir, config)
+
+    for kind, count in counts.items():
+        print(f"{kind}: {count}")
+
+
+if __name__ == "__main__":
+    main()
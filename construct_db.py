@@ -1,23 +1,26 @@
 '''
 Script to create SQLite DB
 Uses ISE FailureReasons API to grab all failure IDs, codes, causes, resolutions
-and populates DB with them for future reference by main script
+and populates DB with them for future reference by main script. The table is
+then compiled into failure_db.snapshot, which main script maps at startup
 '''
 
 import sqlite3
-import json
 import ast
 import os
 from sqlite3 import Error
 import requests
-import xmltodict
 from cryptography.fernet import Fernet
+from ise_parser import CHUNK_SIZE, FailureReasonStream
+from failure_catalog import write_snapshot
 
 
 WORKING_DIR = os.getcwd()
 
 requests.packages.urllib3.disable_warnings()
 
+FAILURES_TABLE = """ CREATE TABLE IF NOT EXISTS failures(id integer PRIMARY KEY, code text DEFAULT 'empty', cause text DEFAULT 'empty', resolution text DEFAULT 'empty')"""
+
 def decrypt_ise() -> str:
     with open("mykey.key", "rb") as used_key:
         inv_key = used_key.read()
@@ -43,43 +46,38 @@ def decrypt_ise() -> str:
 
     return configured_ise_url, configured_ise_user, configured_ise_pwd
 
-def db_setup(db_file: str):
-    """function to set up sqlite3 db"""
-    try:
-        #Establish connection to DB
-        conn = sqlite3.connect(db_file)
-
-        #Create cursor    
-        c = conn.cursor()
-
-        #Create table
-        c.execute(""" CREATE TABLE IF NOT EXISTS failures(id integer NOT NULL, code text DEFAULT 'empty', cause text DEFAULT 'empty', resolution text DEFAULT 'empty')""")
+def db_setup(conn: sqlite3.Connection) -> bool:
+    """
+    function to set up sqlite3 db, returns whether the failures table is
+    from an older build and has to be rebuilt by db_populate
+    """
 
-        #Enter sample data
-        c.execute(""" INSERT INTO failures(id,code,cause,resolution) VALUES(1, 'test', 'test', 'test')""")
+    c = conn.cursor()
 
-        #Commit change
-        conn.commit()
+    # Builds before the table had a primary key picked up a test row and a
+    # duplicate of every failure on each rerun, those are started from scratch
+    c.execute("PRAGMA table_info(failures)")
 
-        # View results from select all 
-        c.execute("SELECT * FROM failures")
+    columns = c.fetchall()
 
-        check_works = c.fetchall()
+    rebuild = bool(columns) and not any(column[1] == "id" and column[5] for column in columns)
 
-        print(check_works)
+    #Create table
+    if not rebuild:
+        c.execute(FAILURES_TABLE)
 
-        # Close connecion + cursor
-        c.close()
-        conn.close()
+    c.close()
 
-        print("\nDatabase Connection + Table created succesfully")
+    print("\nDatabase Connection + Table created succesfully")
 
-    except Error as e:
-        print(e)
+    return rebuild
     
-def resolve(url: str, uname: str, pwd:str) -> list:
-    """function making FailureReasons API"""
-    all_failures = []
+def resolve(url: str, uname: str, pwd:str):
+    """
+    function making FailureReasons API. The response is parsed as it
+    streams in and one (id, code, cause, resolution) row is yielded per
+    failure reason, fields ISE left out are filled with 'empty'
+    """
 
     api_url = f"{url}/admin/API/mnt/FailureReasons"
 
@@ -87,76 +85,96 @@ def resolve(url: str, uname: str, pwd:str) -> list:
         'accept':'application/xml'
     }
 
-    query_resp = requests.get(api_url, headers=api_headers, auth=(uname,pwd), verify=False)
+    parser = FailureReasonStream()
 
-    dict_data = xmltodict.parse(query_resp.content)
+    with requests.get(api_url, headers=api_headers, auth=(uname,pwd), verify=False, stream=True) as query_resp:
+        query_resp.raise_for_status()
 
-    json_format = json.dumps(dict_data, indent=4)
+        for chunk in query_resp.iter_content(CHUNK_SIZE):
+            parser.feed(chunk)
 
-    res = json.loads(json_format)
-    
-    all_ids = res["failureReasonList"]["failureReason"]
+            yield from failure_rows(parser.take())
 
-    attributes = ["@id", "code", "cause", "resolution"]
+    parser.close()
 
-    for key in all_ids:
-        att = []
-        for attribute in attributes:
-            try:
-                att.append(key[attribute])
-            except KeyError:
-                pass
-        all_failures.append(att)
+    yield from failure_rows(parser.take())
 
-    return all_failures
+def failure_rows(reasons: list):
+    """function to turn FailureReason records into failures table rows"""
 
-def db_populate(db_file: str, data: list, short_data:list):
-    """function to populate DB with data extracted from FailureReasons API"""
+    for reason in reasons:
+        yield (int(reason.id), reason.code or 'empty', reason.cause or 'empty', reason.resolution or 'empty')
 
-    conn = sqlite3.connect(db_file)
+def db_populate(conn: sqlite3.Connection, rows, rebuild: bool = False) -> int:
+    """
+    function to populate DB with data extracted from FailureReasons API.
+    Everything is written in one transaction, existing ids are updated in
+    place so the build can be rerun safely. With rebuild the old table is
+    replaced in the same transaction
+    """
 
     c = conn.cursor()
 
-    c.executemany('''INSERT INTO failures(id,code,cause,resolution) VALUES (?, ?, ?, ?)''', data)
+    c.execute("BEGIN")
+
+    try:
+        if rebuild:
+            print("Rebuilding failures table from an older build without a primary key")
+
+            c.execute("DROP TABLE failures")
+            c.execute(FAILURES_TABLE)
+
+        c.executemany('''INSERT INTO failures(id,code,cause,resolution) VALUES (?, ?, ?, ?)
+                         ON CONFLICT(id) DO UPDATE SET code=excluded.code, cause=excluded.cause, resolution=excluded.resolution''', rows)
 
-    c.executemany('''INSERT INTO failures(id,code,cause) VALUES (?, ?, ?)''', short_data)
+    except BaseException:
+        # Leave the previous build, and its table, untouched if the download or insert fails
+        c.execute("ROLLBACK")
+        raise
 
-    conn.commit()
+    c.execute("COMMIT")
+
+    c.execute("SELECT count(*) FROM failures")
+
+    total = c.fetchone()[0]
 
     c.close()
-    conn.close()
+
+    return total
 
 def main():
     """main func"""
     db_location  = f"{WORKING_DIR}/failure_db"
+    snapshot_location = f"{WORKING_DIR}/failure_db.snapshot"
 
     url, uname, pwd = decrypt_ise()
-    
-    datalist = resolve(url, uname,pwd)
-    
-    data = [tuple(value) for value in datalist]
 
-    short_data = [value for value in data if len(value) == 3]
+    try:
+        # Transactions are managed explicitly in db_populate
+        conn = sqlite3.connect(db_location, isolation_level=None)
 
-    data = [value for value in data if len(value) != 3]
-    
-    db_setup(db_location)
+        # Bulk load settings, the whole file is rebuilt from ISE if a load is cut short
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
 
-    db_populate(db_location, data, short_data)
+        rebuild = db_setup(conn)
 
-    conn = sqlite3.connect(db_location)
+        total = db_populate(conn, resolve(url, uname, pwd), rebuild)
 
-    #Create cursor    
-    c = conn.cursor()
-    c.execute("SELECT * FROM failures")
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
 
-    check_works = c.fetchall()
+        # Compile the snapshot main.py maps at startup
+        compiled = write_snapshot(snapshot_location, conn.execute("SELECT id, code, cause, resolution FROM failures"))
 
-    print(check_works)
+        conn.close()
 
-    # Close connecion + cursor
-    c.close()
-    conn.close()
-    print("DATA ENTRIES IN FAILURE_DB")
+    except Error as e:
+        print(e)
+        return
+
+    print(f"{total} DATA ENTRIES IN FAILURE_DB")
+    print(f"{compiled} ENTRIES COMPILED TO {snapshot_location}")
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+'''
+DNAC token manager
+Caches the token returned by /dna/system/api/v1/auth/token together with
+its expiry, refreshes it shortly before it runs out and shares a single
+in-flight refresh between concurrent callers. The token can also be kept
+in a Fernet encrypted file so back to back runs skip the auth round trip
+'''
+
+import sys
+import time
+import json
+import base64
+import asyncio
+from cryptography.fernet import Fernet, InvalidToken
+from atomic_file import write_atomic
+
+# DNAC tokens are valid for an hour, used when the expiry can't be read
+DEFAULT_LIFETIME = 60 * 60
+
+# Start refreshing this many seconds before the token expires
+REFRESH_MARGIN = 5 * 60
+
+
+def token_expiry(token: str):
+    """Function to read the exp claim out of a DNAC token (a JWT), None if it has none"""
+
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenManager:
+    """
+    Class to hand out a valid DNAC token. fetch is a coroutine function
+    returning a new token. When cache_path and fernet are given the token
+    is also kept on disk, tagged with identity so a token belonging to a
+    different DNAC or account is never reused.
+    """
+
+    def __init__(self, fetch, cache_path: str = None, fernet: Fernet = None, identity: str = ""):
+        self.fetch = fetch
+        self.cache_path = cache_path
+        self.fernet = fernet
+        self.identity = identity
+        self.token = None
+        self.expires = 0
+        self._refreshing = None
+
+    async def get(self) -> str:
+        """
+        Function to return a usable token. An expired or missing token is
+        refreshed before returning, one inside the refresh margin is
+        returned as is while a refresh starts in the background
+        """
+
+        if self.token is None:
+            self._read()
+
+        remaining = self.expires - time.time()
+
+        if self.token is None or remaining <= 0:
+            return await self._start_refresh()
+
+        if remaining < REFRESH_MARGIN and (self._refreshing is None or self._refreshing.done()):
+            # A failed early refresh is reported, the current token is still good
+            self._start_refresh().add_done_callback(self._report)
+
+        return self.token
+
+    async def refresh(self, rejected: str = None) -> str:
+        """
+        Function to replace a token DNAC rejected. If another caller has
+        already replaced it the newer token is returned without a new fetch
+        """
+
+        if rejected is not None and self.token != rejected and self.expires > time.time():
+            return self.token
+
+        return await self._start_refresh()
+
+    async def wait(self) -> None:
+        """Function to let a background refresh finish before the run exits, without raising its error"""
+
+        if self._refreshing is not None:
+            await asyncio.gather(self._refreshing, return_exceptions=True)
+
+    def _report(self, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is None:
+            return
+
+        print(f"Could not refresh the DNAC token, using the current one until it expires: {task.exception()}",
+              file=sys.stderr)
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._refresh())
+
+        return self._refreshing
+
+    async def _refresh(self) -> str:
+        token = await self.fetch()
+
+        expires = token_expiry(token)
+
+        if expires is None:
+            expires = time.time() + DEFAULT_LIFETIME
+
+        self.token = token
+        self.expires = expires
+
+        self._write()
+
+        return token
+
+    def _read(self) -> None:
+        if self.cache_path is None or self.fernet is None:
+            return
+
+        try:
+            with open(self.cache_path, "rb") as cache_file:
+                cached = json.loads(self.fernet.decrypt(cache_file.read()))
+
+        except (FileNotFoundError, InvalidToken, ValueError):
+            return
+
+        if cached.get("identity") == self.identity and cached.get("expires", 0) > time.time():
+            self.token = cached["token"]
+            self.expires = cached["expires"]
+
+    def _write(self) -> None:
+        if self.cache_path is None or self.fernet is None:
+            return
+
+        cached = json.dumps({"identity": self.identity, "token": self.token, "expires": self.expires})
+
+        write_atomic(self.cache_path, self.fernet.encrypt(cached.encode()))
@@ -0,0 +1,37 @@
+'''
+Decoding layer for DNAC intent API responses
+Turns the client-detail and issues JSON into the slotted records in
+records.py, keeping only the fields the tool reports on rather than every
+nested dict DNAC returns
+'''
+
+from records import CLIENT_DETAIL_KEYS, CLIENT_ISSUE_KEYS, ClientDetail, ClientIssue, ClientIssues
+
+
+def decode_client_detail(response: dict):
+    """Function to decode a client-detail response, None if it has no detail"""
+
+    try:
+        detail = response["detail"]
+
+    except (KeyError, TypeError):
+        return None
+
+    if not detail:
+        return None
+
+    return ClientDetail(**{name: detail.get(key) for name, key in CLIENT_DETAIL_KEYS})
+
+
+def decode_client_issues(response: dict):
+    """Function to decode an issues response, None if it isn't one"""
+
+    if not isinstance(response, dict):
+        return None
+
+    issues = [
+        ClientIssue(**{name: entry.get(key) for name, key in CLIENT_ISSUE_KEYS})
+        for entry in response.get("response") or ()
+    ]
+
+    return ClientIssues(response.get("version"), response.get("totalCount"), issues)
@@ -0,0 +1,245 @@
+'''
+Failure catalog lookups for the failures built by construct_db.py
+When construct_db.py has compiled a snapshot the catalog memory maps it
+and binary searches it directly, nothing is parsed at startup and every
+process on the host shares the same pages. Otherwise failure_db is read
+once into a dictionary keyed by failure id. Either way looking up the
+code, cause and resolution for a failed auth record no longer opens a
+SQLite connection per record, ids missing from both fall back to a
+parameterized query, once per id
+
+Snapshot layout (native byte order, flagged in the header):
+header   magic b"FCAT", u16 version, u8 little endian flag, pad, u32 count
+ids      count x u32, sorted
+offsets  (3 x count + 1) x u32, start of code, cause, resolution per id
+blob     every string, UTF-8, back to back
+'''
+
+import re
+import sys
+import mmap
+import struct
+import sqlite3
+from array import array
+from bisect import bisect_left
+from atomic_file import write_atomic
+
+SNAPSHOT_MAGIC = b"FCAT"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("=4sHBxI")
+
+## All failure IDs are 5-6 digits long
+FAILURE_ID = re.compile(r'^(\d{5,6})')
+
+
+def failure_id(failure_reason: str):
+    """Function to pull the failure id off the front of a failure_reason, None if absent"""
+
+    match = FAILURE_ID.match(failure_reason)
+
+    if match is None:
+        return None
+
+    return int(match.group(1))
+
+
+def write_snapshot(path: str, rows) -> int:
+    """
+    Function to compile (id, code, cause, resolution) rows into a snapshot
+    file, returns the entries written
+    """
+
+    rows = sorted(rows, key=lambda row: row[0])
+
+    ids = array("I", (row[0] for row in rows))
+    offsets = array("I", [0])
+    blob = bytearray()
+
+    for row in rows:
+        for text in row[1:]:
+            blob += (text or "").encode("utf-8")
+            offsets.append(len(blob))
+
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sys.byteorder == "little", len(ids))
+
+    # Running lookups keep the old file mapped until they reopen it
+    write_atomic(path, b"".join((header, ids.tobytes(), offsets.tobytes(), blob)), 0o644)
+
+    return len(ids)
+
+
+class FailureSnapshot:
+    """Class to binary search a memory mapped snapshot written by write_snapshot"""
+
+    def __init__(self, snapshot_file, mapped: mmap.mmap, count: int):
+        self._file = snapshot_file
+        self._mapped = mapped
+        self.count = count
+
+        view = memoryview(mapped)
+        ids_end = SNAPSHOT_HEADER.size + count * 4
+        offsets_end = ids_end + (3 * count + 1) * 4
+
+        self._views = [view]
+        self.ids = view[SNAPSHOT_HEADER.size:ids_end].cast("I")
+        self.offsets = view[ids_end:offsets_end].cast("I")
+        self.blob = view[offsets_end:]
+        self._views += [self.ids, self.offsets, self.blob]
+
+    @classmethod
+    def open(cls, path: str):
+        """Function to map a snapshot, None if it is missing or was built differently"""
+
+        if array("I").itemsize != 4:
+            return None
+
+        try:
+            snapshot_file = open(path, "rb")
+
+        except FileNotFoundError:
+            return None
+
+        try:
+            mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        except ValueError:
+            # An empty file can't be mapped
+            snapshot_file.close()
+            return None
+
+        if len(mapped) >= SNAPSHOT_HEADER.size:
+            magic, version, little_endian, count = SNAPSHOT_HEADER.unpack_from(mapped)
+
+            if (magic == SNAPSHOT_MAGIC and version == SNAPSHOT_VERSION
+                    and little_endian == (sys.byteorder == "little")
+                    and len(mapped) >= SNAPSHOT_HEADER.size + (4 * count + 1) * 4):
+                return cls(snapshot_file, mapped, count)
+
+        mapped.close()
+        snapshot_file.close()
+
+        return None
+
+    def get(self, found_id: int):
+        """Function to return (code, cause, resolution) for an id, None if absent"""
+
+        index = bisect_left(self.ids, found_id)
+
+        if index == self.count or self.ids[index] != found_id:
+            return None
+
+        start = 3 * index
+        offsets = self.offsets
+
+        return tuple(
+            self.blob[offsets[start + i]:offsets[start + i + 1]].tobytes().decode("utf-8")
+            for i in range(3)
+        )
+
+    def close(self) -> None:
+        """Function to unmap the snapshot"""
+
+        # Views into the map have to go before the map itself can close
+        for view in reversed(self._views):
+            view.release()
+
+        self._mapped.close()
+        self._file.close()
+
+
+class FailureCatalog:
+    """
+    Class holding failure id -> (code, cause, resolution), or None for an
+    id that is in neither the snapshot nor failure_db. A snapshot
+    compiled by construct_db.py is used when snapshot_path points at one,
+    otherwise the failures table is read into memory.
+    """
+
+    def __init__(self, db_path: str, snapshot_path: str = None):
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path
+        self.snapshot = None
+        self.failures = {}
+        self._conn = None
+
+    def load(self) -> int:
+        """Function to make the catalog ready for lookups, returns the entries available"""
+
+        if self.snapshot_path is not None:
+            self.snapshot = FailureSnapshot.open(self.snapshot_path)
+
+            if self.snapshot is not None:
+                return self.snapshot.count
+
+        try:
+            conn = sqlite3.connect(self.db_path)
+
+            try:
+                rows = conn.execute("SELECT id, code, cause, resolution FROM failures").fetchall()
+
+            finally:
+                conn.close()
+
+        except sqlite3.Error as err:
+            print(f"Could not load failure catalog: {err}", file=sys.stderr)
+            return 0
+
+        # Keep the first row for an id, older builds of failure_db can hold repeats
+        for row in rows:
+            self.failures.setdefault(row[0], row[1:])
+
+        return len(self.failures)
+
+    def lookup(self, failure_reason: str) -> list:
+        """Function to return [(code, cause, resolution)] for a failure_reason, [] if unknown"""
+
+        found_id = failure_id(failure_reason)
+
+        if found_id is None:
+            return []
+
+        if found_id in self.failures:
+            details = self.failures[found_id]
+
+        else:
+            details = None
+
+            if self.snapshot is not None:
+                details = self.snapshot.get(found_id)
+
+            if details is None:
+                details = self._query(found_id)
+
+            # Failures repeat a lot across records, keep the decoded strings
+            # and remember ids found nowhere so they are only looked for once
+            self.failures[found_id] = details
+
+        if details is None:
+            return []
+
+        return [details]
+
+    def close(self) -> None:
+        """Function to unmap the snapshot and close the fallback connection"""
+
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _query(self, found_id: int):
+        try:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.db_path)
+
+            row = self._conn.execute(
+                "SELECT code, cause, resolution FROM failures WHERE id = ?", (found_id,)
+            ).fetchone()
+
+        except sqlite3.Error:
+            return None
+
+        return row
@@ -0,0 +1,182 @@
+'''
+Script to answer questions from the local auth store, without asking ISE
+Every lookup main.py and service.py make is appended to auth_store.db,
+this reads it back:
+python3 history.py query --user foobar --failures --days 7
+python3 history.py query --mac AA:BB:CC:DD:EE:FF --days 1
+python3 history.py query --failure-id 12321 --days 30 --output ndjson
+python3 history.py issues --mac AA:BB:CC:DD:EE:FF --days 7
+python3 history.py summary --days 30 [--top 10] [--output json]
+python3 history.py compact [--retention-days 90]
+'''
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+from auth_store import AuthStore, RETENTION_DAYS
+from analytics import AuthColumns, CATEGORICAL, HOUR
+
+WORKING_DIR = os.getcwd()
+
+AUTH_STORE = f"{WORKING_DIR}/auth_store.db"
+
+## Headings of the categorical columns in the summary
+COLUMN_TITLES = {
+    "identity_group": "identity groups",
+    "authorisation_policy": "authorisation policies",
+    "failure_id": "failure ids",
+    "user_name": "users",
+    "mac": "MACs"
+}
+
+
+def local_time(ts: float) -> str:
+    """Function to show epoch seconds as local time"""
+
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def print_rows(rows: list, columns: list, output: str) -> None:
+    """Function to print query results as a table or one JSON document per line"""
+
+    if output == "ndjson":
+        for row in rows:
+            sys.stdout.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+        return
+
+    table = [[local_time(row["ts"])] + ["" if row[column] is None else str(row[column]) for column in columns]
+             for row in rows]
+
+    headings = ["time"] + columns
+    widths = [max([len(heading)] + [len(line[i]) for line in table]) for i, heading in enumerate(headings)]
+
+    print("  ".join(heading.ljust(width) for heading, width in zip(headings, widths)))
+
+    for line in table:
+        print("  ".join(value.ljust(width) for value, width in zip(line, widths)))
+
+
+def print_summary(summary: dict, taken: float) -> None:
+    """Function to print the summary built by AuthColumns as tables"""
+
+    print(f"{summary['records']} auth records, {summary['failures']} failures "
+          f"(summarised in {taken:.2f} s with {summary['engine']})\n")
+
+    for column in CATEGORICAL:
+        print(f"Top {COLUMN_TITLES[column]} by failures:")
+
+        for entry in summary[column]:
+            print(f"{entry['failures']:>10}  {'null' if entry['name'] is None else entry['name']}")
+
+        print()
+
+    for column in ("user_name", "mac"):
+        spread = ", ".join(f"{name} {value}" for name, value in summary[f"failures_per_{column}"].items())
+        print(f"Failures per {COLUMN_TITLES[column][:-1]}: {spread}")
+
+    print("\nFailure rate per bucket:")
+
+    for entry in summary["hours"]:
+        print(f"{local_time(entry['start'])}  {entry['failures']:>9}/{entry['records']:<9} {entry['failure_rate']:>7.1%}")
+
+
+def parse_args() -> argparse.Namespace:
+    """Function to parse the command line arguments"""
+
+    parser = argparse.ArgumentParser(description="Query the local store of ISE auth records and DNAC issues")
+    parser.add_argument("--db", default=AUTH_STORE, help="store to read (default auth_store.db here)")
+
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="ISE auth records")
+    query.add_argument("--user", help="username to match")
+    query.add_argument("--mac", help="MAC address to match, in any format")
+    query.add_argument("--failure-id", type=int, help="failure id to match, e.g. 12321")
+    query.add_argument("--failures", action="store_true", help="only failed authentications")
+    query.add_argument("--days", type=float, default=7, help="days to look back (default 7)")
+    query.add_argument("--limit", type=int, help="most records to show")
+    query.add_argument("--output", choices=("text", "ndjson"), default="text")
+
+    issues = commands.add_parser("issues", help="DNAC issues")
+    issues.add_argument("--mac", help="MAC address to match, in any format")
+    issues.add_argument("--days", type=float, default=7, help="days to look back (default 7)")
+    issues.add_argument("--limit", type=int, help="most issues to show")
+    issues.add_argument("--output", choices=("text", "ndjson"), default="text")
+
+    summary = commands.add_parser("summary", help="failure counts, percentiles and failure rate over time")
+    summary.add_argument("--days", type=float, default=7, help="days to look back (default 7)")
+    summary.add_argument("--top", type=int, default=10, help="entries listed per ranking (default 10)")
+    summary.add_argument("--bucket", type=float, default=HOUR / 3600, metavar="HOURS",
+                         help="hours per failure rate bucket (default 1)")
+    summary.add_argument("--output", choices=("text", "json"), default="text")
+
+    compact = commands.add_parser("compact", help="delete records older than the retention period")
+    compact.add_argument("--retention-days", type=float, default=RETENTION_DAYS,
+                         help=f"days of records to keep (default {RETENTION_DAYS})")
+
+    return parser.parse_args()
+
+
+def main():
+    """main func"""
+
+    args = parse_args()
+
+    if args.command != "compact" and not os.path.exists(args.db):
+        sys.exit(f"{args.db} not found, it is written by main.py and service.py lookups")
+
+    store = AuthStore(args.db, getattr(args, "retention_days", RETENTION_DAYS))
+
+    try:
+        start = time.perf_counter()
+
+        if args.command == "query":
+            rows = store.query_auth(args.user, args.mac, args.failure_id, time.time() - args.days * 86400,
+                                    args.failures, args.limit)
+            columns = ["user_name", "mac", "authentication_method", "posture_status", "authorisation_policy",
+                       "failure_reason"]
+
+        elif args.command == "issues":
+            rows = store.query_issues(args.mac, time.time() - args.days * 86400, args.limit)
+            columns = ["mac", "priority", "category", "name", "status"]
+
+        elif args.command == "summary":
+            auth_columns = AuthColumns()
+            auth_columns.load_store(store, time.time() - args.days * 86400)
+
+            summary = auth_columns.summary(args.top, args.bucket * 3600)
+
+            if args.output == "json":
+                print(json.dumps(summary, indent=4))
+
+            else:
+                print_summary(summary, time.perf_counter() - start)
+
+            return
+
+        else:
+            deleted = store.compact(force=True)
+            print(f"{deleted} records older than {args.retention_days:g} days deleted")
+            return
+
+        taken = time.perf_counter() - start
+
+    except sqlite3.Error as err:
+        sys.exit(f"Could not read {args.db}: {err}")
+
+    finally:
+        store.close()
+
+    print_rows(rows, columns, args.output)
+
+    if args.output == "text":
+        print(f"{len(rows)} records in {taken * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+'''
+Decoding layer for ISE MnT XML responses
+Turns ActiveList, AuthStatus and FailureReasons bodies straight into the
+typed records in records.py. Already buffered bodies are parsed in one go,
+or a parser can be fed the body chunk by chunk as it arrives, in which case
+each element is released as soon as it has been decoded and memory is
+bounded by a single element rather than the whole response
+'''
+
+from xml.etree import ElementTree
+from records import ActiveSession, AuthStatusElement, FailureReason, field_names
+
+# Size of each chunk read off the wire and fed to the pull parser
+CHUNK_SIZE = 64 * 1024
+
+ACTIVE_SESSION_FIELDS = field_names(ActiveSession)
+AUTH_STATUS_FIELDS = field_names(AuthStatusElement)
+FAILURE_REASON_FIELDS = field_names(FailureReason)
+
+
+def child_values(element: ElementTree.Element, wanted: frozenset) -> dict:
+    """Function to collect {child tag: child text} for the wanted tags only"""
+
+    values = {}
+
+    for child in element:
+        if child.tag in wanted:
+            values[child.tag] = child.text
+
+    return values
+
+
+class RecordStream:
+    """
+    Base parser. Either hand parse() a whole body, or feed() it the body
+    as it arrives and every element named by tag is handed to decode() as
+    soon as its closing tag is seen, then dropped from the tree. Subclasses
+    implement decode() and return a record, or None to skip the element.
+    """
+
+    tag = None
+
+    def __init__(self):
+        self.records = []
+        self.elements_seen = 0
+        self._open = []
+        self._parser = ElementTree.XMLPullParser(events=("start", "end"))
+
+    def feed(self, chunk: bytes) -> None:
+        """Function to feed the next chunk of the body to the parser"""
+
+        self._parser.feed(chunk)
+        self._drain()
+
+    def close(self) -> list:
+        """Function to finish parsing and return the decoded records"""
+
+        self._parser.close()
+        self._drain()
+
+        return self.records
+
+    def take(self) -> list:
+        """Function to hand over the records decoded so far and forget them"""
+
+        records = self.records
+        self.records = []
+
+        return records
+
+    def parse(self, content: bytes) -> list:
+        """Function to decode an already buffered body in one pass"""
+
+        root = ElementTree.fromstring(content)
+
+        for element in root.iter(self.tag):
+            self.elements_seen += 1
+
+            record = self.decode(element)
+
+            if record is not None:
+                self.records.append(record)
+
+        return self.records
+
+    def decode(self, element: ElementTree.Element):
+        raise NotImplementedError
+
+    def _drain(self) -> None:
+        for event, element in self._parser.read_events():
+            if event == "start":
+                self._open.append(element)
+                continue
+
+            self._open.pop()
+
+            if element.tag != self.tag:
+                continue
+
+            self.elements_seen += 1
+
+            record = self.decode(element)
+
+            if record is not None:
+                self.records.append(record)
+
+            # Element has been dealt with, release it so the tree never grows
+            element.clear()
+
+            if self._open:
+                self._open[-1].remove(element)
+
+
+class ActiveListStream(RecordStream):
+    """
+    Parser for Session/ActiveList. When a user_name is given only that
+    user's sessions are decoded, everything else is discarded on sight.
+    """
+
+    tag = "activeSession"
+
+    def __init__(self, user_name: str = None):
+        super().__init__()
+        self.user_name = user_name
+
+    def decode(self, element: ElementTree.Element):
+        values = child_values(element, ACTIVE_SESSION_FIELDS)
+
+        if self.user_name is not None and values.get("user_name") != self.user_name:
+            return None
+
+        return ActiveSession(**values)
+
+
+class UserSessionStream(ActiveListStream):
+    """
+    Parser for Session/UserName, which describes the user's sessions with
+    sessionParameters elements carrying the same tags as activeSession
+    """
+
+    tag = "sessionParameters"
+
+
+class AuthStatusStream(RecordStream):
+    """Parser for AuthStatus/MACAddress"""
+
+    tag = "authStatusElements"
+
+    def decode(self, element: ElementTree.Element):
+        values = child_values(element, AUTH_STATUS_FIELDS)
+
+        values["failed"] = values.get("failed") == "true"
+
+        return AuthStatusElement(**values)
+
+
+class FailureReasonStream(RecordStream):
+    """Parser for FailureReasons, the failure id is held in the id attribute"""
+
+    tag = "failureReason"
+
+    def decode(self, element: ElementTree.Element):
+        values = child_values(element, FAILURE_REASON_FIELDS)
+
+        values["id"] = element.get("id")
+
+        return FailureReason(**values)
+
+
+def matched_policies(other_attr_string: str) -> tuple:
+    """
+    Function to pull (authorisation policy, authentication policy) out of
+    the other_attr_string of an AuthStatus element, None for either if absent
+    """
+
+    risation_policy = None
+    tication_policy = None
+
+    if other_attr_string:
+        other_attr = other_attr_string.replace("=",":")
+
+        other_attr = other_attr.split(":!:")
+
+        for info in other_attr:
+            chk_that = "AuthorizationPolicyMatchedRule:"
+
+            chk_that_also = "ISEPolicySetName:"
+
+            if info.startswith(chk_that):
+                risation_policy = info.removeprefix(chk_that)
+
+            if info.startswith(chk_that_also):
+                tication_policy = info.removeprefix(chk_that_also)
+
+    return risation_policy, tication_policy
+
+
+def parse_active_sessions(content: bytes, user_name: str = None) -> list:
+    """Function to decode a Session/ActiveList body into ActiveSession records"""
+
+    return ActiveListStream(user_name).parse(content)
+
+
+def parse_user_sessions(content: bytes, user_name: str = None) -> list:
+    """Function to decode a Session/UserName body into ActiveSession records"""
+
+    return UserSessionStream(user_name).parse(content)
+
+
+def parse_session_count(content: bytes) -> int:
+    """Function to read the session count out of a Session/ActiveCount body"""
+
+    return int(ElementTree.fromstring(content).findtext("count"))
+
+
+def parse_auth_status(content: bytes) -> list:
+    """Function to decode an AuthStatus body into AuthStatusElement records"""
+
+    return AuthStatusStream().parse(content)
+
+
+def parse_failure_reasons(content: bytes) -> list:
+    """Function to decode a FailureReasons body into FailureReason records"""
+
+    return FailureReasonStream().parse(content)
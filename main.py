@@ -11,22 +11,37 @@ code, cause, resolution
 Author: Luke Marshall
 '''
 import sys
-import re
+import argparse
 import os
-import sqlite3
 import asyncio
 import json
 import time
-import string
 import ast
 import random
+import sqlite3
 from datetime import datetime
+from dataclasses import replace
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
 import aiohttp
-import requests
-from requests.auth import HTTPBasicAuth
-import xmltodict
 import macaddress
 from cryptography.fernet import Fernet
+from transport import BackendPolicy, REQUEST_ERRORS, Transport
+from failure_catalog import FailureCatalog
+from scheduler import TaskGraph
+from dna_token import TokenManager
+from active_cache import ActiveListCache, ActiveListSnapshot
+from response_cache import ResponseCache
+from auth_history import AuthHistory
+from watch import UserWatch
+from output import NdjsonWriter, ndjson_record
+from metrics import METRICS
+from records import AuthEvent, LOOKUP_FAILED, MacSessions, session_key, to_api
+from dnac_parser import decode_client_detail, decode_client_issues
+from ise_parser import ActiveListStream, AuthStatusStream, CHUNK_SIZE, matched_policies, parse_session_count, parse_user_sessions
+from parse_pool import PARSE_WORKERS, POOL_KINDS, ParsePool
+from auth_store import AuthStore
+from sweep import SweepReport, sweep_targets
 
 working_dir = os.getcwd()
 config_file = f"{working_dir}/env_config.txt"
@@ -66,23 +81,104 @@ configured_dna_url = decrypted_data[3]
 configured_dna_user = decrypted_data[4]
 configured_dna_pwd = decrypted_data[5]
 
-# Suppress warnings spat back by requests package
-requests.packages.urllib3.disable_warnings()
-
 DNAC_BASE = configured_dna_url
 
 ISE_BASE = f"{configured_ise_url}/admin/API/mnt"
 
 DB_PATH = f"{working_dir}/failure_db"
 
+# Compiled copy of failure_db written by construct_db.py
+FAILURE_SNAPSHOT = f"{working_dir}/failure_db.snapshot"
+
+# Deployments with this many active sessions or fewer are cheap enough
+# to scan in full, above it the per-user MnT lookup is used instead
+FULL_LIST_MAX_SESSIONS = 2000
+
+# Snapshot of the ActiveList shared by runs in this directory, refreshed
+# once it is older than ACTIVE_LIST_TTL seconds. 0 turns the cache off
+ACTIVE_LIST_CACHE = f"{working_dir}/active_list.cache"
+ACTIVE_LIST_TTL = 300
+
+# AuthStatus and DNAC client responses are kept here and reused for their
+# TTL in seconds, then served for a while longer as they are refreshed
+RESPONSE_CACHE = f"{working_dir}/response_cache"
+RESPONSE_TTLS = {
+    "auth_status": 120,
+    "user_details": 600,
+    "client_health": 120,
+    "client_issues": 300
+}
+
+# Seconds of AuthStatus records looked at per MAC, and the most records
+# ISE returns per MAC (0 for all of them)
+AUTH_WINDOW = 86400
+AUTH_MAX_RECORDS = 0
+
+# AuthStatus records already downloaded per MAC, used by --incremental
+AUTH_HISTORY = f"{working_dir}/auth_history.cache"
+
+# Every auth record and DNAC issue looked up is appended here, history.py
+# answers questions about the past from it without asking ISE
+AUTH_STORE = f"{working_dir}/auth_store.db"
+
+# Encrypted copy of the DNAC token so back to back runs can reuse it
+DNA_TOKEN_CACHE = f"{working_dir}/dna_token.cache"
+
+# How each of ISE and DNAC is called: requests in flight, rate limit and
+# retries. DNAC rate limits its intent APIs (100 requests a minute), so
+# its calls are spread out here instead of being answered with 429s
+BACKEND_POLICIES = {
+    urlsplit(ISE_BASE).netloc: BackendPolicy(connections=10, retries=3),
+    urlsplit(DNAC_BASE).netloc: BackendPolicy(connections=10, rate=100 / 60, burst=10, retries=3)
+}
+
+# Users looked up at the same time in batch mode
+BATCH_CONCURRENCY = 8
+
+# Sweep mode looks at the last SWEEP_WINDOW seconds of every active MAC,
+# with SWEEP_CONCURRENCY lookups in flight and at most SWEEP_RATE AuthStatus
+# calls a second so MnT isn't swamped, and lists the top SWEEP_TOP entries
+SWEEP_WINDOW = 3600
+SWEEP_CONCURRENCY = 10
+SWEEP_RATE = 20
+SWEEP_TOP = 10
+
+# MACs between the progress lines a sweep prints
+SWEEP_PROGRESS = 1000
+
+# Watch mode polls up to this fraction earlier or later than its interval,
+# so many watchers started together don't poll ISE and DNAC in lockstep
+WATCH_JITTER = 0.2
+
+class IseRequestError(Exception):
+    """Raised when ISE can't return the active sessions a lookup depends on"""
+
 class IseApiController:
     """Class to create an ISE object and to call functions on that object"""
 
-    def __init__(self, iseuser, isepass):
+    def __init__(self, iseuser, isepass, transport, failures, cache=None,
+                 window=AUTH_WINDOW, max_records=AUTH_MAX_RECORDS, history=None, parse_pool=None, store=None):
         self.iseuser = iseuser
         self.isepass = isepass
+        self.auth = aiohttp.BasicAuth(iseuser, isepass)
+        self.transport = transport
+        self.failures = failures
+        self.cache = cache
+        self.window = window
+        self.max_records = max_records
+        self.history = history
+        self.parse_pool = parse_pool
+        self.store = store
+
+    async def parse(self, stream_type, content: bytes, *args) -> list:
+        """Function to decode a buffered body, in the parse pool if there is one"""
+
+        if self.parse_pool is None:
+            return stream_type(*args).parse(content)
+
+        return await self.parse_pool.parse(stream_type, content, *args)
     
-    async def get_active_sessions(self) -> dict:
+    async def get_active_sessions(self) -> list:
         """Function to grab all active sessions on Ise"""
 
         api_url = f"{ISE_BASE}/Session/ActiveList"
@@ -90,254 +186,349 @@ class IseApiController:
             "accept":"application/xml"
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(api_url, headers=api_headers, auth=aiohttp.BasicAuth(self.iseuser, self.isepass), ssl=False) as response:
+        try:
+            with METRICS.span("http_request_seconds", endpoint="ActiveList"):
+                async with self.transport.get(api_url, headers=api_headers, auth=self.auth) as response:
+                    response.raise_for_status()
+
+                    content = await response.read()
+
+        except REQUEST_ERRORS as err:
+            raise IseRequestError("Could not fulfill request. Error Code 200") from err
+
+        METRICS.add("http_response_bytes_total", len(content), endpoint="ActiveList")
+
+        with METRICS.span("parse_seconds", endpoint="ActiveList"):
+            return await self.parse(ActiveListStream, content)
+
+    async def stream_active_sessions(self, sso: str) -> list:
+        """
+        Function to stream the active sessions on Ise and keep only the
+        sessions belonging to the given SSO. The body is parsed as it
+        arrives rather than buffered, and the result can be handed to
+        check_macs_in_session like the output of get_active_sessions
+        """
+
+        api_url = f"{ISE_BASE}/Session/ActiveList"
+        api_headers = {
+            "accept":"application/xml"
+        }
+
+        parser = ActiveListStream(sso)
 
-                try:
+        # Parsing is interleaved with the download, so its time is summed
+        # over the chunks and the request time includes it
+        received = 0
+        parse_time = 0.0
+
+        try:
+            with METRICS.span("http_request_seconds", endpoint="ActiveList"):
+                async with self.transport.get(api_url, headers=api_headers, auth=self.auth,
+                                              read_body=False) as response:
                     response.raise_for_status()
 
-                    content = await response.text()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        received += len(chunk)
 
-                except aiohttp.ClientResponseError as err:
-                    sys.exit("Could not fulfill request. Error Code 200")
-            
-                dict_data = xmltodict.parse(content)
+                        parse_start = time.perf_counter()
+                        parser.feed(chunk)
+                        parse_time += time.perf_counter() - parse_start
 
-                json_format = json.dumps(dict_data)
+        except REQUEST_ERRORS as err:
+            raise IseRequestError("Could not fulfill request. Error Code 200") from err
 
-                res = json.loads(json_format)
+        METRICS.add("http_response_bytes_total", received, endpoint="ActiveList")
 
-        return res
+        parse_start = time.perf_counter()
+        sessions = parser.close()
+        parse_time += time.perf_counter() - parse_start
 
-    async def check_macs_in_session(self, all_session: dict, sso: str) -> list:
-        """Function to grab MACs associated with SSO given"""
+        METRICS.observe("parse_seconds", parse_time, endpoint="ActiveList")
 
-        mac_list = []
+        return sessions
 
-        for element in all_session["activeList"]["activeSession"]:
-            for key, value in element.items():
-                if key == 'user_name' and value == sso:
-                    mac_list.append(element["calling_station_id"])
+    async def get_active_count(self):
+        """Function to grab the number of active sessions on Ise, None if unavailable"""
 
-        ## calling-station-id is not always a MAC address, handle it here
-        ## and remove it from mac_list before being processed further
-        for mac in mac_list:
-            try:
-                macaddress.MAC(mac)
+        api_url = f"{ISE_BASE}/Session/ActiveCount"
+        api_headers = {
+            "accept":"application/xml"
+        }
 
-            except ValueError:
-                mac_list.remove(mac)
+        try:
+            with METRICS.span("http_request_seconds", endpoint="ActiveCount"):
+                async with self.transport.get(api_url, headers=api_headers, auth=self.auth) as response:
+                    response.raise_for_status()
 
-        
-        return mac_list 
+                    content = await response.read()
+
+        except REQUEST_ERRORS as err:
+            return None
+
+        METRICS.add("http_response_bytes_total", len(content), endpoint="ActiveCount")
+
+        try:
+            with METRICS.span("parse_seconds", endpoint="ActiveCount"):
+                return parse_session_count(content)
 
-    async def get_session_info(self, mac:str, session) -> dict:
+        except (ElementTree.ParseError, TypeError, ValueError):
+            return None
+
+    async def get_sessions_by_username(self, sso: str):
         """
-        Function to grab session info for each mac associated with the given SSO
-        Checks if there is failures for each record for the MAC
-        if yes, query failure_db for code, cause, resolution
-        also extract important info such as timestamp for each session, posture,
-        connection type, authentication method, authorisation policy, authentication_policy,
-        endpoint profile. Each session for a given MAC is indexed in the dictionary with 
-        the last 4 characters of the timestamp as a session id.
+        Function to grab the sessions of a single user from the per-user MnT
+        endpoint. Returns an empty list if ISE has no session for the user
+        and None if the endpoint could not be used
         """
 
-        api_url = f"{ISE_BASE}/AuthStatus/MACAddress/{mac}/86400/0/All"
-
+        api_url = f"{ISE_BASE}/Session/UserName/{quote(sso, safe='')}"
         api_headers = {
-            'accept':'application/xml'
+            "accept":"application/xml"
         }
 
-        data_found = {}
-        
-        async with session.get(api_url, headers=api_headers, auth=aiohttp.BasicAuth(self.iseuser, self.isepass), ssl=False) as query_resp:
+        try:
+            with METRICS.span("http_request_seconds", endpoint="UserName"):
+                async with self.transport.get(api_url, headers=api_headers, auth=self.auth) as response:
 
-            try:
-                query_resp.raise_for_status()
-                content = await query_resp.text()
+                    if response.status == 404:
+                        return []
 
-            except aiohttp.ClientResponse as err:
-                print("Could not fulfill request. Error Code 100")
-                return data_found
-            
-        dict_data = xmltodict.parse(content)
+                    response.raise_for_status()
 
-        json_format = json.dumps(dict_data)
+                    content = await response.read()
 
-        res = json.loads(json_format)
-        
-        if res["authStatusOutputList"]["authStatusList"]["authStatusElements"]:
-            
-            for element in res["authStatusOutputList"]["authStatusList"]["authStatusElements"]:
-                
-                failure_list = []
+        except REQUEST_ERRORS as err:
+            return None
 
-                try:
-                    post_status = element["posture_status"]
+        METRICS.add("http_response_bytes_total", len(content), endpoint="UserName")
 
-                except KeyError:
-                    post_status = "null"
+        try:
+            with METRICS.span("parse_seconds", endpoint="UserName"):
+                return parse_user_sessions(content, sso)
 
-                except TypeError:
-                    post_status = "null"
+        except ElementTree.ParseError:
+            return None
 
-                try:
-                    identity_group = element["identity_group"]
+    async def find_user_sessions(self, sso: str) -> list:
+        """
+        Function to pick the cheapest way of finding the sessions for an SSO.
+        ActiveCount decides whether the whole ActiveList is small enough to
+        scan, otherwise the per-user endpoint is asked directly. The full
+        list scan is kept as the fallback if the per-user lookup fails
+        """
 
-                except KeyError:
-                    identity_group = "null"
-                
-                except TypeError:
-                    identity_group = "null"
+        active_count = await self.get_active_count()
+
+        if active_count is not None and active_count > FULL_LIST_MAX_SESSIONS:
+            user_sessions = await self.get_sessions_by_username(sso)
 
-                try:
-                    auth_method = element["authentication_method"]
+            if user_sessions is not None:
+                return user_sessions
 
-                except KeyError:
-                    auth_method = "null"
+        return await self.stream_active_sessions(sso)
 
-                except TypeError:
-                    auth_method = "null"
+    async def check_macs_in_session(self, all_session, sso: str) -> list:
+        """
+        Function to grab MACs associated with SSO given, all_session is either
+        a list of sessions or an indexed ActiveListSnapshot
+        """
 
-                try:
-                    timestamp_one = element["acs_timestamp"]
+        if isinstance(all_session, ActiveListSnapshot):
+            mac_list = all_session.macs_for_user(sso)
 
-                except KeyError:
-                    timestamp_one = "null"
+        else:
+            mac_list = [active_session.calling_station_id for active_session in all_session
+                        if active_session.user_name == sso]
 
-                except TypeError:
-                    timestamp_one = "null"
+        ## calling-station-id is not always a MAC address, handle it here
+        ## and remove it from mac_list before being processed further
+        valid_macs = []
 
-                if timestamp_one != "null":
-                    timestamp_two = timestamp_one.replace("T","  ")
+        for mac in mac_list:
+            try:
+                macaddress.MAC(mac)
 
-                try:
-                    nac_compliance = element["nac_policy_compliance"]
-                
-                except KeyError:
-                    nac_compliance = "null"
+            except ValueError:
+                continue
 
-                except TypeError:
-                    nac_compliance = "null"
+            valid_macs.append(mac)
 
-                try:
-                    other_attr = element["other_attr_string"]
+        return valid_macs
 
-                except TypeError:
-                    other_attr = "null"
+    async def get_auth_status(self, mac: str) -> list:
+        """
+        Function to grab the AuthStatus records of a MAC for the configured
+        window. With a history only the time since the newest record already
+        held is asked for, and the result is merged into the history. Every
+        record decoded is queued for the auth store, if there is one
+        """
 
-                if other_attr != "null":
-                    other_attr = other_attr.replace("=",":")
+        if self.history is None:
+            window = self.window
 
-                    other_attr = other_attr.split(":!:")
-                
-                    for info in other_attr:
-                        chk_that = "AuthorizationPolicyMatchedRule:"
+        else:
+            window = self.history.window_for(mac)
 
-                        chk_that_also = "ISEPolicySetName:"
+        api_url = f"{ISE_BASE}/AuthStatus/MACAddress/{mac}/{window}/{self.max_records}/All"
 
-                        if chk_that in info:
-                            risation_policy = info.lstrip(chk_that)
+        api_headers = {
+            'accept':'application/xml'
+        }
 
-                        if chk_that_also in info:
-                            tication_policy = info.lstrip(chk_that_also)
-                try:
-                    fail_check = element["failed"]["#text"]
+        async def fetch() -> bytes:
+            with METRICS.span("http_request_seconds", endpoint="AuthStatus"):
+                async with self.transport.get(api_url, headers=api_headers, auth=self.auth) as query_resp:
+                    query_resp.raise_for_status()
+                    content = await query_resp.read()
 
-                except TypeError:
-                    fail_check = "null"
+            METRICS.add("http_response_bytes_total", len(content), endpoint="AuthStatus")
 
-                if fail_check == "true":
-                    try:
-                        fail_details = element["failure_reason"]
-                    
-                    except KeyError:
-                        fail_details = "null"
+            return content
 
-                    if fail_details != "null":  
+        # Incremental windows change on every call, the history is their cache
+        if self.cache is None or self.history is not None:
+            content = await fetch()
 
-                        ## All failure IDs are 5-6 digits long
-                        find_id = r'^(\d{5,6})'
-                    
-                        failure_id = str(re.findall(find_id, fail_details)).strip("[").strip("]").strip("'")
+        else:
+            content = await self.cache.fetch("auth_status", (api_url,), fetch)
 
-                        conn = sqlite3.connect(DB_PATH)
+        with METRICS.span("parse_seconds", endpoint="AuthStatus"):
+            auth_records = await self.parse(AuthStatusStream, content)
 
-                        c = conn.cursor()
+        if self.store is not None:
+            self.store.add_auth(mac, auth_records)
 
-                        c.execute(f"SELECT code, cause, resolution from failures where id = {failure_id}")
+            try:
+                await self.store.write()
 
-                        for info in c.fetchall():
-                            failure_list.append(info)
+            except sqlite3.Error as err:
+                print(f"Could not record the auth records looked up: {err}", file=sys.stderr)
 
-                        c.close()
-                        conn.close()
+        if self.history is None:
+            return auth_records
 
-                if timestamp_one != "null":
-                    dict_key = timestamp_one[-4:]
+        return self.history.merge(mac, auth_records)
 
-                else:
-                    letters = string.ascii_letters
+    async def get_session_info(self, mac:str) -> MacSessions:
+        """
+        Function to grab session info for each mac associated with the given SSO
+        Checks if there is failures for each record for the MAC
+        if yes, query failure_db for code, cause, resolution
+        also extract important info such as timestamp for each session, posture,
+        connection type, authentication method, authorisation policy, authentication_policy,
+        endpoint profile. Each session for a given MAC is an AuthEvent keyed by
+        its full ACS timestamp, see records.session_key
+        """
 
-                    digits = string.digits
+        try:
+            auth_records = await self.get_auth_status(mac)
 
-                    char_set = letters + digits
+        except REQUEST_ERRORS as err:
+            print("Could not fulfill request. Error Code 100", file=sys.stderr)
+            return MacSessions(failed=True)
 
-                    dict_key = ''.join(random.choice(char_set) for i in range(4))
-                
-                data_found[dict_key] = {}
+        data_found = MacSessions()
 
-                if timestamp_one != "null":
-                    data_found[dict_key]["timestamp"] = timestamp_two
-                else:
-                    data_found[dict_key]["timestamp"] = timestamp_one
+        for element in auth_records:
 
-                data_found[dict_key]["authentication_method"] = auth_method
-                data_found[dict_key]["posture_status"] = post_status
-                data_found[dict_key]["failures"] = failure_list
-                data_found[dict_key]["identity_group"] =  identity_group
+            failure_list = ()
 
-                if other_attr != "null":
-                    data_found[dict_key]["authorisation_policy"] = risation_policy
-                    data_found[dict_key]["authentication_policy"] = tication_policy
-                else:
-                    data_found[dict_key]["authorisation_policy"] = "null"
-                    data_found[dict_key]["authentication_policy"] = "null"
+            risation_policy, tication_policy = matched_policies(element.other_attr_string)
 
-                data_found[dict_key]["nac_compliance"] = nac_compliance
+            if element.failed and element.failure_reason:
+                with METRICS.span("failure_lookup_seconds"):
+                    failure_list = tuple(self.failures.lookup(element.failure_reason))
 
-            return data_found
+            data_found.add(AuthEvent(
+                session_key(element),
+                timestamp=element.acs_timestamp,
+                authentication_method=element.authentication_method,
+                posture_status=element.posture_status,
+                failures=failure_list,
+                identity_group=element.identity_group,
+                authorisation_policy=risation_policy,
+                authentication_policy=tication_policy,
+                nac_compliance=element.nac_policy_compliance
+            ))
 
-        else:
-            pass
+        return data_found
         
 class DnaApiController():
     """Class to make API calls to DNAC"""
 
-    def __init__(self, d_uname, d_pass):
+    def __init__(self, d_uname, d_pass, transport, cache=None, store=None):
         self.d_uname = d_uname
         self.d_pass = d_pass
+        self.transport = transport
+        self.cache = cache
+        self.store = store
+        self.tokens = TokenManager(self.get_token, DNA_TOKEN_CACHE, f, identity=f"{DNAC_BASE}|{d_uname}")
     
     async def get_token(self) -> str:
         """ Function: Get token to be used for DNAC API Calls"""
         
         api = '/dna/system/api/v1/auth/token'
 
-        token = requests.post(
-            DNAC_BASE + api,
-            auth=HTTPBasicAuth(
-            username = self.d_uname,
-            password = self.d_pass
-            ),
-            headers={'content-type': 'application/json'},
-            verify=False,
-        )
+        with METRICS.span("http_request_seconds", endpoint="auth/token"):
+            async with self.transport.post(
+                DNAC_BASE + api,
+                auth=aiohttp.BasicAuth(self.d_uname, self.d_pass),
+                headers={'content-type': 'application/json'}
+            ) as token:
 
-        dna_token = token.json()
+                # Bad credentials or a DNAC error come back without a Token
+                token.raise_for_status()
+
+                dna_token = await token.json()
 
         return dna_token["Token"]
 
-    async def client_details(self, token:str, sso:str) -> list:
+    async def intent_get(self, api_url: str, api_headers: dict, params: dict = None, endpoint: str = None):
+        """
+        Function: GET a DNAC intent API with the current token. A 401 means
+        DNAC rejected the token, so it is refreshed once and the call retried.
+        With endpoint given the response is served from the response cache
+        under that endpoint's TTL
+        """
+
+        label = endpoint or urlsplit(api_url).path.rsplit("/", 1)[-1]
+
+        async def fetch() -> bytes:
+            token = await self.tokens.get()
+
+            for attempt in range(2):
+                api_headers['X-Auth-Token'] = token
+
+                with METRICS.span("http_request_seconds", endpoint=label):
+                    async with self.transport.get(api_url, params=params, headers=api_headers) as response:
+                        rejected = response.status == 401 and attempt == 0
+
+                        if not rejected:
+                            response.raise_for_status()
+
+                            content = await response.read()
+
+                # Refreshed once the call has given its slot back, the token
+                # request needs a slot on the same host
+                if rejected:
+                    token = await self.tokens.refresh(token)
+                    continue
+
+                METRICS.add("http_response_bytes_total", len(content), endpoint=label)
+
+                return content
+
+        if endpoint is None or self.cache is None:
+            content = await fetch()
+
+        else:
+            call = (api_url, api_headers.get('entity_value'), json.dumps(params, sort_keys=True))
+            content = await self.cache.fetch(endpoint, call, fetch)
+
+        with METRICS.span("parse_seconds", endpoint=label):
+            return json.loads(content)
+
+    async def client_details(self, sso:str) -> list:
         """Initial Function to obtain MAC address of device connected to wireless"""
 
         api = "/dna/intent/api/v1/user-enrichment-details"
@@ -345,7 +536,6 @@ class DnaApiController():
         api_url = DNAC_BASE + api
 
         api_headers = {
-            'X-Auth-Token': token,
             'content-type': 'application/json',
             'accept': 'application/json',
             'entity_type': 'network_user_id',
@@ -354,74 +544,84 @@ class DnaApiController():
 
         wireless_macs = []
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(api_url, headers=api_headers, ssl=False) as response:
-
-                try:
-                    response.raise_for_status()
-                    info_back = await response.json()
+        try:
+            info_back = await self.intent_get(api_url, api_headers, endpoint="user_details")
 
-                except aiohttp.ClientResponse as err:
-                    return wireless_macs
+        except REQUEST_ERRORS as err:
+            return wireless_macs
                 
         try:
             wireless_mac = info_back[0]["userDetails"]["hostMac"]
             wireless_macs.append(wireless_mac)
 
-        except KeyError:
+        except (IndexError, KeyError, TypeError):
             pass
 
         return wireless_macs
 
-    async def client_health(self, token:str, mac:str, session) -> dict:
+    async def client_health(self, mac:str):
         """
-        Function: API call to get general user info from inputted MAC
+        Function: API call to get general user info from inputted MAC,
+        as a ClientDetail, None if DNAC has none or LOOKUP_FAILED if DNAC
+        couldn't be asked
         """
 
         api = '/dna/intent/api/v1/client-detail'
         url = DNAC_BASE + api
         api_headers = {
-            'X-Auth-Token': token,
             'content-type': 'application/json',
             'accept': 'application/json'
         }
 
-        async with session.get(url, params={"macAddress": mac}, headers=api_headers, ssl=False) as response:
-            try:
-                response.raise_for_status()
-                info_back = await response.json()
+        try:
+            info_back = await self.intent_get(url, api_headers, {"macAddress": mac}, endpoint="client_health")
 
-            except aiohttp.ClientResponse as err:
-                info_back = ""
+        except REQUEST_ERRORS as err:
+            return LOOKUP_FAILED
 
-        return info_back
+        return decode_client_detail(info_back)
 
 
-    async def client_issues(self, token:str, mac:str, session) -> dict:
+    async def client_issues(self, mac:str):
         """
         Function: API call to retrieve client issues found on DNAC and return it
+        as ClientIssues, None if unavailable
         """
 
         api = "/dna/intent/api/v1/issues"
         
         url = DNAC_BASE + api
         api_headers = {
-            'X-Auth-Token': token,
             'content-type': 'application/json',
             'accept': 'application/json'
         }
 
-        async with session.get(url, params={"macAddress":mac}, headers=api_headers, ssl=False) as response:
+        try:
+            content = await self.intent_get(url, api_headers, {"macAddress":mac}, endpoint="client_issues")
+
+        except REQUEST_ERRORS:
+            return None
+
+        issues = decode_client_issues(content)
+
+        if self.store is not None and issues is not None:
+            self.store.add_issues(mac, issues)
 
             try:
-                response.raise_for_status()
+                await self.store.write()
+
+            except sqlite3.Error as err:
+                print(f"Could not record the DNAC issues looked up: {err}", file=sys.stderr)
 
-                content = await response.json()
+        return issues
 
-            except aiohttp.ClientResponseError:
-                content = ""
+def epoch_text(epoch_ms) -> str:
+    """Function to show a DNAC epoch milliseconds time as local time, null if missing"""
 
-        return content
+    if epoch_ms is None:
+        return "null"
+
+    return str(datetime.fromtimestamp(epoch_ms / 1000))
 
 async def process_ise_data(info_gathered: dict) -> None:
     """Function to process ise data and display
@@ -430,296 +630,613 @@ async def process_ise_data(info_gathered: dict) -> None:
     for key in info_gathered:
         print(key,"\n","="*20,"\n")
 
-        if len(info_gathered[key]) == 0:
+        if info_gathered[key].failed:
+            print("Could not be looked up on ISE")
+
+        elif len(info_gathered[key]) == 0:
             print("No data found")
             
         else:
-            for element in info_gathered[key]:
-                
-                log_time = info_gathered[key][element]["timestamp"]
-                post_stat = info_gathered[key][element]["posture_status"]
-                id_group = info_gathered[key][element]["identity_group"]
-                ris_policy = info_gathered[key][element]["authorisation_policy"]
-                cation_policy = info_gathered[key][element]["authentication_policy"]
-                nac_comply = info_gathered[key][element]["nac_compliance"]
-            
-                if len(info_gathered[key][element]["failures"]) != 0:
-
-                    grab_fail_details = info_gathered[key][element]["failures"][0]
-
-                    grab_details = grab_fail_details[0]
-                    
-                    print(f"Time: {log_time}")
-                    print(f"Posture Status: {post_stat}")
-                    print(f"Identity Group: {id_group}")
-                    print(f"Authorisation Policy: {ris_policy}")
-                    print(f"Authentication Policy: {cation_policy}")
-                    print(f"NAC Compliance: {nac_comply}")
-                    print(f"Failure code: {grab_details[0]}")
-                    print(f"Cause: {grab_details[1]}")
-                    print(f"Resolution {grab_details[2]}, \n")
+            for event in info_gathered[key]:
+
+                print(f"Time: {event.display_timestamp()}")
+                print(f"Posture Status: {event.posture_status or 'null'}")
+                print(f"Identity Group: {event.identity_group or 'null'}")
+                print(f"Authorisation Policy: {event.authorisation_policy or 'null'}")
+                print(f"Authentication Policy: {event.authentication_policy or 'null'}")
+                print(f"NAC Compliance: {event.nac_compliance or 'null'}")
+
+                if len(event.failures) != 0:
+                    fail_code, fail_cause, fail_resolution = event.failures[0]
+
+                    print(f"Failure code: {fail_code}")
+                    print(f"Cause: {fail_cause}")
+                    print(f"Resolution {fail_resolution}, \n")
                            
                 else:  
-                    print(f"Time: {log_time}")
-                    print(f"Posture Status: {post_stat}")
-                    print(f"Identity Group: {id_group}")
-                    print(f"Authorisation Policy: {ris_policy}")
-                    print(f"Authentication Policy: {cation_policy}")
-                    print(f"NAC Compliance: {nac_comply}")
                     print("No failures found", "\n")
 
 async def process_dna_data(dna_info: dict, issue_desc: dict) -> None:
     """Function to process dna data an display it 
     to end user"""
 
-    dnac_info = {}
     print("INFO GATHERED ON DNAC:")
-    for entry, value in dna_info.items():
+    for entry, detail in dna_info.items():
 
         print(f"{entry}\n","="*20, "\n")
 
-        if len(dna_info[entry]) == 0:
-            dnac_info[entry] = "No data found"
-    
-        else:
-            dna_id = value['detail']['id']
-            con_status = value["detail"]["connectionStatus"]
-            host_type = value["detail"]["hostType"]
-            uid = value["detail"]["userId"]
-            dnac_identifier = value["detail"]["identifier"]
-            dna_hostname = value["detail"]["hostName"]
-            host_os = value["detail"]["hostOs"]
-            host_os_ver = value["detail"]["hostVersion"]
-            host_stype = value["detail"]["subType"]
-            firm_version = value["detail"]["firmwareVersion"]
-            dev_vendor = value["detail"]["deviceVendor"]
-
-            last_update = value["detail"]["lastUpdated"]
-
-            last_update = last_update / 1000
-            last_update = datetime.fromtimestamp(last_update)
-
-            last_update = str(last_update)
-
-            health_info = value["detail"]["healthScore"]
-            host_mac = value["detail"]["hostMac"]
-            host_ipv4 = value["detail"]["hostIpV4"]
-            auth_type = value["detail"]["authType"]
-            ssid = value["detail"]["ssid"]
-            region = value["detail"]["location"]
-            client_conn_device = value["detail"]["clientConnection"]
-            issues_user = value["detail"]["issueCount"]
-            try:
-                auth_done_time = value["detail"]["authDoneTime"]
+        if detail is None:
+            print("No data found\n")
+            continue
+
+        if detail is LOOKUP_FAILED:
+            print("Could not be looked up on DNAC\n")
+            continue
+
+        print(f"Identifier on DNA: {detail.id}")
+        print(f"Connection Status: {detail.connection_status}")
+        print(f"Host Type: {detail.host_type}")
+        print(f"User ID: {detail.user_id}")
+        print(f"Identifier: {detail.identifier}")
+        print(f"Device Hostname: {detail.host_name}")
+        print("Device Details:\n","="*10)
+        print(f"Host OS: {detail.host_os}, Version: {detail.host_version}")
+        print(f"Host SubType: {detail.sub_type}, Firmware Version: {detail.firmware_version}")
+        print(f"Device Vendor: {detail.device_vendor}\n","="*10)
+        print(f"Last Updated: {epoch_text(detail.last_updated)}")
+
+        print("Health Info:\n", "="*10)
+        for info in detail.health_score or ():
+            for key, value in info.items():
+                print(f"{key}: {value}")
+        print("="*10)
+
+        print(f"Host MAC Address: {detail.host_mac}")
+        print(f"Host IPv4 Address: {detail.host_ip_v4}")
+        print(f"Authentication Type: {detail.auth_type}")
+        print(f"SSID: {detail.ssid}")
+        print(f"Region: {detail.location}")
+        print(f"Client Connected Device: {detail.client_connection}")
+        print(f"Detected Issues: {detail.issue_count}")
+        print(f"Authentication Done Time: {detail.auth_done_time or 'null'}")
+        print(f"Onboarding Time: {epoch_text(detail.onboarding_time)}")
+        print(f"Connection Info: {detail.connection_info or 'null'}\n")
+            
+    print("Issues found on DNAC:")
+    for key, found in issue_desc.items():
+        print(f"{key}\n","="*20, "\n")
+
+        if found is None:
+            continue
+
+        print(f"Version: {found.version}")
+        print(f"Total Count: {found.total_count}")
+        print("Details:")
+
+        for issue in found.issues:
+            for name, value in issue.to_api().items():
+                if name == "last_occurence_time":
+                    value = epoch_text(value)
+
+                print(f"{name}: {value}")
+
+def process_sweep_data(summary: dict, failures) -> None:
+    """Function to display the result of a sweep to the end user"""
+
+    print("SWEEP OF ACTIVE SESSIONS")
+    print("="*24)
+    print(f"MACs looked up: {summary['macs']} ({summary['macs_unreachable']} could not be looked up)")
+    print(f"MACs with failures: {summary['macs_failing']}")
+    print(f"Auth records: {summary['records']}, failures: {summary['failures']}\n")
+
+    print("Top failure ids:")
+    for entry in summary["failure_ids"]:
+        found = failures.lookup(entry["reason"]) if entry["reason"] else []
+        cause = found[0][1] if found else "null"
+        print(f"{entry['failures']:>8}  {entry['reason'] or 'null'}")
+        print(f"{'':>8}  Cause: {cause}")
+
+    for title, key in [("Top identity groups", "identity_groups"),
+                       ("Top authorisation policies", "authorisation_policies"),
+                       ("Top users", "users"),
+                       ("Top MACs", "macs_most_failing")]:
+        print(f"\n{title}:")
+        for entry in summary[key]:
+            print(f"{entry['failures']:>8}  {entry['name'] or 'null'}")
+
+    print("\nFailure rate per hour:")
+    for entry in summary["hours"]:
+        hour = "unknown" if entry["hour"] is None else datetime.fromtimestamp(entry["hour"]).strftime("%Y-%m-%d %H:00")
+        print(f"{hour:>16}  {entry['failures']:>7}/{entry['records']:<7} {entry['failure_rate']:>7.1%}")
+    print()
+
+def help_user() -> None:
+    banner = "HOW TO USE THIS SCRIPT"
+    print(banner)
+    print("="*len(banner))
+    print("Please input a username as an argument to the script.")
+    print("e.g. python3 main.py foobar")
+    print("To look up many users at once, pass a file with one username per line")
+    print("(or - to read them from stdin) to --batch")
+    print("e.g. python3 main.py --batch users.txt")
+    print("To see which users and MACs are failing across every active session, use --sweep")
+    print("e.g. python3 main.py --sweep")
+
+def parse_args() -> argparse.Namespace:
+    """Function to parse the command line arguments"""
+
+    parser = argparse.ArgumentParser(description="Debug user connectivity using Cisco ISE and DNAC")
+    parser.add_argument("sso", nargs="?", help="username to look up")
+    parser.add_argument("--batch", metavar="FILE", help="file with one username per line, - for stdin")
+    parser.add_argument("--concurrency", type=int,
+                        help=f"users looked up at the same time in batch mode (default {BATCH_CONCURRENCY}), "
+                             f"MACs in sweep mode (default {SWEEP_CONCURRENCY})")
+    parser.add_argument("--window", type=int, metavar="SECONDS",
+                        help=f"seconds of ISE auth records to look at per MAC "
+                             f"(default {AUTH_WINDOW}, {SWEEP_WINDOW} with --sweep)")
+    parser.add_argument("--max-records", type=int, default=AUTH_MAX_RECORDS, metavar="N",
+                        help="most ISE auth records to look at per MAC, 0 for all (default)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only download ISE auth records newer than the ones kept from earlier runs")
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+                        help="keep polling every SECONDS and print only what changed")
+    parser.add_argument("--sweep", action="store_true",
+                        help="look up every active MAC on ISE and report the most common failures")
+    parser.add_argument("--sweep-rate", type=float, default=SWEEP_RATE, metavar="N",
+                        help=f"most ISE AuthStatus calls a second while sweeping (default {SWEEP_RATE})")
+    parser.add_argument("--top", type=int, default=SWEEP_TOP, metavar="N",
+                        help=f"entries listed per ranking in sweep mode (default {SWEEP_TOP})")
+    parser.add_argument("--no-store", action="store_true",
+                        help="don't record the auth records and DNAC issues looked up in auth_store.db")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="ask ISE and DNAC for everything instead of using cached responses and sessions")
+    parser.add_argument("--output", choices=("text", "ndjson", "json"), default="text",
+                        help="text for people (default), ndjson for one line per lookup as it finishes, "
+                             "json for a single document at the end")
+    parser.add_argument("--parse-pool", choices=POOL_KINDS, default="thread",
+                        help="where large ISE responses are decoded, off the event loop by default (thread)")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS, metavar="N",
+                        help=f"workers decoding large ISE responses (default {PARSE_WORKERS})")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the time taken by every API call, parse and stage at the end")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write the timings in the Prometheus text format to FILE at the end "
+                             "(after every poll in watch mode)")
+
+    args = parser.parse_args()
+
+    if args.watch is not None and args.output != "text":
+        parser.error("--watch only prints text")
+
+    if args.sweep and (args.sso is not None or args.batch is not None or args.watch is not None):
+        parser.error("--sweep looks at every active session, it can't be given users or --watch")
+
+    if args.window is None:
+        args.window = SWEEP_WINDOW if args.sweep else AUTH_WINDOW
+
+    if args.concurrency is None:
+        args.concurrency = SWEEP_CONCURRENCY if args.sweep else BATCH_CONCURRENCY
+
+    return args
+
+def read_users(source: str) -> list:
+    """Function to read usernames for batch mode, skipping blanks, comments and repeats"""
+
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+
+    else:
+        with open(source) as user_file:
+            lines = user_file.read().splitlines()
+
+    users = []
+
+    for line in lines:
+        user_sso = line.strip()
+
+        if user_sso and not user_sso.startswith("#") and user_sso not in users:
+            users.append(user_sso)
+
+    return users
+
+async def gather_user(user_sso: str, ise_api, dna_api_ob, active_list, on_result=None) -> tuple:
+    """
+    Function to gather everything ISE and DNAC know about one SSO. active_list
+    is the shared ActiveList data, or None to look the user's sessions up
+    individually. Returns the ISE data per MAC as MacSessions, and the DNAC
+    ClientDetail and ClientIssues per MAC (both None when the user has no
+    wireless MAC on DNAC). build_api_out turns them into JSON.
+    The ISE and DNAC sides run independently and each MAC's lookups start
+    as soon as the MAC is known. With on_result, on_result(key, result) is
+    called as each lookup finishes, nothing is kept and None is returned
+    """
+
+    graph = TaskGraph(on_result)
+
+    async def find_macs() -> list:
+        user_sessions = active_list
+
+        if user_sessions is None:
+            user_sessions = await ise_api.find_user_sessions(user_sso)
+
+        return await ise_api.check_macs_in_session(user_sessions, user_sso)
+
+    ## Check each MACs for failures, retrieve posture status of each, etc
+    def start_ise(macs_to_check: list) -> None:
+        for mac in macs_to_check:
+            graph.start(("ise", mac), ise_api.get_session_info(mac))
+
+    def start_dnac(wireless_mac_check: list) -> None:
+        for mac in wireless_mac_check:
+            graph.start(("dnac_health", mac), dna_api_ob.client_health(mac))
+            graph.start(("dnac_issues", mac), dna_api_ob.client_issues(mac))
+
+    # Retrieve all macs related to SSO
+    graph.start(("ise_macs", user_sso), find_macs(), then=start_ise)
+    graph.start(("dnac_macs", user_sso), dna_api_ob.client_details(user_sso), then=start_dnac)
+
+    results = await graph.wait()
+
+    if on_result is not None:
+        return None
+
+    macs_to_check = results[("ise_macs", user_sso)]
+    wireless_mac_check = results[("dnac_macs", user_sso)]
+
+    data_gathered = {mac: results[("ise", mac)] for mac in macs_to_check}
+
+    if len(wireless_mac_check) == 0:
+        return data_gathered, None, None
+
+    dna_health = {mac: results[("dnac_health", mac)] for mac in wireless_mac_check}
+    dna_issues = {mac: results[("dnac_issues", mac)] for mac in wireless_mac_check}
+
+    return data_gathered, dna_health, dna_issues
+
+def build_api_out(data_gathered: dict, dna_health: dict, dna_issues: dict) -> dict:
+    """Function to put the data gathered for one SSO in the api_out shape"""
+
+    api_out = {}
+
+    api_out["ise_information"] = to_api(data_gathered)
 
-            except KeyError:
-                auth_done_time = "null"
+    if dna_health is not None:
+        api_out["dnac_information"] = {
+            mac: {"health": to_api(dna_health[mac]), "issues": to_api(dna_issues[mac])} for mac in dna_health
+        }
+
+    return api_out
+
+async def report_user(data_gathered: dict, dna_health: dict, dna_issues: dict) -> dict:
+    """Function to display the data gathered for one SSO and build its api_out"""
 
-            onboard_time = value["detail"]["onboardingTime"]
+    await process_ise_data(data_gathered)
 
-            onboard_time = onboard_time / 1000
+    if dna_health is not None:
+        await process_dna_data(dna_health, dna_issues)
 
-            onboard_time =  datetime.fromtimestamp(onboard_time)
+    return build_api_out(data_gathered, dna_health, dna_issues)
 
-            onboard_time = str(onboard_time)
+async def watch_users(users: list, ise_api, dna_api_ob, active_cache, interval: float,
+                      concurrency: int, auth_history, metrics_path: str = None) -> None:
+    """
+    Function to keep polling the given users every interval seconds, give
+    or take WATCH_JITTER. The first poll of a user is displayed in full,
+    after that only what changed is printed. Runs until interrupted. With a
+    metrics_path the timings are written there after every poll
+    """
 
+    watches = {user_sso: UserWatch(user_sso) for user_sso in users}
+    limiter = asyncio.Semaphore(max(1, concurrency))
+    active_list = None
+
+    async def poll(user_sso: str) -> tuple:
+        async with limiter:
             try:
-                con_info = value["detail"]["connectionInfo"]
-            except KeyError:
-                con_info = "null"
-   
-            print(f"Identifier on DNA: {dna_id}")
-            print(f"Connection Status: {con_status}")
-            print(f"Host Type: {host_type}")
-            print(f"User ID: {uid}")
-            print(f"Identifier: {dnac_identifier}")
-            print(f"Device Hostname: {dna_hostname}")
-            print("Device Details:\n","="*10)
-            print(f"Host OS: {host_os}, Version: {host_os_ver}")
-            print(f"Host SubType: {host_stype}, Firmware Version: {firm_version}")
-            print(f"Device Vendor: {dev_vendor}\n","="*10)
-            print(f"Last Updated: {last_update}")
-
-            print("Health Info:\n", "="*10)
-            for info in health_info:
-                for key, value in info.items():
-                    print(f"{key}: {value}")
-            print("="*10)
-
-            print(f"Host MAC Address: {host_mac}")
-            print(f"Host IPv4 Address: {host_ipv4}")
-            print(f"Authentication Type: {auth_type}")
-            print(f"SSID: {ssid}")
-            print(f"Region: {region}")
-            print(f"Client Connected Device: {client_conn_device}")
-            print(f"Detected Issues: {issues_user}")
-            print(f"Authentication Done Time: {auth_done_time}")
-            print(f"Onboarding Time: {onboard_time}")
-            print(f"Connection Info: {con_info}\n")
-            
-    print("Issues found on DNAC:")
-    for key, value in issue_desc.items():
-        print(f"{key}\n","="*20, "\n")
+                with METRICS.span("stage_seconds", stage="user"):
+                    return user_sso, await gather_user(user_sso, ise_api, dna_api_ob, active_list)
 
-        if len(issue_desc[key]) != 0:
+            # A failed poll is reported and retried next time round
+            except (*REQUEST_ERRORS, IseRequestError) as err:
+                return user_sso, err
 
-            version = value["version"]
-            total_c = value["totalCount"]
-            resp = value["response"]
+    while True:
+        # Each user's sessions are looked up directly unless another run has
+        # left a snapshot fresh enough for this poll
+        if active_cache is not None:
+            active_list = active_cache.peek()
 
-            if len(resp) != 0:
-                resp = str(resp)
+        polled_at = datetime.now().strftime("%H:%M:%S")
 
-                resp = resp.split(",")
-                
-                for index, val in enumerate(resp):
-                    if val.startswith(" 'last_occurence_time'"):
+        for next_done in asyncio.as_completed([poll(user_sso) for user_sso in users]):
+            user_sso, gathered = await next_done
 
-                        last_occ = val
+            if isinstance(gathered, Exception):
+                print(f"[{polled_at}] {user_sso}: poll failed: {gathered}")
+                continue
 
-                        last_occ_index = index
+            data_gathered, dna_health, dna_issues = gathered
 
-                last_occ = last_occ.lstrip(" 'last_occurence_time':")
+            watch = watches[user_sso]
 
-                last_occ = last_occ.strip("}").strip("]").strip("}")
+            if watch.last_hash is None:
+                print(f"USER: {user_sso}\n", "#"*40, "\n")
+                await report_user(data_gathered, dna_health, dna_issues)
 
-                last_occ = int(last_occ)
+            for change in watch.update(data_gathered, dna_health):
+                print(f"[{polled_at}] {user_sso} {change}")
 
-                last_occ = last_occ / 1000
+        if auth_history is not None:
+            auth_history.save()
 
-                last_occ_utc = datetime.fromtimestamp(last_occ)
+        if ise_api.store is not None:
+            try:
+                await ise_api.store.write(force=True)
+                await ise_api.store.run(ise_api.store.compact)
 
-                last_occ_utc = str(last_occ_utc)
+            except sqlite3.Error as err:
+                print(f"Could not write to {AUTH_STORE}: {err}", file=sys.stderr)
 
-                resp.pop(last_occ_index)
-                
-                resp.append(f"last_occurence_time: {last_occ_utc}")
+        if metrics_path is not None:
+            METRICS.write(metrics_path)
 
-                resp.pop(3)
+        await asyncio.sleep(interval * random.uniform(1 - WATCH_JITTER, 1 + WATCH_JITTER))
 
-            print(f"Version: {version}")
-            print(f"Total Count: {total_c}")
-            print("Details:")
-    
+async def sweep_sessions(ise_api, active_list, concurrency: int, progress=None) -> SweepReport:
+    """
+    Function to look every valid MAC in the active sessions up on ISE and
+    fold the results into a SweepReport. A fixed set of concurrency workers
+    share one queue of MACs, so tens of thousands of sessions never turn
+    into tens of thousands of tasks. progress, if given, is a stream a line
+    is written to every SWEEP_PROGRESS MACs
+    """
 
-            for item in resp:
-                if type(item) == str:
-                    item = item.strip(" ").strip("[").strip("{")
-                print(item)
+    if not isinstance(active_list, ActiveListSnapshot):
+        active_list = ActiveListSnapshot.from_sessions(active_list)
 
-def help_user() -> None:
-    banner = "HOW TO USE THIS SCRIPT"
-    print(banner)
-    print("="*len(banner))
-    print("Please input a username as an argument to the script.")
-    print("e.g. python3 main.py foobar")
+    targets = sweep_targets(active_list)
+    pending = iter(targets)
+    report = SweepReport()
+
+    async def worker() -> None:
+        for mac, user_name in pending:
+            try:
+                with METRICS.span("stage_seconds", stage="sweep"):
+                    auth_records = await ise_api.get_auth_status(mac)
+
+            except REQUEST_ERRORS:
+                report.add_error(mac)
+
+            else:
+                report.add(mac, user_name, auth_records)
+
+            done = report.macs + report.macs_unreachable
+
+            if progress is not None and done % SWEEP_PROGRESS == 0:
+                print(f"Swept {done}/{len(targets)} MACs", file=progress)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+    return report
 
 async def main():
     """main function"""
 
     start = time.time()
 
-    if len(sys.argv) == 1:
+    args = parse_args()
+
+    if args.sso is None and args.batch is None and not args.sweep:
         help_user()
         sys.exit()
 
+    backend_policies = BACKEND_POLICIES
+
+    if args.sweep:
+        users = []
+
+        # Spread the sweep's AuthStatus calls out on top of the usual policy
+        ise_host = urlsplit(ISE_BASE).netloc
+        backend_policies = dict(BACKEND_POLICIES)
+        backend_policies[ise_host] = replace(BACKEND_POLICIES[ise_host], rate=args.sweep_rate,
+                                             burst=max(1, int(args.sweep_rate)))
+
+    elif args.batch is not None:
+        users = read_users(args.batch)
+
     else:
-        user_sso = sys.argv[1]
+        users = [args.sso]
 
-    # Create ISE object
-    ise_api = IseApiController(configured_ise_user, configured_ise_pwd)
+    async with Transport(backend_policies) as transport:
 
-    # Create DNA object
-    dna_api_ob = DnaApiController(configured_dna_user, configured_dna_pwd)
+        # Failure codes, causes and resolutions are mapped or read once
+        failure_catalog = FailureCatalog(DB_PATH, FAILURE_SNAPSHOT)
+        failure_catalog.load()
 
-    t1 = asyncio.create_task(ise_api.get_active_sessions())
-    t2 = asyncio.create_task(dna_api_ob.get_token())
+        # Repeat lookups are answered from disk unless asked not to, watch
+        # mode needs a fresh answer on every poll and a sweep would only
+        # push every user's cached answers out
+        if args.no_cache or args.watch is not None or args.sweep:
+            response_cache = None
 
-    await asyncio.gather(t1, t2)
+        else:
+            response_cache = ResponseCache(RESPONSE_CACHE, RESPONSE_TTLS)
 
-    active_list = await t1
-    token_dna = await t2
-    
-    # Retrieve all macs related to SSO
-    t3 = asyncio.create_task(ise_api.check_macs_in_session(active_list, user_sso))
-    t4 = asyncio.create_task(dna_api_ob.client_details(token_dna, user_sso))
+        # Auth records kept from earlier runs (or polls), only the time since
+        # is downloaded
+        if args.incremental or args.watch is not None:
+            auth_history = AuthHistory(AUTH_HISTORY, args.window, args.max_records)
+            auth_history.load()
 
-    await asyncio.gather(t3, t4)
+        else:
+            auth_history = None
 
-    macs_to_check = await t3
-    wireless_mac_check = await t4
+        # Large ActiveList and AuthStatus bodies are decoded off the event
+        # loop so other lookups keep moving meanwhile
+        parse_pool = ParsePool(args.parse_pool, args.parse_workers)
 
-    data_gathered = {}
+        auth_store = None if args.no_store else AuthStore(AUTH_STORE)
 
-    ## Check each MACs for failures, retrieve posture status of each, etc
+        # Create ISE object
+        ise_api = IseApiController(configured_ise_user, configured_ise_pwd, transport, failure_catalog,
+                                   response_cache, args.window, args.max_records, auth_history, parse_pool,
+                                   auth_store)
 
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for mac in macs_to_check:
-            task = asyncio.create_task(ise_api.get_session_info(mac, session))
-            tasks.append(task)
+        # Create DNA object
+        dna_api_ob = DnaApiController(configured_dna_user, configured_dna_pwd, transport, response_cache,
+                                      auth_store)
 
-        data = await asyncio.gather(*tasks)
+        # Warm the DNAC token while the ActiveList is fetched, a sweep only
+        # asks ISE
+        t2 = None if args.sweep else asyncio.create_task(dna_api_ob.tokens.get())
 
-    for i, mac in enumerate(macs_to_check):
-        data_gathered[mac] = data[i]
+        # Data shared by every user is fetched once up front. A single user,
+        # or a watch, only needs their own sessions (find_user_sessions), so
+        # the full list is never downloaded for them, a snapshot still within
+        # its TTL that another run left behind is used if there is one
+        active_cache = None
+        active_list = None
 
-    if len(wireless_mac_check) != 0:
+        shares_list = args.sweep or (args.batch is not None and args.watch is None)
 
-        t4 = asyncio.create_task(process_ise_data(data_gathered))
+        if ACTIVE_LIST_TTL > 0 and not args.no_cache:
+            active_list_ttl = ACTIVE_LIST_TTL
 
-        async with aiohttp.ClientSession() as session:
-            tasks = []
+            # Watching has to notice new sessions within a poll or so
+            if args.watch is not None:
+                active_list_ttl = min(ACTIVE_LIST_TTL, args.watch)
 
-            for mac in wireless_mac_check:
-                task = asyncio.create_task(dna_api_ob.client_health(token_dna, mac, session))
-                tasks.append(task)
+            active_cache = ActiveListCache(ACTIVE_LIST_CACHE, active_list_ttl, ise_api.get_active_sessions)
 
-            dna_data = await asyncio.gather(*tasks)
+            if shares_list:
+                with METRICS.span("stage_seconds", stage="active_list"):
+                    active_list = await active_cache.get()
 
-        dna_health = {}
+            else:
+                active_list = active_cache.peek()
 
-        for i, mac in enumerate(wireless_mac_check):
-            dna_health[mac] = dna_data[i]
+        elif shares_list:
+            with METRICS.span("stage_seconds", stage="active_list"):
+                active_list = await ise_api.get_active_sessions()
 
-        async with aiohttp.ClientSession() as session:
-            tasks = []
+        # Without a token the DNAC lookups ask again and report nothing found
+        if t2 is not None:
+            try:
+                await t2
 
-            for mac in wireless_mac_check:
-                task = asyncio.create_task(dna_api_ob.client_issues(token_dna, mac, session))
-                tasks.append(task)
+            except REQUEST_ERRORS as err:
+                print(f"Could not get a DNAC token: {err}", file=sys.stderr)
 
-            dna_issues_data = await asyncio.gather(*tasks)
+        if args.watch is not None:
+            await watch_users(users, ise_api, dna_api_ob, active_cache, args.watch, args.concurrency, auth_history,
+                              args.metrics)
 
-        dna_issues = {}
+        limiter = asyncio.Semaphore(max(1, args.concurrency))
 
-        for i, mac in enumerate(wireless_mac_check):
-            dna_issues[mac] = dna_issues_data[i]
-    
-        t7 = asyncio.create_task(process_dna_data(dna_health, dna_issues))
+        # NDJSON lines are written as each lookup finishes, nothing is kept
+        if args.output == "ndjson":
+            writer = NdjsonWriter()
 
-        dnac_back = await t7
+        else:
+            writer = None
 
-        api_out = {}
-        
-        api_out["ise_information"] = data_gathered
+        async def bounded_gather(user_sso: str) -> tuple:
+            on_result = None
+
+            if writer is not None:
+                on_result = lambda key, result: writer.write(ndjson_record(user_sso, key, result))
+
+            async with limiter:
+                with METRICS.span("stage_seconds", stage="user"):
+                    return user_sso, await gather_user(user_sso, ise_api, dna_api_ob, active_list, on_result)
+
+        tasks = [asyncio.create_task(bounded_gather(user_sso)) for user_sso in users]
+
+        all_out = {}
+
+        # Report each user as soon as their lookups finish
+        for next_done in asyncio.as_completed(tasks):
+            user_sso, gathered = await next_done
+
+            if writer is not None:
+                writer.write({"type": "done", "user": user_sso})
+
+            elif args.output == "json":
+                all_out[user_sso] = build_api_out(*gathered)
+
+            else:
+                if args.batch is not None:
+                    print(f"USER: {user_sso}\n", "#"*40, "\n")
+
+                all_out[user_sso] = await report_user(*gathered)
+
+        if args.sweep:
+            sweep_report = await sweep_sessions(ise_api, active_list, args.concurrency, sys.stderr)
+            all_out = sweep_report.summary(args.top)
+
+            if writer is not None:
+                writer.write({"type": "sweep", **all_out})
+
+            elif args.output == "text":
+                process_sweep_data(all_out, failure_catalog)
+
+        if writer is not None:
+            writer.flush()
+
+        # Let background refreshes land on disk before exiting
+        if active_cache is not None:
+            await active_cache.wait()
+
+        if response_cache is not None:
+            await response_cache.wait()
+
+        await dna_api_ob.tokens.wait()
+
+        if auth_history is not None:
+            auth_history.save()
+
+        failure_catalog.close()
+        parse_pool.close()
+
+        # Queued records are written, and those past the retention period dropped about once a day
+        if auth_store is not None:
+            try:
+                await auth_store.write(force=True)
+                await auth_store.run(auth_store.compact)
+
+            except sqlite3.Error as err:
+                print(f"Could not write to {AUTH_STORE}: {err}", file=sys.stderr)
+
+            auth_store.close()
+
+    if args.output == "ndjson":
+        api_out = None
+
+    elif args.batch is not None or args.sweep:
+        api_out = json.dumps(all_out, indent=4)
 
-        api_out["dnac_information"] = dnac_back
-    
     else:
-        t4 = asyncio.create_task(process_ise_data(data_gathered))
+        api_out = json.dumps(all_out[args.sso], indent=4)
 
-        await asyncio.gather(t4)
-        
-        api_out = {}
-        
-        api_out["ise_information"] = data_gathered
+    if args.output == "json":
+        print(api_out)
 
-    api_out = json.dumps(api_out, indent=4)
+    # Keep stdout to the records themselves in the machine readable modes
+    summary = sys.stdout if args.output == "text" else sys.stderr
 
     end = time.time()
     total = end - start
-    print(f"Total time taken: {total:.2f}")
+    print(f"Total time taken: {total:.2f}", file=summary)
+    print(f"Connections:\n{transport.report()}", file=summary)
+
+    if response_cache is not None:
+        print(f"Response cache: {response_cache.report()}", file=summary)
+
+    if args.profile:
+        print(f"Profile:\n{METRICS.report()}", file=summary)
+
+    if args.metrics is not None:
+        METRICS.write(args.metrics)
     
     ## api_out can be used as an API response for whatever purpose
     ## e.g. Flask application
@@ -727,4 +1244,13 @@ async def main():
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
+
+    try:
+        loop.run_until_complete(main())
+
+    except IseRequestError as err:
+        sys.exit(str(err))
+
+    except KeyboardInterrupt:
+        # The way out of watch mode
+        pass
@@ -0,0 +1,202 @@
+'''
+Timing spans, histograms and counters for main.py and service.py
+Every API call, parse and lookup stage is timed into a histogram keyed by
+metric name and labels (endpoint or stage), and bytes received are
+counted per endpoint. Histograms keep fixed buckets rather than every
+sample so a long running service uses the same memory after a million
+lookups as after one. Results are shown as a table (--profile) or
+rendered in the Prometheus text exposition format
+'''
+
+import time
+import contextlib
+from bisect import bisect_left
+from atomic_file import write_atomic
+
+METRIC_PREFIX = "ise_dnac_"
+
+# Upper bounds in seconds, the last bucket catches everything above
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+DESCRIPTIONS = {
+    "http_request_seconds": "Time from starting a request, retries and rate limit waits included, to having read its body",
+    "http_response_bytes_total": "Response body bytes received",
+    "parse_seconds": "Time spent decoding response bodies",
+    "stage_seconds": "Time taken by each stage of a lookup",
+    "failure_lookup_seconds": "Time taken to find a failure reason in the failure catalog"
+}
+
+
+class Histogram:
+    """Bucketed observations of one metric series"""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Function to add an observation"""
+
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+        if value < self.min:
+            self.min = value
+
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction: float) -> float:
+        """
+        Function to estimate a quantile, interpolating inside its bucket.
+        The estimate is kept between the smallest and largest observation,
+        with few samples the bucket bounds alone are far from either
+        """
+
+        if self.count == 0:
+            return 0.0
+
+        rank = fraction * self.count
+        seen = 0
+
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+
+                estimate = lower + (upper - lower) * (rank - seen) / bucket_count
+
+                return max(self.min, min(estimate, self.max))
+
+            seen += bucket_count
+
+        return self.max
+
+
+def label_text(labels: tuple, extra: str = "") -> str:
+    """Function to render labels as {name="value",...}"""
+
+    pairs = []
+
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metrics:
+    """Class holding every histogram and counter recorded in a process"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Function to add an observation to the histogram for name and labels"""
+
+        key = (name, tuple(sorted(labels.items())))
+
+        histogram = self.histograms.get(key)
+
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+
+        histogram.observe(value)
+
+    def add(self, name: str, amount: float = 1, **labels) -> None:
+        """Function to increase the counter for name and labels"""
+
+        key = (name, tuple(sorted(labels.items())))
+
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextlib.contextmanager
+    def span(self, name: str, **labels):
+        """Function to time the enclosed block into the histogram for name and labels"""
+
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def report(self) -> str:
+        """Function to summarise every histogram and counter as a table"""
+
+        lines = [f"{'metric':<28}{'labels':<34}{'count':>8}{'total s':>10}{'mean ms':>10}"
+                 f"{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            shown = ",".join(f"{label}={value}" for label, value in labels)
+            mean = histogram.sum / histogram.count
+
+            lines.append(f"{name:<28}{shown:<34}{histogram.count:>8}{histogram.sum:>10.3f}{mean * 1000:>10.1f}"
+                         f"{histogram.quantile(0.5) * 1000:>10.1f}{histogram.quantile(0.95) * 1000:>10.1f}"
+                         f"{histogram.max * 1000:>10.1f}")
+
+        for (name, labels), total in sorted(self.counters.items()):
+            shown = ",".join(f"{label}={value}" for label, value in labels)
+
+            lines.append(f"{name:<28}{shown:<34}{total:>8.0f}")
+
+        return "\n".join(lines)
+
+    def render(self) -> str:
+        """Function to render every metric in the Prometheus text exposition format"""
+
+        lines = []
+        described = set()
+
+        def describe(name: str, kind: str) -> None:
+            if name in described:
+                return
+
+            described.add(name)
+
+            if name in DESCRIPTIONS:
+                lines.append(f"# HELP {METRIC_PREFIX}{name} {DESCRIPTIONS[name]}")
+
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            describe(name, "histogram")
+
+            cumulative = 0
+
+            for bound, bucket_count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += bucket_count
+                bound_label = f'le="{bound}"'
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{label_text(labels, bound_label)} {cumulative}")
+
+            lines.append(f"{METRIC_PREFIX}{name}_sum{label_text(labels)} {histogram.sum}")
+            lines.append(f"{METRIC_PREFIX}{name}_count{label_text(labels)} {histogram.count}")
+
+        for (name, labels), total in sorted(self.counters.items()):
+            describe(name, "counter")
+
+            lines.append(f"{METRIC_PREFIX}{name}{label_text(labels)} {total}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Function to write the Prometheus rendering to a file, e.g. for the node exporter textfile collector"""
+
+        # Readable by the exporter, which usually runs as another user
+        write_atomic(path, self.render().encode(), 0o644)
+
+
+## Shared by everything in the process, like a Prometheus client registry
+METRICS = Metrics()
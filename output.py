@@ -0,0 +1,72 @@
+'''
+Machine readable output for main.py
+In NDJSON mode every lookup is written as one JSON line the moment it
+finishes: the MACs found for a user on ISE and DNAC, then one record per
+MAC for ISE auth data, DNAC health and DNAC issues, in whatever order
+they complete. Lines go through a small buffer that is flushed when it
+fills or shortly after the first line lands in it, so readers see results
+almost immediately without a write per line
+'''
+
+import sys
+import json
+import asyncio
+from records import to_api
+
+# Bytes buffered before they are written out
+BUFFER_SIZE = 64 * 1024
+
+# Seconds a line waits in the buffer at most
+FLUSH_AFTER = 0.1
+
+
+def ndjson_record(user_sso: str, key: tuple, result) -> dict:
+    """Function to turn a finished lookup, keyed (stage, subject) as in gather_user, into a record"""
+
+    stage, subject = key
+
+    record = {"type": stage, "user": user_sso}
+
+    if stage in ("ise_macs", "dnac_macs"):
+        record["macs"] = result
+
+    else:
+        record["mac"] = subject
+        record["data"] = to_api(result)
+
+    return record
+
+
+class NdjsonWriter:
+    """Class to write records to a binary stream, one JSON document per line"""
+
+    def __init__(self, stream=None, buffer_size: int = BUFFER_SIZE, flush_after: float = FLUSH_AFTER):
+        self.stream = stream or sys.stdout.buffer
+        self.buffer_size = buffer_size
+        self.flush_after = flush_after
+        self._buffer = bytearray()
+        self._flush_handle = None
+
+    def write(self, record: dict) -> None:
+        """Function to queue a record for writing"""
+
+        self._buffer += json.dumps(record, separators=(",", ":"), default=str).encode()
+        self._buffer += b"\n"
+
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_after, self.flush)
+
+    def flush(self) -> None:
+        """Function to write out everything buffered"""
+
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if self._buffer:
+            self.stream.write(self._buffer)
+            self.stream.flush()
+            self._buffer.clear()
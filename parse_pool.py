@@ -0,0 +1,89 @@
+'''
+Executor backed parsing stage for ISE XML bodies
+Decoding a large ActiveList or AuthStatus body takes long enough that,
+done on the event loop, every other lookup in flight stalls behind it.
+Bodies above a size threshold are handed to a worker pool instead and
+the decoded records come back to the loop when ready, so one MAC's
+history is parsed while the responses for other MACs keep arriving.
+Smaller bodies are cheaper to parse inline than to hand over.
+A process pool gives the loop the most headroom, as the parser holds the
+GIL while it works; in a thread pool the body is fed to the parser in
+chunks so the loop gets the GIL back between them
+'''
+
+import asyncio
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ise_parser import CHUNK_SIZE
+
+# Bodies up to this many bytes are parsed on the event loop
+PARSE_INLINE_MAX = 64 * 1024
+
+# Workers in the pool
+PARSE_WORKERS = 2
+
+POOL_KINDS = ("inline", "thread", "process")
+
+
+def parse_chunked(stream_type: type, content: bytes, *args) -> list:
+    """Function to decode a buffered body by feeding it to a stream parser chunk by chunk"""
+
+    parser = stream_type(*args)
+    view = memoryview(content)
+
+    for offset in range(0, len(content), CHUNK_SIZE):
+        parser.feed(view[offset:offset + CHUNK_SIZE])
+
+    return parser.close()
+
+
+def parse_whole(stream_type: type, content: bytes, *args) -> list:
+    """Function to decode a buffered body in one pass"""
+
+    return stream_type(*args).parse(content)
+
+
+class ParsePool:
+    """
+    Class to decode bodies with a RecordStream subclass, inline or in a
+    worker pool. kind is one of POOL_KINDS. Call close() when finished
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = PARSE_WORKERS, inline_max: int = PARSE_INLINE_MAX):
+        if kind not in POOL_KINDS:
+            raise ValueError(f"unknown parse pool {kind!r}, expected one of {', '.join(POOL_KINDS)}")
+
+        self.kind = kind
+        self.inline_max = inline_max
+        self.stats = {"inline": 0, "offloaded": 0}
+
+        if kind == "thread":
+            self._executor = ThreadPoolExecutor(max(1, workers), thread_name_prefix="parse")
+            self._worker = parse_chunked
+
+        elif kind == "process":
+            self._executor = ProcessPoolExecutor(max(1, workers))
+            self._worker = parse_whole
+
+        else:
+            self._executor = None
+
+    async def parse(self, stream_type: type, content: bytes, *args) -> list:
+        """Function to decode content with stream_type(*args), off the loop if it is large"""
+
+        if self._executor is None or len(content) <= self.inline_max:
+            self.stats["inline"] += 1
+            return parse_whole(stream_type, content, *args)
+
+        self.stats["offloaded"] += 1
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self._executor, functools.partial(self._worker, stream_type, content, *args))
+
+    def close(self) -> None:
+        """Function to shut the worker pool down"""
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,288 @@
+'''
+Typed records decoded from ISE MnT XML and DNAC JSON responses
+Field names of the ISE records match the XML tag names used by ISE so the
+decoders in ise_parser.py can fill them straight from the child elements.
+The lookup results built from them (AuthEvent per auth record, collected
+per MAC in MacSessions, ClientDetail and ClientIssues for DNAC) are
+slotted and only turned back into the api_out JSON shape by to_api() when
+they are written out
+'''
+
+import zlib
+from dataclasses import dataclass, fields, replace
+
+
+@dataclass(slots=True)
+class ActiveSession:
+    """One activeSession entry from Session/ActiveList"""
+
+    user_name: str = None
+    calling_station_id: str = None
+    nas_ip_address: str = None
+    acct_session_id: str = None
+    audit_session_id: str = None
+    server: str = None
+    framed_ip_address: str = None
+
+
+@dataclass(slots=True)
+class AuthStatusElement:
+    """One authStatusElements entry from AuthStatus/MACAddress"""
+
+    user_name: str = None
+    calling_station_id: str = None
+    acs_timestamp: str = None
+    authentication_method: str = None
+    posture_status: str = None
+    identity_group: str = None
+    nac_policy_compliance: str = None
+    other_attr_string: str = None
+    failed: bool = False
+    failure_reason: str = None
+
+
+@dataclass(slots=True)
+class FailureReason:
+    """One failureReason entry from FailureReasons"""
+
+    id: str = None
+    code: str = None
+    cause: str = None
+    resolution: str = None
+
+
+def field_names(record_type: type) -> frozenset:
+    """Function to return the XML tags a record type is filled from"""
+
+    return frozenset(field.name for field in fields(record_type))
+
+
+@dataclass(slots=True, frozen=True)
+class AuthEvent:
+    """
+    One ISE auth record of a MAC as shown to the user. key identifies the
+    session: the full ACS timestamp, suffixed when the MAC has several
+    records with the same timestamp. failures holds (code, cause,
+    resolution) tuples from the failure catalog
+    """
+
+    key: str
+    timestamp: str = None
+    authentication_method: str = None
+    posture_status: str = None
+    failures: tuple = ()
+    identity_group: str = None
+    authorisation_policy: str = None
+    authentication_policy: str = None
+    nac_compliance: str = None
+
+    def display_timestamp(self) -> str:
+        """Function to return the timestamp as shown to the user"""
+
+        if self.timestamp is None:
+            return "null"
+
+        return self.timestamp.replace("T", "  ")
+
+    def to_api(self) -> dict:
+        """Function to return the record in the api_out shape"""
+
+        return {
+            "timestamp": self.display_timestamp(),
+            "authentication_method": self.authentication_method or "null",
+            "posture_status": self.posture_status or "null",
+            "failures": [list(failure) for failure in self.failures],
+            "identity_group": self.identity_group or "null",
+            "authorisation_policy": self.authorisation_policy or "null",
+            "authentication_policy": self.authentication_policy or "null",
+            "nac_compliance": self.nac_compliance or "null"
+        }
+
+
+def session_key(element: AuthStatusElement) -> str:
+    """
+    Function to return the identity of an auth record, its ACS timestamp.
+    Records without one are keyed by a checksum of their contents so the
+    same record gets the same key on every run
+    """
+
+    if element.acs_timestamp:
+        return element.acs_timestamp
+
+    content = "|".join(str(getattr(element, name)) for name in element.__slots__)
+
+    return f"untimed-{zlib.crc32(content.encode()):08x}"
+
+
+class MacSessions:
+    """
+    The AuthEvents of one MAC, newest first as ISE returns them. failed
+    marks a MAC ISE couldn't be asked about, as opposed to one without
+    any records
+    """
+
+    __slots__ = ("events", "failed", "_keys")
+
+    def __init__(self, failed: bool = False):
+        self.events = []
+        self.failed = failed
+        self._keys = set()
+
+    def add(self, event: AuthEvent) -> None:
+        """Function to add an event, suffixing its key if another event already has it"""
+
+        if event.key in self._keys:
+            count = 2
+
+            while f"{event.key}#{count}" in self._keys:
+                count += 1
+
+            event = replace(event, key=f"{event.key}#{count}")
+
+        self._keys.add(event.key)
+        self.events.append(event)
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def to_api(self) -> dict:
+        """Function to return the events in the api_out shape, keyed by session"""
+
+        return {event.key: event.to_api() for event in self.events}
+
+
+class LookupFailed:
+    """
+    Result of a DNAC lookup that couldn't be made, kept apart from None
+    (DNAC has nothing on the MAC). Written out as null, like None
+    """
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "LOOKUP_FAILED"
+
+    def to_api(self):
+        """Function to return the record in the api_out shape"""
+
+        return None
+
+
+LOOKUP_FAILED = LookupFailed()
+
+
+# (attribute, key in the DNAC client-detail response) of ClientDetail
+CLIENT_DETAIL_KEYS = (
+    ("id", "id"), ("connection_status", "connectionStatus"), ("host_type", "hostType"), ("user_id", "userId"),
+    ("identifier", "identifier"), ("host_name", "hostName"), ("host_os", "hostOs"),
+    ("host_version", "hostVersion"), ("sub_type", "subType"), ("firmware_version", "firmwareVersion"),
+    ("device_vendor", "deviceVendor"), ("last_updated", "lastUpdated"), ("health_score", "healthScore"),
+    ("host_mac", "hostMac"), ("host_ip_v4", "hostIpV4"), ("auth_type", "authType"), ("ssid", "ssid"),
+    ("location", "location"), ("client_connection", "clientConnection"), ("issue_count", "issueCount"),
+    ("auth_done_time", "authDoneTime"), ("onboarding_time", "onboardingTime"),
+    ("connection_info", "connectionInfo")
+)
+
+
+@dataclass(slots=True)
+class ClientDetail:
+    """The client-detail fields DNAC reports for a wireless MAC. Times are epoch milliseconds"""
+
+    id: str = None
+    connection_status: str = None
+    host_type: str = None
+    user_id: str = None
+    identifier: str = None
+    host_name: str = None
+    host_os: str = None
+    host_version: str = None
+    sub_type: str = None
+    firmware_version: str = None
+    device_vendor: str = None
+    last_updated: int = None
+    health_score: list = None
+    host_mac: str = None
+    host_ip_v4: str = None
+    auth_type: str = None
+    ssid: str = None
+    location: str = None
+    client_connection: str = None
+    issue_count: int = None
+    auth_done_time: int = None
+    onboarding_time: int = None
+    connection_info: object = None
+
+    def health_scores(self) -> dict:
+        """Function to return {healthType: score}"""
+
+        return {score.get("healthType"): score.get("score") for score in self.health_score or ()}
+
+    def to_api(self) -> dict:
+        """Function to return the record in the shape of a client-detail response"""
+
+        return {"detail": {key: getattr(self, name) for name, key in CLIENT_DETAIL_KEYS}}
+
+
+# (attribute, key in a DNAC issues response entry) of ClientIssue
+CLIENT_ISSUE_KEYS = (
+    ("issue_id", "issueId"), ("name", "name"), ("site_id", "siteId"), ("device_id", "deviceId"),
+    ("device_role", "deviceRole"), ("ai_driven", "aiDriven"), ("client_mac", "clientMac"),
+    ("occurrence_count", "issue_occurence_count"), ("status", "status"), ("priority", "priority"),
+    ("category", "category"), ("last_occurrence_time", "last_occurence_time")
+)
+
+
+@dataclass(slots=True)
+class ClientIssue:
+    """One issue DNAC reports for a MAC. last_occurrence_time is in epoch milliseconds"""
+
+    issue_id: str = None
+    name: str = None
+    site_id: str = None
+    device_id: str = None
+    device_role: str = None
+    ai_driven: str = None
+    client_mac: str = None
+    occurrence_count: int = None
+    status: str = None
+    priority: str = None
+    category: str = None
+    last_occurrence_time: int = None
+
+    def to_api(self) -> dict:
+        """Function to return the issue as DNAC reports it"""
+
+        return {key: getattr(self, name) for name, key in CLIENT_ISSUE_KEYS}
+
+
+@dataclass(slots=True)
+class ClientIssues:
+    """The issues DNAC reports for a MAC"""
+
+    version: str = None
+    total_count: int = None
+    issues: list = None
+
+    def to_api(self) -> dict:
+        """Function to return the record in the shape of an issues response"""
+
+        return {"version": self.version, "totalCount": self.total_count,
+                "response": [issue.to_api() for issue in self.issues or ()]}
+
+
+def to_api(value):
+    """Function to turn lookup results, or dicts and lists of them, into the api_out JSON shape"""
+
+    if isinstance(value, (AuthEvent, MacSessions, ClientDetail, ClientIssue, ClientIssues, LookupFailed)):
+        return value.to_api()
+
+    if isinstance(value, dict):
+        return {key: to_api(item) for key, item in value.items()}
+
+    if isinstance(value, list):
+        return [to_api(item) for item in value]
+
+    return value
@@ -0,0 +1,210 @@
+'''
+On-disk cache of ISE AuthStatus and DNAC client responses
+Each response body is stored in its own file, named by a hash of the
+endpoint, URL, MAC and window it answers, so a repeat lookup of the same
+MAC is read from disk instead of asking ISE or DNAC again. Every endpoint
+has its own TTL, an entry past its TTL is still served for a while as a
+single refresh runs in the background, and the least recently used
+entries are removed once the cache grows past its size limit
+'''
+
+import os
+import time
+import zlib
+import struct
+import hashlib
+import asyncio
+from atomic_file import write_atomic
+
+ENTRY_MAGIC = b"RSPC"
+ENTRY_VERSION = 1
+ENTRY_HEADER = struct.Struct("=4sHd")
+
+# TTL for endpoints missing from the ttls given to the cache
+DEFAULT_TTL = 60
+
+# Seconds past its TTL an entry is still served while it is refreshed
+DEFAULT_STALE = 15 * 60
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+def cache_key(endpoint: str, *parts) -> str:
+    """Function to return the file name an endpoint response is stored under"""
+
+    hashed = hashlib.sha256("\0".join(str(part) for part in (endpoint, *parts)).encode())
+
+    return f"{endpoint}-{hashed.hexdigest()}"
+
+
+class ResponseCache:
+    """
+    Class to serve responses from the cache directory at path. ttls maps an
+    endpoint name to its TTL in seconds, stale is how long past the TTL an
+    entry is still served, max_size is the size in bytes the directory is
+    trimmed back to.
+    """
+
+    def __init__(self, path: str, ttls: dict = None, stale: float = DEFAULT_STALE,
+                 max_size: int = DEFAULT_MAX_SIZE):
+        self.path = path
+        self.ttls = ttls or {}
+        self.stale = stale
+        self.max_size = max_size
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "evicted": 0}
+        self._size = None
+        self._refreshing = {}
+
+    async def fetch(self, endpoint: str, parts: tuple, fetch) -> bytes:
+        """
+        Function to return the response body for an endpoint call. parts
+        identify the call (URL, MAC, window), fetch is a coroutine function
+        downloading the body, used when the entry is missing, or in the
+        background when it is past its TTL but still within the stale window
+        """
+
+        name = cache_key(endpoint, *parts)
+        entry = self._read(name)
+
+        if entry is not None:
+            stored, body = entry
+            age = time.time() - stored
+            ttl = self.ttls.get(endpoint, DEFAULT_TTL)
+
+            if age <= ttl + self.stale:
+                if age <= ttl:
+                    self.stats["hits"] += 1
+
+                else:
+                    self.stats["stale"] += 1
+
+                    # A failed background refresh leaves the stale entry in place
+                    self._start_refresh(name, fetch).add_done_callback(
+                        lambda task: task.cancelled() or task.exception()
+                    )
+
+                self._touch(name)
+
+                return body
+
+        self.stats["misses"] += 1
+
+        return await self._start_refresh(name, fetch)
+
+    async def wait(self) -> None:
+        """Function to let background refreshes finish before the run exits"""
+
+        if self._refreshing:
+            await asyncio.gather(*self._refreshing.values(), return_exceptions=True)
+
+    def report(self) -> str:
+        """Function to summarise how the cache was used"""
+
+        counts = self.stats
+
+        return (f"{counts['hits']} hits, {counts['stale']} stale, {counts['misses']} misses, "
+                f"{counts['evicted']} evicted")
+
+    def _start_refresh(self, name: str, fetch) -> asyncio.Task:
+        # One download per entry however many callers want it
+        refreshing = self._refreshing.get(name)
+
+        if refreshing is None or refreshing.done():
+            refreshing = asyncio.create_task(self._refresh(name, fetch))
+            self._refreshing[name] = refreshing
+
+        return refreshing
+
+    async def _refresh(self, name: str, fetch) -> bytes:
+        try:
+            body = await fetch()
+
+        finally:
+            del self._refreshing[name]
+
+        self._write(name, body)
+
+        return body
+
+    def _read(self, name: str):
+        try:
+            with open(os.path.join(self.path, name), "rb") as entry_file:
+                raw = entry_file.read()
+
+        except FileNotFoundError:
+            return None
+
+        if len(raw) < ENTRY_HEADER.size:
+            return None
+
+        magic, version, stored = ENTRY_HEADER.unpack_from(raw)
+
+        if magic != ENTRY_MAGIC or version != ENTRY_VERSION:
+            return None
+
+        try:
+            return stored, zlib.decompress(raw[ENTRY_HEADER.size:])
+
+        except zlib.error:
+            return None
+
+    def _touch(self, name: str) -> None:
+        # The modification time doubles as the last use for eviction
+        try:
+            os.utime(os.path.join(self.path, name))
+
+        except FileNotFoundError:
+            pass
+
+    def _write(self, name: str, body: bytes) -> None:
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+
+        raw = ENTRY_HEADER.pack(ENTRY_MAGIC, ENTRY_VERSION, time.time()) + zlib.compress(body, 1)
+
+        write_atomic(os.path.join(self.path, name), raw)
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+
+        else:
+            self._size += len(raw)
+
+        if self._size > self.max_size:
+            self._evict()
+
+    def _entries(self) -> list:
+        entries = []
+
+        with os.scandir(self.path) as found:
+            for entry in found:
+                if entry.name.endswith(".tmp"):
+                    continue
+
+                try:
+                    info = entry.stat()
+
+                except FileNotFoundError:
+                    continue
+
+                entries.append((info.st_mtime, info.st_size, entry.path))
+
+        return entries
+
+    def _evict(self) -> None:
+        # Sizes are recounted from disk, other runs write to the same directory
+        entries = sorted(self._entries())
+
+        self._size = sum(size for _, size, _ in entries)
+
+        for _, size, entry_path in entries:
+            if self._size <= self.max_size:
+                break
+
+            try:
+                os.remove(entry_path)
+
+            except FileNotFoundError:
+                pass
+
+            self._size -= size
+            self.stats["evicted"] += 1
@@ -0,0 +1,67 @@
+'''
+Dependency driven scheduler for the lookups of a user
+Every lookup is a node keyed by (stage, subject), e.g. ("ise", <mac>).
+A node starts as soon as the node it depends on has produced its
+result, so each MAC's ISE auth history, DNAC health and DNAC issues
+start the moment their MAC is known instead of waiting for every MAC in
+the previous phase. The whole lookup then takes as long as its slowest
+chain of dependent calls rather than the sum of the slowest call in
+each phase. Every node is timed into the stage_seconds histogram for
+its stage
+'''
+
+import asyncio
+from metrics import METRICS
+
+
+class TaskGraph:
+    """
+    Class to run lookup nodes and collect their results. on_result, if
+    given, is called with (key, result) the moment each node finishes,
+    and the results are then handed over rather than collected.
+    """
+
+    def __init__(self, on_result=None):
+        self.on_result = on_result
+        self.results = {}
+        self._running = set()
+
+    def start(self, key: tuple, coro, then=None) -> None:
+        """
+        Function to start a node. then, if given, is called with the
+        node's result and can start the nodes that depend on it
+        """
+
+        self._running.add(asyncio.create_task(self._run(key, coro, then)))
+
+    async def wait(self) -> dict:
+        """Function to wait for every node, including ones started along the way"""
+
+        while self._running:
+            done, _ = await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+
+            self._running -= done
+
+            for task in done:
+                # Surface the first failure rather than losing it
+                if task.exception() is not None:
+                    for pending in self._running:
+                        pending.cancel()
+
+                    raise task.exception()
+
+        return self.results
+
+    async def _run(self, key: tuple, coro, then) -> None:
+        with METRICS.span("stage_seconds", stage=key[0]):
+            result = await coro
+
+        # Dependent nodes get the result through then, nothing else needs it kept
+        if self.on_result is None:
+            self.results[key] = result
+
+        else:
+            self.on_result(key, result)
+
+        if then is not None:
+            then(result)
@@ -0,0 +1,161 @@
+'''
+Long-running HTTP service for the main.py lookup
+Instead of a cold process per query the service keeps the ISE and DNAC
+controllers, one pooled HTTP client, the DNAC token, the failure catalog,
+the ActiveList snapshot and the response cache warm between requests.
+Endpoints:
+GET /users/<sso>  -> api_out JSON for the user, as built by main.py
+GET /health       -> liveness check
+GET /metrics      -> API call, parse and stage timings in the Prometheus text format
+Run with: python3 service.py [--host 0.0.0.0] [--port 8080]
+'''
+
+import sys
+import asyncio
+import sqlite3
+import argparse
+from aiohttp import web
+from main import (IseApiController, DnaApiController, IseRequestError, ActiveListCache, gather_user, build_api_out,
+                  configured_ise_user, configured_ise_pwd, configured_dna_user, configured_dna_pwd,
+                  ACTIVE_LIST_CACHE, ACTIVE_LIST_TTL, BATCH_CONCURRENCY, BACKEND_POLICIES, DB_PATH,
+                  FAILURE_SNAPSHOT, RESPONSE_CACHE, RESPONSE_TTLS, AUTH_STORE)
+from transport import REQUEST_ERRORS, Transport
+from failure_catalog import FailureCatalog
+from response_cache import ResponseCache
+from metrics import METRICS
+from parse_pool import ParsePool
+from auth_store import AuthStore
+
+
+class LookupService:
+    """Class holding everything that stays warm between requests"""
+
+    def __init__(self, concurrency: int):
+        self.transport = Transport(BACKEND_POLICIES)
+        self.failure_catalog = FailureCatalog(DB_PATH, FAILURE_SNAPSHOT)
+        self.response_cache = ResponseCache(RESPONSE_CACHE, RESPONSE_TTLS)
+        self.parse_pool = ParsePool()
+        self.auth_store = AuthStore(AUTH_STORE)
+        self.ise_api = IseApiController(configured_ise_user, configured_ise_pwd, self.transport,
+                                        self.failure_catalog, self.response_cache, parse_pool=self.parse_pool,
+                                        store=self.auth_store)
+        self.dna_api_ob = DnaApiController(configured_dna_user, configured_dna_pwd, self.transport, self.response_cache,
+                                           self.auth_store)
+        self.limiter = asyncio.Semaphore(max(1, concurrency))
+
+        if ACTIVE_LIST_TTL > 0:
+            self.active_cache = ActiveListCache(ACTIVE_LIST_CACHE, ACTIVE_LIST_TTL, self.ise_api.get_active_sessions)
+
+        else:
+            self.active_cache = None
+
+    async def start(self, app: web.Application) -> None:
+        """Function to warm the shared data before the first request"""
+
+        self.failure_catalog.load()
+
+        if self.active_cache is not None:
+            warmed = await asyncio.gather(self.dna_api_ob.tokens.get(), self.active_cache.get(),
+                                          return_exceptions=True)
+
+        else:
+            warmed = await asyncio.gather(self.dna_api_ob.tokens.get(), return_exceptions=True)
+
+        # Requests retry whatever couldn't be warmed, DNAC or ISE being down
+        # doesn't keep the service from starting
+        for err in warmed:
+            if isinstance(err, (*REQUEST_ERRORS, IseRequestError)):
+                print(f"Could not warm up: {err}", file=sys.stderr)
+
+            elif isinstance(err, BaseException):
+                raise err
+
+    async def stop(self, app: web.Application) -> None:
+        """Function to close the connection pool on shutdown"""
+
+        if self.active_cache is not None:
+            await self.active_cache.wait()
+
+        await self.response_cache.wait()
+        await self.dna_api_ob.tokens.wait()
+
+        await self.transport.close()
+
+        self.failure_catalog.close()
+        self.parse_pool.close()
+        self.auth_store.close()
+
+    async def handle_user(self, request: web.Request) -> web.Response:
+        """GET /users/<sso>"""
+
+        user_sso = request.match_info["sso"]
+
+        async with self.limiter:
+            try:
+                if self.active_cache is not None:
+                    active_list = await self.active_cache.get()
+
+                else:
+                    active_list = None
+
+                with METRICS.span("stage_seconds", stage="user"):
+                    gathered = await gather_user(user_sso, self.ise_api, self.dna_api_ob, active_list)
+
+            except (*REQUEST_ERRORS, IseRequestError) as err:
+                return web.json_response({"error": f"lookup failed: {err}"}, status=502)
+
+        # Queued records are written, and those past the retention period dropped about once a day
+        try:
+            await self.auth_store.write(force=True)
+            await self.auth_store.run(self.auth_store.compact)
+
+        except sqlite3.Error as err:
+            print(f"Could not write to {AUTH_STORE}: {err}", file=sys.stderr)
+
+        return web.json_response(build_api_out(*gathered))
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """GET /health"""
+
+        return web.json_response({"status": "ok", "connections": self.transport.stats,
+                                  "response_cache": self.response_cache.stats, "parse_pool": self.parse_pool.stats})
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """GET /metrics"""
+
+        return web.Response(body=METRICS.render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def create_app(concurrency: int = BATCH_CONCURRENCY) -> web.Application:
+    """Function to build the aiohttp application"""
+
+    service = LookupService(concurrency)
+
+    app = web.Application()
+    app.on_startup.append(service.start)
+    app.on_cleanup.append(service.stop)
+    app.add_routes([
+        web.get("/users/{sso}", service.handle_user),
+        web.get("/health", service.handle_health),
+        web.get("/metrics", service.handle_metrics)
+    ])
+
+    return app
+
+
+def main():
+    """main func"""
+
+    parser = argparse.ArgumentParser(description="HTTP service for ISE and DNAC user lookups")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help=f"lookups served at the same time (default {BATCH_CONCURRENCY})")
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.concurrency), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+'''
+Aggregation for sweep mode
+Instead of starting from one SSO, sweep mode looks every MAC in the
+ActiveList up on ISE and folds each MAC's AuthStatus records into running
+counts as they arrive: failures per failure id, per identity group, per
+authorisation policy, per user and per MAC, and records and failures per
+hour. Only the counts are kept, never the records, so memory grows with
+the number of distinct ids, groups, users and hours rather than with the
+number of records swept
+'''
+
+from collections import Counter
+import macaddress
+from auth_history import timestamp_seconds
+from active_cache import normalise_mac
+from failure_catalog import failure_id
+from ise_parser import matched_policies
+
+
+def sweep_targets(snapshot) -> list:
+    """Function to list (MAC, user) for every valid MAC in an ActiveListSnapshot, once each"""
+
+    targets = {}
+
+    for user_name, station_ids in snapshot.users.items():
+        for station_id in station_ids:
+            try:
+                macaddress.MAC(station_id)
+
+            except ValueError:
+                continue
+
+            targets.setdefault(normalise_mac(station_id), (station_id, user_name))
+
+    return list(targets.values())
+
+
+class SweepReport:
+    """Class holding the running counts of a sweep"""
+
+    def __init__(self):
+        self.macs = 0
+        self.macs_failing = 0
+        self.macs_unreachable = 0
+        self.records = 0
+        self.failed = 0
+        self.failure_ids = Counter()
+        self.failure_reasons = {}
+        self.identity_groups = Counter()
+        self.policies = Counter()
+        self.users = Counter()
+        self.mac_failures = Counter()
+        self.hours = {}
+
+    def add(self, mac: str, user_name: str, elements: list) -> None:
+        """Function to fold the AuthStatusElements of one MAC into the counts"""
+
+        self.macs += 1
+
+        failed = 0
+
+        for element in elements:
+            self.records += 1
+
+            seconds = timestamp_seconds(element.acs_timestamp)
+            hour = None if seconds is None else int(seconds // 3600 * 3600)
+
+            counts = self.hours.setdefault(hour, [0, 0])
+            counts[0] += 1
+
+            if not element.failed:
+                continue
+
+            failed += 1
+            counts[1] += 1
+
+            found_id = failure_id(element.failure_reason) if element.failure_reason else None
+
+            self.failure_ids[found_id] += 1
+
+            if found_id not in self.failure_reasons:
+                self.failure_reasons[found_id] = element.failure_reason
+
+            self.identity_groups[element.identity_group] += 1
+            self.policies[matched_policies(element.other_attr_string)[0]] += 1
+            self.users[element.user_name or user_name] += 1
+
+        if failed:
+            self.failed += failed
+            self.macs_failing += 1
+            self.mac_failures[mac] = failed
+
+    def add_error(self, mac: str) -> None:
+        """Function to count a MAC ISE couldn't be asked about"""
+
+        self.macs_unreachable += 1
+
+    def summary(self, top: int) -> dict:
+        """Function to return the top top entries of every count as a JSON shaped dict"""
+
+        def ranked(counter: Counter) -> list:
+            return [{"name": name, "failures": count} for name, count in counter.most_common(top)]
+
+        return {
+            "macs": self.macs,
+            "macs_failing": self.macs_failing,
+            "macs_unreachable": self.macs_unreachable,
+            "records": self.records,
+            "failures": self.failed,
+            "failure_ids": [
+                {"id": found_id, "reason": self.failure_reasons[found_id], "failures": count}
+                for found_id, count in self.failure_ids.most_common(top)
+            ],
+            "identity_groups": ranked(self.identity_groups),
+            "authorisation_policies": ranked(self.policies),
+            "users": ranked(self.users),
+            "macs_most_failing": ranked(self.mac_failures),
+            "hours": [
+                {"hour": hour, "records": records, "failures": failed,
+                 "failure_rate": failed / records if records else 0.0}
+                for hour, (records, failed) in sorted(self.hours.items(), key=lambda item: (item[0] is None, item[0] or 0))
+            ]
+        }
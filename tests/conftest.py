@@ -0,0 +1,35 @@
+'''
+Shared fixtures for the tests
+main.py reads env_config.txt and mykey.key from the working directory when
+it is imported, so it is imported once from a scratch directory holding a
+throwaway configuration
+'''
+
+import os
+import sys
+import importlib
+import pytest
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def main_module(tmp_path_factory):
+    """Function to import main.py against a throwaway configuration"""
+
+    config_dir = tmp_path_factory.mktemp("config")
+    key = Fernet.generate_key()
+    config = ["http://127.0.0.1:1", "ise_user", "ise_pwd", "http://127.0.0.1:1", "dna_user", "dna_pwd"]
+
+    (config_dir / "mykey.key").write_bytes(key)
+    (config_dir / "env_config.txt").write_bytes(Fernet(key).encrypt(repr(config).encode()))
+
+    cwd = os.getcwd()
+    os.chdir(config_dir)
+
+    try:
+        return importlib.import_module("main")
+
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,40 @@
+'''
+Percentiles reported by analytics, with and without NumPy
+'''
+
+import pytest
+import analytics
+
+
+@pytest.fixture(params=["array", "numpy"])
+def engine(request, monkeypatch):
+    """Function to run a test once per engine, NumPy only where it is installed"""
+
+    if request.param == "numpy":
+        monkeypatch.setattr(analytics, "numpy", pytest.importorskip("numpy"))
+
+    else:
+        monkeypatch.setattr(analytics, "numpy", None)
+
+    return request.param
+
+
+@pytest.mark.parametrize("values, expected", [
+    ([7], [7, 7, 7]),
+    ([1, 2], [1, 2, 2]),
+    ([1, 2, 3, 4], [2, 4, 4]),
+    (list(range(1, 101)), [50, 90, 99]),
+    (list(range(100, 0, -1)), [50, 90, 99])
+])
+def test_nearest_rank_percentiles(engine, values, expected):
+    assert analytics.percentiles(values, (0.5, 0.9, 0.99)) == expected
+
+
+def test_percentiles_of_nothing(engine):
+    assert analytics.percentiles([], (0.5, 0.9)) == [0, 0]
+
+
+def test_nearest_rank_ignores_float_noise():
+    # 0.07 * 100 is 7.000000000000001, the 7th value is still the answer
+    assert analytics.nearest_rank(0.07, 100) == 6
+    assert analytics.nearest_rank(0.5, 1) == 0
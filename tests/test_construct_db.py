@@ -0,0 +1,39 @@
+'''
+failure_db builds over a table from an older build without a primary key
+'''
+
+import sqlite3
+import pytest
+import construct_db
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """Function to return a connection to a failure_db whose table has no primary key"""
+
+    conn = sqlite3.connect(tmp_path / "failure_db", isolation_level=None)
+    conn.execute("CREATE TABLE failures(id integer, code text, cause text, resolution text)")
+    conn.execute("INSERT INTO failures VALUES (1, 'a', 'b', 'c'), (1, 'a', 'b', 'c')")
+
+    yield conn
+
+    conn.close()
+
+
+def test_failed_download_keeps_the_old_table(legacy_db):
+    def cut_short():
+        yield (5, "x", "y", "z")
+        raise ConnectionError("download cut short")
+
+    with pytest.raises(ConnectionError):
+        construct_db.db_populate(legacy_db, cut_short(), construct_db.db_setup(legacy_db))
+
+    assert legacy_db.execute("SELECT * FROM failures").fetchall() == [(1, "a", "b", "c"), (1, "a", "b", "c")]
+
+
+def test_rebuild_replaces_the_old_table(legacy_db):
+    rows = [(1, "A", "B", "C"), (2, "q", "w", "e")]
+
+    assert construct_db.db_populate(legacy_db, iter(rows), construct_db.db_setup(legacy_db)) == 2
+    assert construct_db.db_setup(legacy_db) is False
+    assert legacy_db.execute("SELECT * FROM failures ORDER BY id").fetchall() == rows
@@ -0,0 +1,74 @@
+'''
+DnaApiController.intent_get against a local stand-in for DNAC
+'''
+
+import time
+import asyncio
+from aiohttp import web
+from transport import BackendPolicy, Transport
+
+CONNECTIONS = 2
+CALLS = 5 * CONNECTIONS
+
+
+async def serve_dnac(calls: dict) -> web.AppRunner:
+    """Function to start a DNAC stand-in accepting only the token "fresh" on its intent API"""
+
+    async def token(request):
+        calls["token"] += 1
+
+        return web.json_response({"Token": "fresh"})
+
+    async def intent(request):
+        # Held a moment so every call is in flight when the 401s come back
+        await asyncio.sleep(0.05)
+
+        if request.headers.get("X-Auth-Token") != "fresh":
+            calls["rejected"] += 1
+            return web.Response(status=401)
+
+        return web.json_response({"response": []})
+
+    app = web.Application()
+    app.router.add_post("/dna/system/api/v1/auth/token", token)
+    app.router.add_get("/dna/intent/api/v1/client-detail", intent)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+
+    return runner
+
+
+def test_revoked_token_refreshed_with_more_401s_than_connections(main_module, monkeypatch):
+    calls = {"token": 0, "rejected": 0}
+
+    async def run() -> list:
+        runner = await serve_dnac(calls)
+        host, port = runner.addresses[0][:2]
+        base = f"http://{host}:{port}"
+
+        monkeypatch.setattr(main_module, "DNAC_BASE", base)
+
+        async with Transport({f"{host}:{port}": BackendPolicy(connections=CONNECTIONS, retries=0)}) as transport:
+            dna_api = main_module.DnaApiController("dna_user", "dna_pwd", transport)
+            dna_api.tokens.cache_path = None
+
+            # A cached token DNAC has since revoked
+            dna_api.tokens.token = "revoked"
+            dna_api.tokens.expires = time.time() + 3600
+
+            lookups = [dna_api.intent_get(f"{base}/dna/intent/api/v1/client-detail", {}, {"macAddress": str(n)})
+                       for n in range(CALLS)]
+
+            try:
+                return await asyncio.wait_for(asyncio.gather(*lookups), 10)
+
+            finally:
+                await runner.cleanup()
+
+    results = asyncio.run(run())
+
+    assert results == [{"response": []}] * CALLS
+    assert calls["rejected"] == CALLS
+    assert calls["token"] == 1
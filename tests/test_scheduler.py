@@ -0,0 +1,43 @@
+'''
+TaskGraph results, collected or streamed
+'''
+
+import asyncio
+from scheduler import TaskGraph
+
+
+async def value(result):
+    return result
+
+
+def run_graph(on_result=None) -> TaskGraph:
+    """Function to run a node that starts two dependent nodes, returning the finished graph"""
+
+    async def run() -> TaskGraph:
+        graph = TaskGraph(on_result)
+
+        def start_children(macs: list) -> None:
+            for mac in macs:
+                graph.start(("ise", mac), value(f"sessions of {mac}"))
+
+        graph.start(("ise_macs", "user"), value(["m1", "m2"]), then=start_children)
+
+        await graph.wait()
+
+        return graph
+
+    return asyncio.run(run())
+
+
+def test_results_collected_without_on_result():
+    assert run_graph().results == {("ise_macs", "user"): ["m1", "m2"],
+                                   ("ise", "m1"): "sessions of m1", ("ise", "m2"): "sessions of m2"}
+
+
+def test_streamed_results_are_not_kept():
+    streamed = {}
+    graph = run_graph(lambda key, result: streamed.__setitem__(key, result))
+
+    assert graph.results == {}
+    assert streamed == {("ise_macs", "user"): ["m1", "m2"],
+                        ("ise", "m1"): "sessions of m1", ("ise", "m2"): "sessions of m2"}
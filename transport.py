@@ -0,0 +1,296 @@
+'''
+Shared HTTP transport for every ISE and DNAC call in a run
+Each host gets its own pooled aiohttp session with keep-alive, so TLS
+connections are reused instead of handshaking per request, and gzip is
+negotiated on every call. Every host (backend) also has a policy: a cap
+on requests in flight, an optional token bucket rate limit, retries with
+jittered exponential backoff for 5xx responses and timeouts (including
+a body cut off or stalled part way through), and a pause for the backend
+when it answers 429 with Retry-After. Requests, connections opened and
+reused, retries and throttled waits are counted per backend
+'''
+
+import time
+import random
+import asyncio
+import contextlib
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import aiohttp
+
+# Seconds an idle connection is kept open for reuse
+KEEPALIVE_TIMEOUT = 120
+
+# A request giving up on connecting or waiting this long for data is retried
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=None, connect=15, sock_read=120)
+
+# Backoff before retry n is a random wait of up to BACKOFF_BASE * 2**n seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+
+# Longest pause honoured from a Retry-After header
+RETRY_AFTER_MAX = 120
+
+# What a failed request can raise once the transport has given up on it
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+@dataclass
+class BackendPolicy:
+    """
+    How a backend is called. connections caps the requests in flight (and
+    connections open), rate and burst set a token bucket in requests per
+    second (None for no rate limit), retries is how many times a 5xx,
+    429 or timeout is retried.
+    """
+
+    connections: int = 10
+    rate: float = None
+    burst: int = 10
+    retries: int = 3
+
+
+class TokenBucket:
+    """Token bucket allowing rate requests per second with bursts of up to burst"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> bool:
+        """Function to take a token, waiting for one if needed. Returns whether it waited"""
+
+        waited = False
+
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+
+            waited = True
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Backend:
+    """Runtime state for one host: its pool, limiter, rate limit and counters"""
+
+    def __init__(self, policy: BackendPolicy, session: aiohttp.ClientSession, stats: dict):
+        self.policy = policy
+        self.session = session
+        self.stats = stats
+        self.slots = asyncio.Semaphore(max(1, policy.connections))
+        self.bucket = TokenBucket(policy.rate, policy.burst) if policy.rate else None
+        self.resume_at = 0
+
+    async def wait_turn(self) -> None:
+        """Function to wait out a 429 pause and the rate limit before sending"""
+
+        pause = self.resume_at - time.monotonic()
+
+        if pause > 0:
+            self.stats["throttled"] += 1
+            await asyncio.sleep(pause)
+
+        if self.bucket is not None and await self.bucket.acquire():
+            self.stats["throttled"] += 1
+
+
+def retry_after(response: aiohttp.ClientResponse):
+    """Function to read a Retry-After header in seconds, None if absent or unreadable"""
+
+    value = response.headers.get("Retry-After")
+
+    if value is None:
+        return None
+
+    try:
+        seconds = float(value)
+
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+
+        except (TypeError, ValueError):
+            return None
+
+    return min(max(0, seconds), RETRY_AFTER_MAX)
+
+
+def backoff(attempt: int) -> float:
+    """Function to return a jittered exponential backoff for a retry attempt"""
+
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class Transport:
+    """
+    Class to send requests through the pool and policy for their host.
+    policies maps a host (as in the netloc of a URL) to its BackendPolicy,
+    hosts not listed get default_policy. Use as an async context manager,
+    or call close() when finished.
+    """
+
+    def __init__(self, policies: dict = None, default_policy: BackendPolicy = None,
+                 keepalive_timeout: float = KEEPALIVE_TIMEOUT):
+        self.policies = policies or {}
+        self.default_policy = default_policy or BackendPolicy()
+        self.keepalive_timeout = keepalive_timeout
+        self.stats = {}
+        self._backends = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def get(self, url: str, **kwargs):
+        """Function to start a GET, used as: async with transport.get(...) as response"""
+
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        """Function to start a POST, used as: async with transport.post(...) as response"""
+
+        return self.request("POST", url, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def request(self, method: str, url: str, read_body: bool = True, **kwargs):
+        """
+        Function to send a request through the pool and policy for the URL's
+        host. The response handed back is the final attempt, 5xx and 429
+        responses are only returned once the retries are used up. The body
+        is read before the response is handed back, so response.read()
+        returns it straight away and a failed read is retried as well.
+        Callers streaming the body pass read_body=False and get no retries
+        once the headers have arrived
+        """
+
+        backend = self._backend(urlsplit(url).netloc)
+
+        # The slot is held until the body has been read
+        async with backend.slots:
+            response = await self._send(backend, method, url, read_body, kwargs)
+
+            try:
+                yield response
+
+            finally:
+                response.release()
+
+    def report(self) -> str:
+        """Function to summarise the calls made to each backend"""
+
+        lines = []
+
+        for host, counts in self.stats.items():
+            lines.append(f"{host}: {counts['requests']} requests, "
+                         f"{counts['opened']} connections opened, {counts['reused']} reused, "
+                         f"{counts['retries']} retries, {counts['throttled']} throttled waits")
+
+        return "\n".join(lines)
+
+    async def close(self) -> None:
+        """Function to close every pooled session"""
+
+        for backend in self._backends.values():
+            await backend.session.close()
+
+        self._backends = {}
+
+    async def _send(self, backend: Backend, method: str, url: str, read_body: bool,
+                    kwargs: dict) -> aiohttp.ClientResponse:
+        attempt = 0
+
+        while True:
+            await backend.wait_turn()
+
+            backend.stats["requests"] += 1
+
+            response = None
+
+            try:
+                response = await backend.session.request(method, url, **kwargs)
+
+                # aiohttp keeps the body, the caller's read() gets it from memory
+                if read_body:
+                    await response.read()
+
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+                if response is not None:
+                    response.release()
+
+                if attempt >= backend.policy.retries:
+                    raise
+
+                delay = backoff(attempt)
+
+            else:
+                if attempt >= backend.policy.retries:
+                    return response
+
+                if response.status == 429:
+                    delay = retry_after(response)
+
+                    if delay is None:
+                        delay = backoff(attempt)
+
+                    # Every request to the backend waits, not just this one
+                    backend.resume_at = max(backend.resume_at, time.monotonic() + delay)
+
+                elif response.status >= 500:
+                    delay = backoff(attempt)
+
+                else:
+                    return response
+
+                response.release()
+
+            backend.stats["retries"] += 1
+            attempt += 1
+
+            await asyncio.sleep(delay)
+
+    def _backend(self, host: str) -> Backend:
+        if host in self._backends:
+            return self._backends[host]
+
+        policy = self.policies.get(host, self.default_policy)
+
+        counts = self.stats.setdefault(host, {"requests": 0, "opened": 0, "reused": 0,
+                                              "retries": 0, "throttled": 0})
+
+        async def on_create(session, context, params):
+            counts["opened"] += 1
+
+        async def on_reuse(session, context, params):
+            counts["reused"] += 1
+
+        tracing = aiohttp.TraceConfig()
+        tracing.on_connection_create_end.append(on_create)
+        tracing.on_connection_reuseconn.append(on_reuse)
+
+        # Certificate checks stay off, as they were for every call before
+        connector = aiohttp.TCPConnector(
+            limit=max(1, policy.connections),
+            keepalive_timeout=self.keepalive_timeout,
+            ssl=False
+        )
+
+        session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"Accept-Encoding": "gzip, deflate"},
+            timeout=REQUEST_TIMEOUT,
+            trace_configs=[tracing]
+        )
+
+        self._backends[host] = Backend(policy, session, counts)
+
+        return self._backends[host]
@@ -0,0 +1,147 @@
+'''
+Change detection for watch mode
+Each poll of a user is reduced to a hash of the whole result, the auth
+records (AuthEvents hash by value) of every MAC, plus the latest posture
+and compliance and the DNAC health scores of every MAC. A poll whose
+overall hash matches the last one is skipped outright, otherwise only
+the parts whose hashes moved are reported: new sessions, new failures,
+posture or compliance changes and DNAC health score changes. A MAC whose
+lookup failed keeps what was last seen for it
+'''
+
+import json
+from records import LOOKUP_FAILED, to_api
+
+
+def result_hash(value) -> int:
+    """Function to hash a result so equal results hash the same"""
+
+    return hash(json.dumps(to_api(value), sort_keys=True, default=str))
+
+
+def health_scores(health) -> dict:
+    """Function to pull {healthType: score} out of a ClientDetail, {} if there is none"""
+
+    if health is None:
+        return {}
+
+    return health.health_scores()
+
+
+class MacState:
+    """What was last seen for one MAC"""
+
+    def __init__(self):
+        self.records = set()
+        self.posture = None
+        self.health = {}
+
+
+class UserWatch:
+    """Class to remember the last poll of a user and describe what changed since"""
+
+    def __init__(self, user_sso: str):
+        self.user_sso = user_sso
+        self.last_hash = None
+        self.macs = {}
+        self.missed = set()
+
+    def update(self, data_gathered: dict, dna_health: dict) -> list:
+        """
+        Function to take a new poll of the user and return a line for each
+        change since the last one. The first poll only sets the baseline
+        """
+
+        current_hash = result_hash([data_gathered, dna_health])
+
+        if current_hash == self.last_hash:
+            return []
+
+        baseline = self.last_hash is None
+        self.last_hash = current_hash
+
+        changes = []
+
+        for mac, sessions in data_gathered.items():
+            if sessions.failed:
+                self._missed("ise", mac, baseline)
+                continue
+
+            mac_baseline = self._caught_up("ise", mac, baseline)
+            state = self.macs.get(mac)
+
+            if state is None:
+                state = self.macs[mac] = MacState()
+
+                if not mac_baseline:
+                    changes.append(f"{mac}: new MAC on ISE")
+
+            changes += self._sessions(mac, state, sessions, mac_baseline)
+
+        for mac, health in (dna_health or {}).items():
+            if health is LOOKUP_FAILED:
+                self._missed("dnac", mac, baseline)
+                continue
+
+            health_baseline = self._caught_up("dnac", mac, baseline)
+            state = self.macs.setdefault(mac, MacState())
+            scores = health_scores(health)
+
+            if scores != state.health and not health_baseline:
+                for health_type, score in scores.items():
+                    before = state.health.get(health_type)
+
+                    if score != before:
+                        changes.append(f"{mac}: DNAC {health_type} health {before} -> {score}")
+
+            state.health = scores
+
+        return changes
+
+    # A lookup that failed keeps what was last seen for the MAC. One that
+    # failed on the first poll leaves the MAC without a baseline, which the
+    # next lookup that gets through sets instead of reporting it as changes
+    def _missed(self, side: str, mac: str, baseline: bool) -> None:
+        if baseline:
+            self.missed.add((side, mac))
+
+    def _caught_up(self, side: str, mac: str, baseline: bool) -> bool:
+        if (side, mac) in self.missed:
+            self.missed.discard((side, mac))
+            return True
+
+        return baseline
+
+    def _sessions(self, mac: str, state: MacState, sessions, baseline: bool) -> list:
+        changes = []
+        latest = None
+        seen = set()
+
+        for event in sessions:
+            if latest is None or (event.timestamp or "") > (latest.timestamp or ""):
+                latest = event
+
+            seen.add(event)
+
+            if baseline or event in state.records:
+                continue
+
+            changes.append(f"{mac}: new session at {event.display_timestamp()} "
+                           f"({event.authentication_method or 'null'}, {event.authorisation_policy or 'null'})")
+
+            for failure in event.failures:
+                changes.append(f"{mac}: new failure {failure[0]} - {failure[1]}")
+
+        # Records that left the window are forgotten with it
+        state.records = seen
+
+        if latest is not None:
+            posture = (latest.posture_status or "null", latest.nac_compliance or "null")
+
+            if state.posture is not None and posture != state.posture:
+                changes.append(f"{mac}: posture {state.posture[0]} -> {posture[0]}, "
+                               f"NAC compliance {state.posture[1]} -> {posture[1]}")
+
+            state.posture = posture
+
+        return changes